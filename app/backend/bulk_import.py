@@ -0,0 +1,214 @@
+import csv
+import json
+from itertools import islice
+
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from slugify import slugify
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .config import SHARDS
+from .db import SessionLocal
+from .shards import on_shard, by_shard
+from .upserts import rating_upsert_statement, feedback_upsert_statement
+from ..models.game import Game
+from ..models.user import User
+from ..schemas import CreateGame, CreateRating, CreateFeedback
+
+CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000
+FORMATS = ('ndjson', 'csv')
+
+
+def _text_lines(stream, position, errors):
+    '''
+    :param stream: текстовый или бинарный поток (итерируемый по строкам)
+    :param position: list[int] - сюда пишется номер последней прочитанной строки
+    :param errors: dict[int, UnicodeDecodeError] - строки, которые не декодируются как UTF-8
+    :return: генератор строк str
+    Бинарные строки декодируются по одной: ошибочные байты портят только свою строку,
+    вместо неё разборщику отдаётся пустая строка.
+    '''
+    for line_no, line in enumerate(stream, 1):
+        position[0] = line_no
+        if isinstance(line, bytes):
+            try:
+                line = line.decode('utf-8-sig' if line_no == 1 else 'utf-8')
+            except UnicodeDecodeError as error:
+                errors[line_no] = error
+                line = '\n'
+        yield line
+
+
+def read_rows(stream, fmt):
+    '''
+    :param stream: текстовый или бинарный (UTF-8) поток, итерируемый по строкам
+    :param fmt: 'ndjson' | 'csv'
+    :return: генератор (номер строки, dict или исключение разбора)
+    Ошибки декодирования и разбора CSV относятся к своей строке и не прерывают чтение.
+    '''
+    position, errors = [0], {}
+    lines = _text_lines(stream, position, errors)
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                row = None
+            except csv.Error as error:
+                row = error
+            yield from sorted(errors.items())
+            errors.clear()
+            if row is None:
+                return
+            # строка с ошибкой CSV - последняя прочитанная, reader.line_num для неё не обновляется
+            yield (position[0] if isinstance(row, csv.Error) else reader.line_num), row
+    for line_no, line in enumerate(lines, 1):
+        if line_no in errors:
+            yield line_no, errors.pop(line_no)
+            continue
+        if not line.strip():
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError as error:
+            yield line_no, error
+
+
+def _existing_ids(connection, column, ids):
+    return set(connection.scalars(select(column).where(column.in_(ids)))) if ids else set()
+
+
+def _check_new_games(connection, rows, fail):
+    # игры с уже существующим (или повторяющимся в файле) slug не загружаются
+    existing = _existing_ids(connection, Game.slug, {values['slug'] for _, values in rows})
+    checked = []
+    for line, values in rows:
+        if values['slug'] in existing:
+            fail(line, f"game '{values['title']}' already exists")
+            continue
+        existing.add(values['slug'])
+        checked.append((line, values))
+    return checked
+
+
+def _check_user_and_game(connection, rows, fail):
+    users = _existing_ids(connection, User.id, {values['user_id'] for _, values in rows})
+    games = _existing_ids(connection, Game.id, {values['game_id'] for _, values in rows})
+    checked = []
+    for line, values in rows:
+        if values['user_id'] not in users:
+            fail(line, f"user {values['user_id']} not found")
+        elif values['game_id'] not in games:
+            fail(line, f"game {values['game_id']} not found")
+        else:
+            checked.append((line, values))
+    return checked
+
+
+def _written_games(result, rows, fail):
+    # игру, добавленную другим запросом между проверкой и вставкой, ON CONFLICT DO NOTHING пропускает
+    inserted = set(result.scalars())
+    for line, values in rows:
+        if values['slug'] not in inserted:
+            fail(line, f"game '{values['title']}' already exists")
+    return len(inserted)
+
+
+def _written_rows(result, rows, fail):
+    return result.rowcount
+
+
+IMPORTERS = {
+    'games': {
+        'schema': CreateGame,
+        'statement': lambda: sqlite_insert(Game).on_conflict_do_nothing().returning(Game.slug),
+        'values': lambda game: {**game.model_dump(), 'slug': slugify(game.title)},
+        'check': _check_new_games,
+        'written': _written_games,
+        'sharded': False,
+    },
+    'ratings': {
+        'schema': CreateRating,
+        'statement': rating_upsert_statement,
+        'values': lambda rating: rating.model_dump(),
+        'check': _check_user_and_game,
+        'written': _written_rows,
+        'sharded': True,
+    },
+    'feedback': {
+        'schema': CreateFeedback,
+        'statement': feedback_upsert_statement,
+        'values': lambda feedback: feedback.model_dump(),
+        'check': _check_user_and_game,
+        'written': _written_rows,
+        'sharded': True,
+    },
+}
+
+
+def _validation_message(error):
+    return '; '.join(f"{'.'.join(map(str, item['loc'])) or 'row'}: {item['msg']}" for item in error.errors())
+
+
+def import_rows(kind, stream, fmt='ndjson', chunk_size=CHUNK_SIZE, bind=None, shards=SHARDS):
+    '''
+    :param kind: 'games' | 'ratings' | 'feedback'
+    :param stream: текстовый или бинарный (UTF-8) поток с NDJSON или CSV
+    :param fmt: 'ndjson' | 'csv'
+    :param chunk_size: int - сколько строк пишется одной транзакцией
+    :param bind: Engine | None - по умолчанию движок SessionLocal
+    :param shards: int - число шардов базы bind (по умолчанию SHARDS)
+    :return: {'kind', 'written', 'error_count', 'errors': [{'line', 'error'}]}
+    Функция проверяет строки схемами из app/schemas.py и записывает их пачками
+    через executemany, по транзакции на пачку. Ошибочные строки пропускаются и
+    попадают в отчёт (первые MAX_REPORTED_ERRORS штук), остальные загружаются.
+    Оценки и отзывы, уже оставленные пользователем к игре, перезаписываются.
+    '''
+    importer = IMPORTERS[kind]
+    report = {'kind': kind, 'written': 0, 'error_count': 0, 'errors': []}
+
+    def fail(line, error):
+        report['error_count'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'line': line, 'error': error})
+
+    rows = read_rows(stream, fmt)
+    while chunk := list(islice(rows, chunk_size)):
+        valid = []
+        for line, row in chunk:
+            if isinstance(row, Exception):
+                fail(line, f'invalid {fmt}: {row}')
+                continue
+            try:
+                valid.append((line, importer['values'](importer['schema'].model_validate(row))))
+            except ValidationError as error:
+                fail(line, _validation_message(error))
+        with (bind or SessionLocal.kw['bind']).begin() as connection:
+            valid = importer['check'](connection, valid, fail)
+            if valid:
+                payload = [values for _, values in valid]
+                # оценки и отзывы при шардировании пишутся отдельным executemany в каждый шард
+                groups = by_shard(payload, shards) if importer['sharded'] else {None: payload}
+                for shard, shard_rows in groups.items():
+                    result = connection.execute(on_shard(importer['statement'](), shard), shard_rows)
+                    # записанные строки считает база: часть строк могла быть пропущена при конфликте
+                    report['written'] += importer['written'](result, valid, fail)
+    return report
+
+
+async def import_upload(kind, upload, fmt=None):
+    '''
+    :param kind: 'games' | 'ratings' | 'feedback'
+    :param upload: UploadFile
+    :param fmt: 'ndjson' | 'csv' | None - по умолчанию определяется по расширению файла
+    :return: отчёт import_rows
+    Загрузка выполняется в пуле потоков, чтобы не блокировать event loop.
+    Файл читается в байтах: read_rows декодирует его построчно, и строка не в UTF-8
+    попадает в отчёт, а не обрывает загрузку после уже записанных пачек.
+    '''
+    if fmt is None:
+        fmt = 'csv' if (upload.filename or '').lower().endswith('.csv') else 'ndjson'
+    return await run_in_threadpool(import_rows, kind, upload.file, fmt)
@@ -0,0 +1,19 @@
+from ..models.game import Game
+from ..models.user import User
+from ..models.user_game_feedback import UserGameFeedback
+from ..models.user_game_rating import UserGameRating
+from ..schemas import ReadGame, ReadUser, ReadRating, ReadFeedback
+
+# схема ответа API для каждой модели: запросы без ORM-объектов (страницы, выгрузки, кэш записей,
+# загрузчики) выбирают только её поля
+READ_SCHEMAS = {Game: ReadGame, User: ReadUser, UserGameRating: ReadRating, UserGameFeedback: ReadFeedback}
+
+
+def read_columns(model):
+    '''
+    :param model: модель из READ_SCHEMAS
+    :return: list[Column] - колонки таблицы в порядке полей схемы ответа
+    Колонки берутся из схемы, а не из таблицы: то, что скрывает response_model (хэш пароля users),
+    не попадает и туда, где схема к ответу не применяется (потоковые выгрузки, кэш записей).
+    '''
+    return [model.__table__.c[name] for name in READ_SCHEMAS[model].model_fields]
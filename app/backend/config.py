@@ -0,0 +1,116 @@
+import os
+
+# Настройки подключения к базе данных берутся из переменных окружения.
+# DB_PROFILE=production (по умолчанию) - WAL, без вывода SQL в консоль;
+# DB_PROFILE=development - как раньше: журнал по умолчанию и echo=True.
+
+DB_PATH = os.getenv('DB_PATH', 'gamemanage.db')
+DB_PROFILE = os.getenv('DB_PROFILE', 'production')
+
+PROFILES = {
+    'production': {
+        'echo': False,
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,   # отрицательное значение - размер в КиБ (64 МиБ)
+        'busy_timeout': 5000,       # мс
+        'pool_size': 10,
+        'max_overflow': 20,
+    },
+    'development': {
+        'echo': True,
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'mmap_size': 0,
+        'cache_size': -2000,
+        'busy_timeout': 5000,
+        'pool_size': 5,
+        'max_overflow': 10,
+    },
+}
+
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return default if value is None else int(value)
+
+
+def engine_profile(name=None):
+    '''
+    :param name: str | None - имя профиля, по умолчанию DB_PROFILE
+    :return: dict
+    Функция возвращает настройки движка для профиля; любую из них
+    можно переопределить переменной окружения DB_<ИМЯ_НАСТРОЙКИ>.
+    '''
+    profile = dict(PROFILES[name or DB_PROFILE])
+    profile['echo'] = _env_bool('DB_ECHO', profile['echo'])
+    profile['journal_mode'] = os.getenv('DB_JOURNAL_MODE', profile['journal_mode'])
+    profile['synchronous'] = os.getenv('DB_SYNCHRONOUS', profile['synchronous'])
+    for key in ('mmap_size', 'cache_size', 'busy_timeout', 'pool_size', 'max_overflow'):
+        profile[key] = _env_int('DB_' + key.upper(), profile[key])
+    return profile
+
+# Кэш отрендеренных HTML-страниц (app/backend/page_cache.py)
+PAGE_CACHE_SIZE = int(os.getenv('PAGE_CACHE_SIZE', 256))
+PAGE_CACHE_TTL = float(os.getenv('PAGE_CACHE_TTL', 60))
+
+# Рекомендации похожих игр (app/backend/recommendations.py)
+SIMILAR_TOP_K = int(os.getenv('SIMILAR_TOP_K', 20))
+# как часто (в секундах) проверять, изменились ли оценки, и пересчитывать соседей; 0 - не пересчитывать
+SIMILAR_REBUILD_INTERVAL = float(os.getenv('SIMILAR_REBUILD_INTERVAL', 300))
+
+# Сессии пользователей (app/backend/sessions.py).
+# При нескольких воркерах SESSION_SECRET нужно задать явно, иначе у каждого процесса будет свой ключ
+SESSION_SECRET = os.getenv('SESSION_SECRET') or os.urandom(32).hex()
+SESSION_COOKIE = os.getenv('SESSION_COOKIE', 'session')
+SESSION_TTL = int(os.getenv('SESSION_TTL', 12 * 60 * 60))
+IDENTITY_CACHE_SIZE = int(os.getenv('IDENTITY_CACHE_SIZE', 10000))
+IDENTITY_CACHE_TTL = float(os.getenv('IDENTITY_CACHE_TTL', 300))
+
+# Хэширование паролей (app/backend/passwords.py): параметры scrypt и размер пула потоков.
+# SCRYPT_N - основной параметр стоимости (степень двойки), память на хэш = 128 * N * r байт
+SCRYPT_N = int(os.getenv('SCRYPT_N', 2 ** 14))
+SCRYPT_R = int(os.getenv('SCRYPT_R', 8))
+SCRYPT_P = int(os.getenv('SCRYPT_P', 1))
+PASSWORD_WORKERS = int(os.getenv('PASSWORD_WORKERS', os.cpu_count() or 1))
+
+# Учёт SQL-запросов по HTTP-запросам (app/backend/sql_metrics.py)
+SQL_LOG = _env_bool('SQL_LOG', False)                       # писать JSON-строку со статистикой на каждый запрос
+SQL_REPEAT_WARN = int(os.getenv('SQL_REPEAT_WARN', 5))      # одинаковый SQL чаще этого - подозрение на N+1
+SQL_BUDGET_ENFORCE = _env_bool('SQL_BUDGET_ENFORCE', False)  # режим тестов: превышение бюджета - ошибка 500
+
+# Удаление пользователей и игр (app/backend/purge.py): если дочерних строк больше PURGE_THRESHOLD,
+# они удаляются в фоне порциями по PURGE_CHUNK с паузой PURGE_PAUSE секунд между транзакциями
+PURGE_THRESHOLD = int(os.getenv('PURGE_THRESHOLD', 10000))
+PURGE_CHUNK = int(os.getenv('PURGE_CHUNK', 1000))
+PURGE_PAUSE = float(os.getenv('PURGE_PAUSE', 0.05))
+
+# Очередь записи оценок и отзывов (app/backend/write_queue.py). Выключена по умолчанию: при WRITE_QUEUE=1
+# rating_finish/feedback_finish отдают upsert фоновой задаче, которая пишет их пачками до WRITE_BATCH_SIZE,
+# дожидаясь пополнения пачки не дольше WRITE_BATCH_DELAY секунд
+WRITE_QUEUE = _env_bool('WRITE_QUEUE', False)
+WRITE_BATCH_SIZE = int(os.getenv('WRITE_BATCH_SIZE', 500))
+WRITE_BATCH_DELAY = float(os.getenv('WRITE_BATCH_DELAY', 0.005))
+WRITE_QUEUE_SIZE = int(os.getenv('WRITE_QUEUE_SIZE', 10000))
+
+# Кэш записей по id для /game/game_id, /user/user_id, /rating/rating_id, /feedback/feedback_id
+# (app/backend/entity_cache.py). ENTITY_CACHE=memory - LRU в памяти процесса, redis - общий кэш
+# на сервере ENTITY_CACHE_URL (нужен пакет redis), off - без кэша
+ENTITY_CACHE = os.getenv('ENTITY_CACHE', 'memory')
+ENTITY_CACHE_URL = os.getenv('ENTITY_CACHE_URL', 'redis://localhost:6379/0')
+ENTITY_CACHE_SIZE = int(os.getenv('ENTITY_CACHE_SIZE', 10000))
+ENTITY_CACHE_TTL = float(os.getenv('ENTITY_CACHE_TTL', 60))
+
+# Шардирование оценок и отзывов по game_id (app/backend/shards.py): SHARDS файлов рядом с DB_PATH
+# (gamemanage.shard0.db, ...), 0 - всё в основной базе. Менять только вместе с manage.py reshard --to N.
+# При шардировании рейтинг игр (game_leaderboard) пересчитывается в фоне раз в LEADERBOARD_REFRESH_INTERVAL секунд
+SHARDS = int(os.getenv('SHARDS', 0))
+LEADERBOARD_REFRESH_INTERVAL = float(os.getenv('LEADERBOARD_REFRESH_INTERVAL', 5))
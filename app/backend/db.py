@@ -1,11 +1,66 @@
-from sqlalchemy import create_engine, Column, Integer, String
+from sqlalchemy import create_engine, event, Column, Integer, String
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 
-engine = create_engine("sqlite:///gamemanage.db", echo=True)
+from .config import DB_PATH, SHARDS, engine_profile
+from .sql_metrics import instrument
+from .shards import attach_shards
+
+
+def set_sqlite_pragmas(engine, profile, path=DB_PATH, shards=SHARDS):
+    '''
+    :param engine: Engine
+    :param profile: dict
+    :param path: str - файл основной базы, рядом с ним лежат файлы шардов
+    :param shards: int - сколько шардов подключать (app/backend/shards.py)
+    Функция выставляет PRAGMA профиля на каждое новое соединение из пула.
+    foreign_keys в SQLite выключен по умолчанию и действует только на своё соединение,
+    поэтому включается здесь всегда: без него не работают ON DELETE CASCADE
+    '''
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={profile['journal_mode']}")
+        cursor.execute(f"PRAGMA synchronous={profile['synchronous']}")
+        cursor.execute(f"PRAGMA mmap_size={profile['mmap_size']}")
+        cursor.execute(f"PRAGMA cache_size={profile['cache_size']}")
+        cursor.execute(f"PRAGMA busy_timeout={profile['busy_timeout']}")
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+        attach_shards(dbapi_connection, profile, path, shards)
+
+
+def make_engine(path=DB_PATH, profile=None, shards=SHARDS):
+    profile = profile or engine_profile()
+    sync_engine = create_engine(f"sqlite:///{path}", echo=profile['echo'], poolclass=QueuePool,
+                                pool_size=profile['pool_size'], max_overflow=profile['max_overflow'])
+    set_sqlite_pragmas(sync_engine, profile, path, shards)
+    instrument(sync_engine)
+    return sync_engine
+
+
+def make_async_engine(path=DB_PATH, profile=None, shards=SHARDS):
+    profile = profile or engine_profile()
+    aio_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", echo=profile['echo'],
+                                     poolclass=AsyncAdaptedQueuePool,
+                                     pool_size=profile['pool_size'], max_overflow=profile['max_overflow'])
+    set_sqlite_pragmas(aio_engine.sync_engine, profile, path, shards)
+    instrument(aio_engine.sync_engine)
+    return aio_engine
+
+
+# синхронный движок остаётся для alembic и служебных скриптов
+engine = make_engine()
 
 SessionLocal = sessionmaker(bind=engine)
 
+# асинхронный движок (aiosqlite) используется обработчиками FastAPI,
+# чтобы запросы к базе не блокировали event loop
+async_engine = make_async_engine()
+
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession, expire_on_commit=False)
+
 class Base(DeclarativeBase):
     pass
 
-
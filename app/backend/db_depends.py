@@ -1,8 +1,5 @@
-from .db import SessionLocal
+from .db import AsyncSessionLocal
 
 async def get_db():
-    db = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
@@ -0,0 +1,56 @@
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, selectinload
+
+from .rating_stats import stats_to_dict
+from ..models.game import Game
+from ..models.user import User
+from ..models.user_game_feedback import UserGameFeedback
+from ..models.user_game_rating import UserGameRating
+
+# Страница игры или пользователя загружается тремя запросами независимо от числа оценок и отзывов:
+# сама запись (для игры - вместе с агрегатами оценок через JOIN), затем оценки и отзывы через selectinload
+# одним IN (...) на коллекцию, с авторами (играми) в том же запросе через joinedload.
+# Обе коллекции одним JOIN не грузятся: строк получилось бы (оценки x отзывы).
+
+
+def game_details_query(game_id):
+    return (select(Game).where(Game.id == game_id)
+            .options(joinedload(Game.rating_stats),
+                     selectinload(Game.game_ratings).joinedload(UserGameRating.send_to_user),
+                     selectinload(Game.game_feedbacks).joinedload(UserGameFeedback.send_to_user)))
+
+
+def user_details_query(user_id):
+    return (select(User).where(User.id == user_id)
+            .options(selectinload(User.user_ratings).joinedload(UserGameRating.send_to_game),
+                     selectinload(User.user_feedbacks).joinedload(UserGameFeedback.send_to_game)))
+
+
+async def game_details(db, game_id):
+    '''
+    :param db: AsyncSession
+    :param game_id: int
+    :return: {'game', 'stats', 'ratings', 'feedbacks'} - для game.html и /game/game_id/full;
+             game равен None, если игры нет
+    Оценки и отзывы - ORM-объекты с загруженным автором (send_to_user)
+    '''
+    game = await db.scalar(game_details_query(game_id))
+    if game is None:
+        return {'game': None, 'stats': stats_to_dict(game_id, None), 'ratings': [], 'feedbacks': []}
+    return {'game': game,
+            'stats': stats_to_dict(game_id, game.rating_stats),
+            'ratings': game.game_ratings,
+            'feedbacks': game.game_feedbacks}
+
+
+async def user_details(db, user_id):
+    '''
+    :param db: AsyncSession
+    :param user_id: int
+    :return: {'user', 'ratings', 'feedbacks'} - для user.html и /user/user_id/full; user равен None, если его нет
+    Оценки и отзывы - ORM-объекты с загруженной игрой (send_to_game)
+    '''
+    user = await db.scalar(user_details_query(user_id))
+    if user is None:
+        return {'user': None, 'ratings': [], 'feedbacks': []}
+    return {'user': user, 'ratings': user.user_ratings, 'feedbacks': user.user_feedbacks}
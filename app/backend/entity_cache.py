@@ -0,0 +1,177 @@
+import logging
+
+import orjson
+from sqlalchemy import select
+
+from .columns import read_columns
+from .config import ENTITY_CACHE, ENTITY_CACHE_URL, ENTITY_CACHE_SIZE, ENTITY_CACHE_TTL
+from .page_cache import PageCache
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBackend:
+    '''
+    Бэкенд в памяти процесса: LRU из page_cache с TTL. Как и кэш страниц, инвалидация
+    действует только в своём процессе, при нескольких воркерах устаревание ограничивает TTL.
+    Ключи - кортежи (namespace, id).
+    '''
+
+    def __init__(self, max_size=ENTITY_CACHE_SIZE, ttl=ENTITY_CACHE_TTL):
+        self._cache = PageCache(max_size, ttl, name='entity')
+
+    async def get_many(self, keys):
+        values = {}
+        for key in keys:
+            value = self._cache.get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    async def set_many(self, mapping):
+        for key, value in mapping.items():
+            self._cache.set(key, value)
+
+    async def delete_many(self, keys):
+        self._cache.invalidate(*keys)
+
+    async def clear(self, namespace):
+        self._cache.invalidate_namespace(namespace)
+
+    async def close(self):
+        pass
+
+
+class RedisBackend:
+    '''
+    Бэкенд на Redis (или совместимом сервере): общий для всех воркеров, поэтому инвалидация
+    из одного процесса видна остальным. Ключ - '<prefix>:<namespace>:<id>', значение - JSON, TTL - EX.
+    Пакет redis нужен только для этого бэкенда и импортируется при его создании.
+    '''
+
+    def __init__(self, url=ENTITY_CACHE_URL, ttl=ENTITY_CACHE_TTL, prefix='gm', client=None):
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.from_url(url)
+        self._redis = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, key):
+        namespace, id_ = key
+        return f'{self.prefix}:{namespace}:{id_}'
+
+    async def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = await self._redis.mget([self._key(key) for key in keys])
+        return {key: orjson.loads(value) for key, value in zip(keys, values) if value is not None}
+
+    async def set_many(self, mapping):
+        if not mapping:
+            return
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for key, value in mapping.items():
+                pipe.set(self._key(key), orjson.dumps(value), ex=int(self.ttl))
+            await pipe.execute()
+
+    async def delete_many(self, keys):
+        keys = [self._key(key) for key in keys]
+        if keys:
+            await self._redis.delete(*keys)
+
+    async def clear(self, namespace):
+        keys = []
+        async for key in self._redis.scan_iter(match=f'{self.prefix}:{namespace}:*', count=1000):
+            keys.append(key)
+            if len(keys) >= 1000:
+                await self._redis.delete(*keys)
+                keys = []
+        if keys:
+            await self._redis.delete(*keys)
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+class NullBackend:
+    # ENTITY_CACHE=off: каждый запрос идёт в базу
+
+    async def get_many(self, keys):
+        return {}
+
+    async def set_many(self, mapping):
+        pass
+
+    async def delete_many(self, keys):
+        pass
+
+    async def clear(self, namespace):
+        pass
+
+    async def close(self):
+        pass
+
+
+def make_backend(kind=ENTITY_CACHE):
+    if kind == 'memory':
+        return MemoryBackend()
+    if kind == 'redis':
+        return RedisBackend()
+    if kind == 'off':
+        return NullBackend()
+    raise ValueError(f'unknown ENTITY_CACHE backend: {kind}')
+
+
+class EntityCache:
+    '''
+    Кэш записей по id поверх сменного бэкенда. Значение - словарь колонок (как строка pagination.columns_select),
+    пространство имён - имя таблицы. Отсутствующие в базе id не кэшируются.
+    Кэш write-through в смысле инвалидации: маршруты, меняющие запись, удаляют её ключ после COMMIT.
+    Ошибка бэкенда (например, недоступный Redis) не ломает запрос - он просто идёт в базу.
+    '''
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    async def _call(self, method, *args, default=None):
+        try:
+            return await getattr(self.backend, method)(*args)
+        except Exception:
+            logger.warning('entity cache %s failed', method, exc_info=True)
+            return default
+
+    async def get_many(self, db, model, ids):
+        '''
+        :param db: AsyncSession
+        :param model: модель SQLAlchemy с колонкой id
+        :param ids: iterable[int]
+        :return: dict[int, dict | None] - в порядке ids, None для id, которых нет в базе
+        '''
+        namespace = model.__tablename__
+        ids = list(dict.fromkeys(ids))
+        cached = await self._call('get_many', [(namespace, id_) for id_ in ids], default={})
+        values = {id_: cached.get((namespace, id_)) for id_ in ids}
+        missing = [id_ for id_, value in values.items() if value is None]
+        if missing:
+            rows = await db.execute(select(*read_columns(model)).where(model.id.in_(missing)))
+            found = {row.id: row._asdict() for row in rows}
+            values.update(found)
+            await self._call('set_many', {(namespace, id_): value for id_, value in found.items()})
+        return values
+
+    async def get(self, db, model, id_):
+        return (await self.get_many(db, model, [id_]))[id_]
+
+    async def invalidate(self, model, *ids):
+        await self._call('delete_many', [(model.__tablename__, id_) for id_ in ids])
+
+    async def clear(self, model):
+        await self._call('clear', model.__tablename__)
+
+    async def close(self):
+        await self._call('close')
+
+
+entity_cache = EntityCache(make_backend())
@@ -0,0 +1,87 @@
+import csv
+import io
+import zlib
+
+import orjson
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+
+from .columns import read_columns
+from .db import AsyncSessionLocal
+
+STREAM_CHUNK = 1000
+MEDIA_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv; charset=utf-8'}
+
+
+def export_query(model, after=None, **filters):
+    '''
+    :param model: модель SQLAlchemy
+    :param after: int | None - выгружать строки с id > after
+    :param filters: равенства по колонкам (например, game_id=1); None не фильтрует
+    :return: Select по колонкам схемы ответа модели (Core, без ORM-объектов)
+    '''
+    query = select(*read_columns(model)).order_by(model.id).execution_options(yield_per=STREAM_CHUNK)
+    if after is not None:
+        query = query.where(model.id > after)
+    for name, value in filters.items():
+        if value is not None:
+            query = query.where(model.__table__.c[name] == value)
+    return query
+
+
+async def _partitions(query):
+    # сессия открывается внутри генератора: зависимость get_db закрывается до отправки ответа
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query)
+        async for partition in result.mappings().partitions():
+            yield partition
+
+
+async def _ndjson(query):
+    async for partition in _partitions(query):
+        yield b''.join(orjson.dumps(dict(row), option=orjson.OPT_APPEND_NEWLINE) for row in partition)
+
+
+async def _csv(query):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(query.selected_columns.keys())
+    async for partition in _partitions(query):
+        writer.writerows(row.values() for row in partition)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def _gzip(chunks):
+    compressor = zlib.compressobj(wbits=31)  # 31 - формат gzip
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_response(model, fmt='ndjson', compress=False, filename=None, after=None, **filters):
+    '''
+    :param model: модель SQLAlchemy
+    :param fmt: 'ndjson' | 'csv'
+    :param compress: bool - сжать ответ gzip
+    :param filename: str | None - имя файла для Content-Disposition
+    :return: StreamingResponse
+    Функция построчно выгружает таблицу пачками по STREAM_CHUNK строк (yield_per),
+    поэтому расход памяти не зависит от размера таблицы.
+    '''
+    query = export_query(model, after, **filters)
+    chunks = _csv(query) if fmt == 'csv' else _ndjson(query)
+    headers = {}
+    media_type = MEDIA_TYPES[fmt]
+    if compress:
+        chunks = _gzip(chunks)
+        media_type = 'application/gzip'
+    if filename:
+        headers['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}{".gz" if compress else ""}"'
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
@@ -0,0 +1,140 @@
+import hashlib
+import io
+import json
+import os
+
+from markupsafe import Markup
+from starlette.staticfiles import StaticFiles
+
+PHOTO_DIR = 'photo'
+VARIANTS_DIR = os.path.join(PHOTO_DIR, 'variants')
+MANIFEST_PATH = os.path.join(VARIANTS_DIR, 'manifest.json')
+VARIANTS_URL = '/photo/variants'
+
+WIDTHS = (640, 1280, 1920)
+QUALITY = {'avif': 50, 'webp': 75, 'jpeg': 80}
+EXTENSIONS = {'avif': 'avif', 'webp': 'webp', 'jpeg': 'jpg'}
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# имена вариантов содержат хэш исходника, поэтому их можно кэшировать навсегда
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class ImmutableStaticFiles(StaticFiles):
+    '''
+    StaticFiles для файлов с хэшем содержимого в имени: добавляет долгоживущий Cache-Control
+    '''
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+
+def available_formats():
+    # AVIF и WebP используются, только если Pillow собран с их поддержкой; JPEG есть всегда
+    from PIL import features
+    return [fmt for fmt in ('avif', 'webp') if features.check(fmt)] + ['jpeg']
+
+
+def _target_widths(width):
+    # изображение не увеличиваем: ширины больше исходной заменяются исходной
+    return sorted({min(target, width) for target in WIDTHS})
+
+
+def _build_source(path, source, formats, variants_dir):
+    from PIL import Image, ImageOps
+
+    with open(path, 'rb') as file:
+        data = file.read()
+    digest = hashlib.sha256(data + repr(sorted(QUALITY.items())).encode()).hexdigest()[:12]
+    stem = source.rsplit('.', 1)[0].replace('/', '_')
+
+    image = None
+    variants = []
+    for width in _target_widths(Image.open(io.BytesIO(data)).width):
+        for fmt in formats:
+            name = f'{stem}-{width}-{digest}.{EXTENSIONS[fmt]}'
+            target = os.path.join(variants_dir, name)
+            if not os.path.exists(target):
+                if image is None:
+                    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data))).convert('RGB')
+                height = round(image.height * width / image.width)
+                resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+                resized.save(target + '.tmp', format=fmt.upper(), quality=QUALITY[fmt], optimize=fmt == 'jpeg')
+                os.replace(target + '.tmp', target)
+            variants.append({'width': width, 'format': fmt, 'url': f'{VARIANTS_URL}/{name}',
+                             'bytes': os.path.getsize(target)})
+    return {'bytes': len(data), 'variants': variants}
+
+
+def build_variants(photo_dir=PHOTO_DIR, variants_dir=VARIANTS_DIR):
+    '''
+    :param photo_dir: str - каталог с исходными картинками
+    :param variants_dir: str - каталог для уменьшенных и пережатых вариантов
+    :return: dict - манифест {путь исходника относительно photo_dir: {'bytes', 'variants': [...]}}
+    Функция строит для каждой картинки варианты шириной WIDTHS в форматах AVIF/WebP/JPEG.
+    Уже построенные варианты (тот же хэш исходника) пропускаются. Требуется Pillow.
+    '''
+    os.makedirs(variants_dir, exist_ok=True)
+    formats = available_formats()
+    manifest = {}
+    for root, dirs, files in os.walk(photo_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != variants_dir)
+        for name in sorted(files):
+            if name.lower().endswith(SOURCE_EXTENSIONS):
+                path = os.path.join(root, name)
+                source = os.path.relpath(path, photo_dir).replace(os.sep, '/')
+                manifest[source] = _build_source(path, source, formats, variants_dir)
+
+    manifest_path = os.path.join(variants_dir, 'manifest.json')
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=1)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return manifest
+
+
+_manifest = {'mtime': None, 'data': {}}
+
+
+def load_manifest(path=MANIFEST_PATH):
+    '''
+    Манифест перечитывается, только если файл изменился (после build-images)
+    '''
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return {}
+    if mtime != _manifest['mtime']:
+        with open(path, encoding='utf-8') as file:
+            _manifest['data'] = json.load(file)
+        _manifest['mtime'] = mtime
+    return _manifest['data']
+
+
+def background_css(source, selector='body'):
+    '''
+    :param source: str - путь картинки относительно photo/, например '5.jpg'
+    :param selector: str - CSS-селектор элемента с фоном
+    :return: Markup - CSS-правила для <style>
+    Функция возвращает фон с вариантом подходящей ширины (через @media) и формата
+    (через image-set). Если варианты ещё не построены, используется исходный файл.
+    '''
+    variants = load_manifest().get(source, {}).get('variants')
+    if not variants:
+        return Markup(f"{selector} {{ background-image: url('/photo/{source}'); }}")
+
+    rules = []
+    widths = sorted({variant['width'] for variant in variants})
+    for index, width in enumerate(widths):
+        candidates = [variant for variant in variants if variant['width'] == width]
+        fallback = next(variant['url'] for variant in candidates if variant['format'] == 'jpeg')
+        image_set = ', '.join(f"url('{variant['url']}') type('{MIME_TYPES[variant['format']]}')"
+                              for variant in candidates)
+        rule = (f"{selector} {{ background-image: url('{fallback}'); "
+                f"background-image: image-set({image_set}); }}")
+        if index:
+            rule = f'@media (min-width: {widths[index - 1] + 1}px) {{ {rule} }}'
+        rules.append(rule)
+    return Markup('\n'.join(rules))
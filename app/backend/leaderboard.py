@@ -0,0 +1,129 @@
+import asyncio
+import logging
+
+from sqlalchemy import select, delete, insert, func, event, DDL, text
+from starlette.concurrency import run_in_threadpool
+
+from .db import Base
+from .versions import GAMES, LEADERBOARD, bump_sql, get_version, set_version, ratings_version
+from ..models.game import Game
+from ..models.game_leaderboard import GameLeaderboard
+
+logger = logging.getLogger(__name__)
+
+TOP_LIMIT = 50
+TOP_LIMIT_MAX = 500
+
+# Байесовское среднее: оценка критиков (Game.rating) считается PRIOR_WEIGHT голосами пользователей,
+# score = (PRIOR_WEIGHT * prior + сумма оценок) / (PRIOR_WEIGHT + число оценок).
+# Игра без оценки критиков получает prior = DEFAULT_PRIOR (середина шкалы 0..10).
+# Константы зашиты в триггеры: после их изменения нужна миграция, пересоздающая триггеры.
+PRIOR_WEIGHT = 5
+DEFAULT_PRIOR = 5
+
+
+def _refresh_sql(game_id):
+    '''
+    SQL для тела триггера: пересчитать строку рейтинга игры game_id по games и game_rating_stats
+    '''
+    votes = f'COALESCE((SELECT count FROM game_rating_stats WHERE game_id = {game_id}), 0)'
+    total = f'COALESCE((SELECT total FROM game_rating_stats WHERE game_id = {game_id}), 0)'
+    prior = f'COALESCE((SELECT rating FROM games WHERE id = {game_id}), {DEFAULT_PRIOR})'
+    return (f'INSERT INTO game_leaderboard (game_id, votes, score) SELECT id, 0, 0 FROM games '
+            f'WHERE id = {game_id} AND NOT EXISTS (SELECT 1 FROM game_leaderboard WHERE game_id = {game_id}); '
+            f'UPDATE game_leaderboard SET votes = {votes}, '
+            f'score = ({PRIOR_WEIGHT} * {prior} + {total}) * 1.0 / ({PRIOR_WEIGHT} + {votes}) '
+            f'WHERE game_id = {game_id};')
+
+
+# Рейтинг обновляется триггерами вслед за агрегатами game_rating_stats (их, в свою очередь,
+# обновляют триггеры на user_game_ratings) и при изменении оценки критиков.
+# Триггеры на games также увеличивают счётчик изменений игр (versions.GAMES) для refresh_leaderboard.
+LEADERBOARD_TRIGGERS = [
+    'CREATE TRIGGER IF NOT EXISTS trg_leaderboard_stats_insert AFTER INSERT ON game_rating_stats '
+    f'BEGIN {_refresh_sql("NEW.game_id")} END',
+    'CREATE TRIGGER IF NOT EXISTS trg_leaderboard_stats_update AFTER UPDATE OF count, total ON game_rating_stats '
+    f'BEGIN {_refresh_sql("NEW.game_id")} END',
+    'CREATE TRIGGER IF NOT EXISTS trg_leaderboard_stats_delete AFTER DELETE ON game_rating_stats '
+    f'BEGIN {_refresh_sql("OLD.game_id")} END',
+    'CREATE TRIGGER IF NOT EXISTS trg_leaderboard_game_insert AFTER INSERT ON games '
+    f'BEGIN {_refresh_sql("NEW.id")} {bump_sql(GAMES)} END',
+    'CREATE TRIGGER IF NOT EXISTS trg_leaderboard_game_update AFTER UPDATE OF rating ON games '
+    f'BEGIN {_refresh_sql("NEW.id")} {bump_sql(GAMES)} END',
+    'CREATE TRIGGER IF NOT EXISTS trg_leaderboard_game_delete AFTER DELETE ON games '
+    f'BEGIN DELETE FROM game_leaderboard WHERE game_id = OLD.id; {bump_sql(GAMES)} END',
+]
+
+for _trigger in LEADERBOARD_TRIGGERS:
+    event.listen(Base.metadata, 'after_create', DDL(_trigger))
+
+
+def rebuild_leaderboard(connection):
+    '''
+    :param connection: Connection (синхронное соединение в транзакции)
+    :return: int - количество игр в рейтинге
+    Функция пересчитывает таблицу game_leaderboard с нуля по games и game_rating_stats
+    и запоминает версию данных, по которой он построен
+    '''
+    set_version(connection, LEADERBOARD, _inputs_version(connection))
+    connection.execute(delete(GameLeaderboard))
+    connection.execute(text(
+        'INSERT INTO game_leaderboard (game_id, votes, score) '
+        'SELECT games.id, COALESCE(game_rating_stats.count, 0), '
+        f'({PRIOR_WEIGHT} * COALESCE(games.rating, {DEFAULT_PRIOR}) + COALESCE(game_rating_stats.total, 0)) * 1.0 '
+        f'/ ({PRIOR_WEIGHT} + COALESCE(game_rating_stats.count, 0)) '
+        'FROM games LEFT JOIN game_rating_stats ON game_rating_stats.game_id = games.id'))
+    return connection.scalar(select(func.count()).select_from(GameLeaderboard))
+
+
+def _inputs_version(connection):
+    # оба счётчика только растут, поэтому их сумма меняется при любом изменении оценок или игр
+    return ratings_version(connection) + (get_version(connection, GAMES) or 0)
+
+
+def refresh_leaderboard(engine):
+    '''
+    :param engine: Engine (синхронный)
+    :return: int | None - количество игр в рейтинге или None, если ни оценки, ни игры не менялись
+    При шардировании (SHARDS > 0) агрегаты лежат в файлах шардов, а триггеры основной базы их не видят,
+    поэтому рейтинг не обновляется вслед за оценками, а пересчитывается этой функцией по расписанию
+    '''
+    with engine.begin() as connection:
+        if get_version(connection, LEADERBOARD) == _inputs_version(connection):
+            return None
+        return rebuild_leaderboard(connection)
+
+
+async def leaderboard_refresher(engine, interval):
+    '''
+    Фоновая задача приложения при шардировании: раз в interval секунд пересчитывает рейтинг игр,
+    если что-то изменилось. Пересчёт идёт в пуле потоков, чтобы не блокировать event loop.
+    '''
+    while True:
+        try:
+            await run_in_threadpool(refresh_leaderboard, engine)
+        except Exception:
+            logger.exception('game leaderboard rebuild failed')
+        await asyncio.sleep(interval)
+
+
+def top_games_query(limit=TOP_LIMIT, offset=0):
+    return (select(Game.id, Game.title, Game.slug, Game.rating.label('critic_rating'),
+                   GameLeaderboard.votes, GameLeaderboard.score)
+            .join(Game, Game.id == GameLeaderboard.game_id)
+            .order_by(GameLeaderboard.score.desc(), GameLeaderboard.game_id.desc())
+            .limit(limit)
+            .offset(offset))
+
+
+async def top_page(db, limit=TOP_LIMIT, offset=0):
+    '''
+    :param db: AsyncSession
+    :param limit: int - размер страницы
+    :param offset: int - сколько лучших игр пропустить
+    :return: {'items': [...], 'next_offset': int | None}
+    Функция возвращает страницу рейтинга игр по байесовскому среднему
+    '''
+    items = [dict(row) for row in (await db.execute(top_games_query(limit, offset))).mappings()]
+    next_offset = offset + limit if len(items) == limit else None
+    return {'items': items, 'next_offset': next_offset}
@@ -0,0 +1,84 @@
+from typing import Annotated
+
+from fastapi import Depends, HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .columns import read_columns
+from .db_depends import get_db
+from ..models.game import Game
+from ..models.user import User
+
+BATCH_LIMIT = 100   # максимум id в одном запросе /game/batch, /user/batch
+IN_CHUNK = 500      # id в одном IN (...) - с запасом ниже лимита параметров SQLite
+
+
+class Loader:
+    '''
+    Загрузчик записей по id в пределах одного HTTP-запроса.
+    Все запрошенные id, которых ещё нет в памяти, читаются одним запросом WHERE id IN (...);
+    повторные обращения к тем же id (в том числе отсутствующим в базе) к базе не ходят.
+    Записи - строки колонок (как в pagination.columns_select), а не ORM-объекты.
+    '''
+
+    def __init__(self, db, model, columns=None):
+        self.db = db
+        self.model = model
+        self.columns = columns or read_columns(model)
+        self._rows = {}
+
+    async def load_many(self, ids):
+        '''
+        :param ids: iterable[int]
+        :return: dict[int, Row | None] - в порядке ids, None для id, которых нет в базе
+        '''
+        ids = list(dict.fromkeys(ids))
+        missing = [id_ for id_ in ids if id_ not in self._rows]
+        for start in range(0, len(missing), IN_CHUNK):
+            chunk = missing[start:start + IN_CHUNK]
+            rows = await self.db.execute(select(*self.columns).where(self.model.id.in_(chunk)))
+            found = {row.id: row for row in rows}
+            for id_ in chunk:
+                self._rows[id_] = found.get(id_)
+        return {id_: self._rows[id_] for id_ in ids}
+
+    async def load(self, id_):
+        return (await self.load_many([id_]))[id_]
+
+
+class Loaders:
+    def __init__(self, db):
+        self.games = Loader(db, Game)
+        self.users = Loader(db, User)
+
+
+async def get_loaders(db: Annotated[AsyncSession, Depends(get_db)]):
+    # FastAPI кэширует зависимость в пределах запроса, поэтому все её потребители получают одни загрузчики
+    return Loaders(db)
+
+
+def parse_ids(ids):
+    '''
+    :param ids: str - id через запятую, например "1,2,3"
+    :return: list[int] - без повторов, в исходном порядке
+    '''
+    try:
+        parsed = list(dict.fromkeys(int(id_) for id_ in ids.split(',') if id_.strip()))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="ids must be integers")
+    if not parsed:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="ids is empty")
+    if len(parsed) > BATCH_LIMIT:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f"at most {BATCH_LIMIT} ids per request")
+    return parsed
+
+
+async def batch_response(loader, ids):
+    '''
+    :param loader: Loader
+    :param ids: str - id через запятую
+    :return: {'items': {id: запись | None}, 'not_found': [id, ...]}
+    '''
+    items = await loader.load_many(parse_ids(ids))
+    return {'items': items, 'not_found': [id_ for id_, row in items.items() if row is None]}
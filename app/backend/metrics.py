@@ -0,0 +1,93 @@
+import os
+import time
+
+from jinja2 import Template
+from sqlalchemy import event
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest, REGISTRY
+from prometheus_client import multiprocess
+
+# Метрики для Prometheus (GET /metrics).
+# При нескольких воркерах (uvicorn --workers, gunicorn) перед запуском нужно задать PROMETHEUS_MULTIPROC_DIR -
+# пустой каталог, куда каждый процесс пишет свои значения; /metrics складывает их по всем процессам.
+# Каталог очищается перед каждым запуском; gunicorn должен вызывать mark_process_dead в хуке child_exit,
+# иначе livesum-метрики (запросы в работе, соединения пула) учитывают завершившиеся воркеры.
+MULTIPROCESS = bool(os.getenv('PROMETHEUS_MULTIPROC_DIR'))
+
+REQUESTS = Counter('http_requests_total', 'Обработанные HTTP-запросы', ['method', 'route', 'status'])
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'Время обработки HTTP-запроса',
+                             ['method', 'route'])
+IN_PROGRESS = Gauge('http_requests_in_progress', 'HTTP-запросы в работе', multiprocess_mode='livesum')
+DB_POOL_CHECKED_OUT = Gauge('db_pool_checked_out', 'Соединения, выданные из пула', ['engine'],
+                            multiprocess_mode='livesum')
+CACHE_REQUESTS = Counter('cache_requests_total', 'Обращения к кэшам в памяти процесса', ['cache', 'result'])
+TEMPLATE_RENDER = Histogram('template_render_seconds', 'Время рендеринга шаблона Jinja2', ['template'],
+                            buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1))
+
+UNMATCHED = '<unmatched>'
+
+
+class MetricsMiddleware:
+    '''
+    ASGI-middleware: счётчик запросов по маршруту и коду ответа, гистограмма времени и число запросов в работе.
+    Маршрут берётся шаблоном пути (scope['route']), чтобы id в URL не размножали серии.
+    Время считается до отправки последней части тела, поэтому включает отдачу StreamingResponse.
+    '''
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        IN_PROGRESS.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            IN_PROGRESS.dec()
+            route = getattr(scope.get('route'), 'path', UNMATCHED)
+            REQUESTS.labels(scope['method'], route, status).inc()
+            REQUEST_DURATION.labels(scope['method'], route).observe(elapsed)
+
+
+class TimedTemplate(Template):
+    # Jinja2Templates рендерит шаблон при создании TemplateResponse через Template.render
+    def render(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            TEMPLATE_RENDER.labels(self.name).observe(time.perf_counter() - started)
+
+
+def instrument_pool(engine, name):
+    '''
+    :param engine: Engine (для AsyncEngine - его sync_engine)
+    :param name: str - значение метки engine
+    Функция отслеживает число соединений, выданных из пула движка
+    '''
+    checked_out = DB_POOL_CHECKED_OUT.labels(name)
+    event.listen(engine, 'checkout', lambda *args: checked_out.inc())
+    event.listen(engine, 'checkin', lambda *args: checked_out.dec())
+
+
+def render_metrics():
+    '''
+    :return: (bytes, str) - метрики в текстовом формате Prometheus и их Content-Type
+    '''
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
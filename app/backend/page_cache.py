@@ -0,0 +1,74 @@
+import time
+from collections import OrderedDict
+
+from .config import PAGE_CACHE_SIZE, PAGE_CACHE_TTL
+from .metrics import CACHE_REQUESTS
+
+LIST_GAME = ('list_game',)
+LIST_USER = ('list_user',)
+
+
+def game_key(game_id):
+    return ('game', game_id)
+
+
+def user_key(user_id):
+    return ('user', user_id)
+
+
+class PageCache:
+    '''
+    LRU-кэш отрендеренных страниц с ограниченным размером и временем жизни записи.
+    Ключ - кортеж (страница, id). Кэш локален для процесса: при нескольких воркерах
+    инвалидация действует только в своём процессе, поэтому TTL ограничивает устаревание.
+    '''
+
+    def __init__(self, max_size=PAGE_CACHE_SIZE, ttl=PAGE_CACHE_TTL, name='page'):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # счётчики Prometheus суммируются по всем воркерам, в отличие от hits/misses
+        self._hit_metric = CACHE_REQUESTS.labels(name, 'hit')
+        self._miss_metric = CACHE_REQUESTS.labels(name, 'miss')
+        self._pages = OrderedDict()
+
+    def get(self, key):
+        page = self._pages.get(key)
+        if page is None or page[0] < time.monotonic():
+            self._pages.pop(key, None)
+            self.misses += 1
+            self._miss_metric.inc()
+            return None
+        self._pages.move_to_end(key)
+        self.hits += 1
+        self._hit_metric.inc()
+        return page[1]
+
+    def set(self, key, body):
+        if self.max_size <= 0:
+            return
+        self._pages[key] = (time.monotonic() + self.ttl, body)
+        self._pages.move_to_end(key)
+        while len(self._pages) > self.max_size:
+            self._pages.popitem(last=False)
+
+    def invalidate(self, *keys):
+        for key in keys:
+            self._pages.pop(key, None)
+
+    def invalidate_namespace(self, namespace):
+        # удаляет все ключи вида (namespace, ...)
+        for key in [key for key in self._pages if key[0] == namespace]:
+            del self._pages[key]
+
+    def clear(self):
+        self._pages.clear()
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {'size': len(self._pages), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses,
+                'hit_ratio': self.hits / requests if requests else None}
+
+
+page_cache = PageCache()
@@ -0,0 +1,45 @@
+from sqlalchemy import select
+
+from .columns import read_columns
+from .export import stream_response
+
+PAGE_LIMIT = 100
+PAGE_LIMIT_MAX = 1000
+
+
+def columns_select(model):
+    '''
+    :param model: модель SQLAlchemy
+    :return: Select по колонкам схемы ответа модели (columns.read_columns)
+    Строки такого запроса - кортежи без ORM-объектов: их дешевле создавать и сериализовать,
+    и они не могут лениво подгрузить связи (game_ratings и т.п.) при формировании ответа.
+    '''
+    return select(*read_columns(model))
+
+
+async def keyset_page(db, model, limit=PAGE_LIMIT, after=None):
+    '''
+    :param db: AsyncSession
+    :param model: модель с целочисленным первичным ключом id
+    :param limit: int - размер страницы
+    :param after: int | None - id последней записи предыдущей страницы
+    :return: {'items': [...], 'next_after': int | None}
+    Функция возвращает страницу записей (строки колонок схемы ответа), отсортированных по id (keyset-пагинация).
+    Если next_after не None, его нужно передать в after для получения следующей страницы.
+    '''
+    query = columns_select(model).order_by(model.id).limit(limit)
+    if after is not None:
+        query = query.where(model.id > after)
+    items = (await db.execute(query)).all()
+    next_after = items[-1].id if len(items) == limit else None
+    return {'items': items, 'next_after': next_after}
+
+
+def ndjson_response(model, after=None):
+    '''
+    :param model: модель SQLAlchemy
+    :param after: int | None
+    :return: StreamingResponse
+    Функция отдаёт всю таблицу построчно в формате NDJSON (см. export.stream_response).
+    '''
+    return stream_response(model, 'ndjson', after=after)
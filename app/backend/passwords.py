@@ -0,0 +1,87 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import SCRYPT_N, SCRYPT_R, SCRYPT_P, PASSWORD_WORKERS
+
+PREFIX = 'scrypt'
+SALT_SIZE = 16
+HASH_SIZE = 32
+
+# hashlib.scrypt отпускает GIL, поэтому хэши считаются параллельно в потоках, а event loop
+# не блокируется. Пул ограничен: лишние запросы ждут в очереди, а не занимают все ядра.
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix='password')
+
+
+def _b64(data):
+    return base64.b64encode(data).decode()
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r, dklen=HASH_SIZE)
+
+
+def hash_password(password, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+    '''
+    :param password: str
+    :return: str - "scrypt$n$r$p$соль$хэш" (соль и хэш в base64)
+    '''
+    salt = os.urandom(SALT_SIZE)
+    return f'{PREFIX}${n}${r}${p}${_b64(salt)}${_b64(_scrypt(password, salt, n, r, p))}'
+
+
+def is_hashed(stored):
+    return stored is not None and stored.startswith(PREFIX + '$')
+
+
+def verify_password(password, stored):
+    '''
+    :param password: str - введённый пароль
+    :param stored: str | None - значение из users.password: хэш или старый пароль открытым текстом
+    :return: bool
+    '''
+    if stored is None:
+        return False
+    if not is_hashed(stored):
+        return hmac.compare_digest(password.encode(), stored.encode())
+    try:
+        _, n, r, p, salt, expected = stored.split('$')
+        digest = _scrypt(password, base64.b64decode(salt), int(n), int(r), int(p))
+    except ValueError:
+        return False
+    return hmac.compare_digest(digest, base64.b64decode(expected))
+
+
+def needs_rehash(stored):
+    '''
+    Пароль нужно перехэшировать, если он хранится открытым текстом или с другими параметрами scrypt
+    '''
+    return not is_hashed(stored) or stored.split('$')[1:4] != [str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P)]
+
+
+async def hash_password_async(password):
+    return await asyncio.get_running_loop().run_in_executor(_executor, hash_password, password)
+
+
+async def verify_password_async(password, stored):
+    return await asyncio.get_running_loop().run_in_executor(_executor, verify_password, password, stored)
+
+
+async def check_login(db, user, password):
+    '''
+    :param db: AsyncSession
+    :param user: User
+    :param password: str
+    :return: bool - совпадает ли пароль
+    Если пароль верный, но хранится открытым текстом или с устаревшими параметрами,
+    он перехэшируется и сохраняется (user.password получает новое значение).
+    '''
+    if not await verify_password_async(password, user.password):
+        return False
+    if needs_rehash(user.password):
+        user.password = await hash_password_async(password)
+        await db.commit()
+    return True
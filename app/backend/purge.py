@@ -0,0 +1,98 @@
+import asyncio
+import logging
+
+from sqlalchemy import select, delete, func, literal_column
+
+from .config import PURGE_CHUNK, PURGE_PAUSE
+from .db import AsyncSessionLocal
+from .shards import SHARDS, SHARDED_TABLES, shard_for, all_shards, on_shard
+from ..models.game import Game
+from ..models.user import User
+from ..models.user_game_rating import UserGameRating
+from ..models.user_game_feedback import UserGameFeedback
+from ..models.game_similarity import GameSimilarity
+from ..models.game_rating_stats import GameRatingStats
+
+logger = logging.getLogger(__name__)
+
+# Дочерние строки удаляет ON DELETE CASCADE одной транзакцией вместе с родителем. Для пользователей и игр
+# с очень большим числом оценок такая транзакция надолго занимает блокировку записи SQLite, поэтому
+# крупные удаления сначала снимают дочерние строки порциями, каждая в своей короткой транзакции.
+# Агрегаты (game_rating_stats, game_leaderboard) поправляют триггеры при удалении каждой оценки.
+CHILDREN = {
+    Game: [UserGameRating.game_id, UserGameFeedback.game_id, GameSimilarity.game_id, GameSimilarity.similar_game_id],
+    User: [UserGameRating.user_id, UserGameFeedback.user_id],
+}
+
+# При шардировании (SHARDS > 0) оценки, отзывы и агрегаты лежат в файлах шардов, куда каскад основной базы
+# не доходит, и удаляются явно: строки игры - в её шарде, строки пользователя - во всех шардах
+SHARD_CHILDREN = {
+    Game: [UserGameRating.game_id, UserGameFeedback.game_id, GameRatingStats.game_id],
+    User: [UserGameRating.user_id, UserGameFeedback.user_id],
+}
+
+ROWID = literal_column('rowid')
+
+
+def _targets(model, parent_id):
+    # пары (колонка, шард): без шардирования - все таблицы CHILDREN в основной базе
+    if not SHARDS:
+        return [(column, None) for column in CHILDREN[model]]
+    targets = [(column, shard) for column in SHARD_CHILDREN[model]
+               for shard in ([shard_for(parent_id)] if column.name == 'game_id' else all_shards())]
+    return targets + [(column, None) for column in CHILDREN[model] if column.table.name not in SHARDED_TABLES]
+
+
+async def delete_shard_children(db, model, parent_id):
+    '''
+    :param db: AsyncSession
+    :param model: Game | User
+    :param parent_id: int
+    Функция удаляет строки шардов, которые не удалит ON DELETE CASCADE; вызывается в той же
+    транзакции перед удалением самой записи. Без шардирования ничего не делает
+    '''
+    for column, shard in _targets(model, parent_id):
+        if shard is not None:
+            await db.execute(on_shard(delete(column.table).where(column == parent_id), shard))
+
+
+async def count_children(db, model, parent_id):
+    '''
+    :param db: AsyncSession
+    :param model: Game | User
+    :param parent_id: int
+    :return: int - число дочерних строк, которые удалит каскад
+    '''
+    total = 0
+    for column in CHILDREN[model]:
+        total += await db.scalar(select(func.count()).where(column == parent_id))
+    return total
+
+
+async def purge(model, parent_id, chunk=PURGE_CHUNK, pause=PURGE_PAUSE):
+    '''
+    :param model: Game | User
+    :param parent_id: int
+    :param chunk: int - строк в одной транзакции
+    :param pause: float - пауза между транзакциями, чтобы дать записать другим запросам
+    :return: int - удалено дочерних строк
+    Функция удаляет дочерние строки порциями, а затем саму запись (остаток, добавленный за время
+    удаления, снимает каскад). Удаление, прерванное на середине, можно просто запустить снова.
+    '''
+    deleted = 0
+    for column, shard in _targets(model, parent_id):
+        table = column.table
+        batch = select(ROWID).select_from(table).where(column == parent_id).limit(chunk)
+        while True:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(on_shard(delete(table).where(ROWID.in_(batch)), shard))
+                await db.commit()
+            deleted += result.rowcount
+            if result.rowcount < chunk:
+                break
+            await asyncio.sleep(pause)
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(model).where(model.id == parent_id))
+        await db.commit()
+    logger.info('purged %s %s: %s child rows', model.__tablename__, parent_id, deleted)
+    return deleted
@@ -0,0 +1,82 @@
+from sqlalchemy import select, text
+
+from ..models.game import Game
+from ..models.user import User
+from ..models.user_game_feedback import UserGameFeedback
+from ..models.user_game_rating import UserGameRating
+from ..models.game_rating_stats import GameRatingStats
+from .recommendations import similar_games_query, recommended_games_query
+from .leaderboard import top_games_query
+
+SAMPLE_ID = 1
+
+# Горячие запросы приложения в том виде, в котором их строят обработчики main.py и роутеры.
+# При добавлении запроса в обработчик, который вызывается на каждый показ страницы, его нужно добавить сюда.
+HOT_QUERIES = {
+    'get_game: game': select(Game).where(Game.id == SAMPLE_ID),
+    'get_game: ratings': select(UserGameRating, User).join(User).where(UserGameRating.game_id == SAMPLE_ID),
+    'get_game: feedbacks': select(UserGameFeedback, User).join(User).where(UserGameFeedback.game_id == SAMPLE_ID),
+    'get_game: stats': select(GameRatingStats).where(GameRatingStats.game_id == SAMPLE_ID),
+    'get_user: user': select(User).where(User.id == SAMPLE_ID),
+    'get_user: ratings': select(UserGameRating, Game).join(Game).where(UserGameRating.user_id == SAMPLE_ID),
+    'get_user: feedbacks': select(UserGameFeedback, Game).join(Game).where(UserGameFeedback.user_id == SAMPLE_ID),
+    'reg_user: username': select(User).where(User.username == 'username'),
+    '/rating/rating_id': select(UserGameRating).where(UserGameRating.id == SAMPLE_ID),
+    '/feedback/feedback_id': select(UserGameFeedback).where(UserGameFeedback.id == SAMPLE_ID),
+    '/game/game_id/rating': select(UserGameRating).where(UserGameRating.game_id == SAMPLE_ID),
+    '/game/game_id/feedback': select(UserGameFeedback).where(UserGameFeedback.game_id == SAMPLE_ID),
+    '/user/user_id/rating': select(UserGameRating).where(UserGameRating.user_id == SAMPLE_ID)
+                                                     .order_by(UserGameRating.id),
+    '/user/user_id/feedback': select(UserGameFeedback).where(UserGameFeedback.user_id == SAMPLE_ID)
+                                                       .order_by(UserGameFeedback.id),
+    '/game/all_games?after': select(Game).where(Game.id > SAMPLE_ID).order_by(Game.id).limit(100),
+    '/rating/all_rating?after': select(UserGameRating).where(UserGameRating.id > SAMPLE_ID)
+                                                      .order_by(UserGameRating.id).limit(100),
+    '/game/game_id/similar': similar_games_query(SAMPLE_ID),
+    '/user/user_id/recommended': recommended_games_query(SAMPLE_ID),
+    '/game/top': top_games_query(),
+    '/game/batch': select(Game).where(Game.id.in_([SAMPLE_ID, SAMPLE_ID + 1])),
+    '/user/batch': select(User).where(User.id.in_([SAMPLE_ID, SAMPLE_ID + 1])),
+}
+
+# Проход по индексу в порядке сортировки допустим для страниц с LIMIT: читается только начало индекса.
+# Если индекс пропадёт, в плане появится SCAN без индекса и временное B-дерево для ORDER BY.
+ORDERED_SCANS = {
+    '/game/top': {'SCAN game_leaderboard USING INDEX ix_game_leaderboard_score_game_id'},
+}
+
+
+def explain(connection, statement):
+    '''
+    :param connection: Connection (синхронное)
+    :param statement: Select
+    :return: list[str] - строки EXPLAIN QUERY PLAN
+    '''
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+    return [row[-1] for row in connection.execute(text('EXPLAIN QUERY PLAN ' + sql))]
+
+
+def is_full_scan(detail):
+    # SEARCH - поиск по индексу; SCAN - проход по всей таблице (или всему индексу)
+    return detail.startswith('SCAN ') and detail != 'SCAN CONSTANT ROW'
+
+
+def check_query_plans(connection, queries=None):
+    '''
+    :param connection: Connection (синхронное)
+    :param queries: dict[str, Select] | None - по умолчанию HOT_QUERIES
+    :return: dict[str, list[str]] - запросы, план которых содержит полный проход таблицы
+    Функция выполняет EXPLAIN QUERY PLAN для каждого запроса и возвращает те,
+    что деградировали до полного сканирования (например, после удаления индекса).
+    '''
+    failures = {}
+    for name, statement in (queries or HOT_QUERIES).items():
+        plan = explain(connection, statement)
+        # проход по уже материализованному подзапросу (при шардировании - представлению над шардами,
+        # ветки которого в плане свои, с SEARCH по индексам) полным сканированием таблицы не является
+        materialized = {'SCAN ' + detail.split()[1] for detail in plan if detail.startswith('MATERIALIZE ')}
+        scans = [detail for detail in plan
+                 if is_full_scan(detail) and detail not in materialized and detail not in ORDERED_SCANS.get(name, ())]
+        if scans:
+            failures[name] = scans
+    return failures
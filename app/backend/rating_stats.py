@@ -0,0 +1,92 @@
+from sqlalchemy import select, delete, insert, func, case, event, DDL
+
+from .db import Base
+from .versions import RATINGS, bump_sql
+from ..models.game_rating_stats import GameRatingStats, RATING_MIN, RATING_MAX
+from ..models.user_game_rating import UserGameRating
+
+SCORES = range(RATING_MIN, RATING_MAX + 1)
+
+
+def _score_column(score):
+    return f'score_{score}' if score in SCORES else None
+
+
+def _add_sql(row, sign, guard=True):
+    '''
+    SQL для тела триггера: добавить (sign='+') или вычесть (sign='-') оценку
+    строки row (NEW или OLD) из агрегатов её игры. Строка агрегатов создаётся только для существующей игры:
+    при удалении игры каскад удаляет оценки уже после неё, и агрегаты удалённой игры не должны появиться снова.
+    В файле шарда таблицы games нет (guard=False): там оценки удалённой игры вместе с агрегатами
+    удаляет сам обработчик удаления (purge.delete_shard_children)
+    '''
+    columns = ', '.join(_score_column(score) for score in SCORES)
+    zeros = ', '.join('0' for _ in SCORES)
+    histogram = ', '.join(f'{_score_column(score)} = {_score_column(score)} {sign} ({row}.rating_int = {score})'
+                          for score in SCORES)
+    source = f'SELECT id, 0, 0, {zeros} FROM games WHERE id = {row}.game_id AND' if guard else f'SELECT {row}.game_id, 0, 0, {zeros} WHERE'
+    return (f'INSERT INTO game_rating_stats (game_id, count, total, {columns}) '
+            f'{source} {row}.rating_int IS NOT NULL '
+            f'AND NOT EXISTS (SELECT 1 FROM game_rating_stats WHERE game_id = {row}.game_id); '
+            f'UPDATE game_rating_stats SET count = count {sign} 1, total = total {sign} {row}.rating_int, {histogram} '
+            f'WHERE game_id = {row}.game_id AND {row}.rating_int IS NOT NULL;')
+
+
+def _stats_triggers(guard=True):
+    # каждый триггер также увеличивает счётчик изменений оценок (versions.RATINGS)
+    bump = bump_sql(RATINGS)
+    return [
+        'CREATE TRIGGER IF NOT EXISTS trg_rating_stats_insert AFTER INSERT ON user_game_ratings '
+        f'BEGIN {_add_sql("NEW", "+", guard)} {bump} END',
+        'CREATE TRIGGER IF NOT EXISTS trg_rating_stats_update AFTER UPDATE OF game_id, rating_int ON user_game_ratings '
+        f'BEGIN {_add_sql("OLD", "-", guard)} {_add_sql("NEW", "+", guard)} {bump} END',
+        'CREATE TRIGGER IF NOT EXISTS trg_rating_stats_delete AFTER DELETE ON user_game_ratings '
+        f'BEGIN {_add_sql("OLD", "-", guard)} {bump} END',
+    ]
+
+
+# Агрегаты поддерживаются триггерами SQLite: они срабатывают в той же транзакции,
+# что и запись в user_game_ratings (в том числе для INSERT ... ON CONFLICT DO UPDATE),
+# поэтому обработчикам не нужно знать прежнее значение оценки.
+RATING_STATS_TRIGGERS = _stats_triggers()
+# те же триггеры в файлах шардов (app/backend/reshard.py)
+SHARD_STATS_TRIGGERS = _stats_triggers(guard=False)
+
+# при create_all (сгенерированные базы) триггеры создаются после всех таблиц
+for _trigger in RATING_STATS_TRIGGERS:
+    event.listen(Base.metadata, 'after_create', DDL(_trigger))
+
+
+def stats_to_dict(game_id, stats):
+    '''
+    :param game_id: int
+    :param stats: GameRatingStats | None
+    :return: dict
+    Функция переводит строку агрегатов в ответ API (count, sum, mean, histogram)
+    '''
+    if stats is None:
+        return {'game_id': game_id, 'count': 0, 'sum': 0, 'mean': None, 'histogram': [0 for _ in SCORES]}
+    return {'game_id': game_id,
+            'count': stats.count,
+            'sum': stats.total,
+            'mean': stats.total / stats.count if stats.count else None,
+            'histogram': [getattr(stats, _score_column(score)) for score in SCORES]}
+
+
+def rebuild_rating_stats(connection):
+    '''
+    :param connection: Connection (синхронное соединение в транзакции)
+    :return: int - количество игр с оценками
+    Функция пересчитывает таблицу game_rating_stats с нуля по user_game_ratings
+    '''
+    connection.execute(delete(GameRatingStats))
+    rating = UserGameRating.rating_int
+    aggregates = (select(UserGameRating.game_id,
+                         func.count(),
+                         func.sum(rating),
+                         *[func.sum(case((rating == score, 1), else_=0)) for score in SCORES])
+                  .where(UserGameRating.game_id.is_not(None), rating.is_not(None))
+                  .group_by(UserGameRating.game_id))
+    columns = ['game_id', 'count', 'total'] + [_score_column(score) for score in SCORES]
+    connection.execute(insert(GameRatingStats).from_select(columns, aggregates))
+    return connection.scalar(select(func.count()).select_from(GameRatingStats))
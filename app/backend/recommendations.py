@@ -0,0 +1,192 @@
+import asyncio
+import logging
+
+from sqlalchemy import select, delete, insert, func
+from starlette.concurrency import run_in_threadpool
+
+from .config import SIMILAR_TOP_K
+from .versions import SIMILARITY, get_version, set_version, ratings_version
+from ..models.game import Game
+from ..models.game_similarity import GameSimilarity
+from ..models.user_game_rating import UserGameRating
+
+logger = logging.getLogger(__name__)
+
+# сходство двух игр, оценённых малым числом общих пользователей, уменьшается:
+# score = cos * common / (common + SHRINKAGE)
+SHRINKAGE = 5
+# сколько игр обрабатывается за один блок матричного умножения
+BLOCK_SIZE = 1024
+# сколько раз refresh_similarity пересчитывает соседей, если оценки менялись во время расчёта
+REFRESH_ATTEMPTS = 3
+
+
+def _top_k(block, k):
+    '''
+    :param block: ndarray (n, games) - сходства блока игр со всеми играми
+    :return: (columns, scores) - для каждой строки k столбцов с наибольшим сходством (по убыванию)
+    '''
+    import numpy as np
+
+    k = min(k, block.shape[1])
+    columns = np.argpartition(-block, k - 1, axis=1)[:, :k]
+    scores = np.take_along_axis(block, columns, axis=1)
+    order = np.argsort(-scores, axis=1)
+    return np.take_along_axis(columns, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+def compute_similarity(user_ids, game_ids, ratings, top_k=SIMILAR_TOP_K):
+    '''
+    :param user_ids: ndarray - id пользователя для каждой оценки
+    :param game_ids: ndarray - id игры для каждой оценки
+    :param ratings: ndarray - оценки
+    :param top_k: int - сколько соседей хранить для каждой игры
+    :return: list[tuple[int, int, float]] - (game_id, similar_game_id, score)
+    Функция считает item-item сходство: скорректированный косинус (оценки центрируются по
+    среднему пользователя) с поправкой на число общих оценщиков. Матрица пользователь x игра
+    разреженная, произведение считается блоками по BLOCK_SIZE игр. Требуются NumPy и SciPy.
+    '''
+    import numpy as np
+    from scipy import sparse
+
+    if len(ratings) == 0:
+        return []
+    users, user_index = np.unique(user_ids, return_inverse=True)
+    games, game_index = np.unique(game_ids, return_inverse=True)
+    shape = (len(users), len(games))
+
+    ratings = ratings.astype(np.float64)
+    user_mean = np.bincount(user_index, weights=ratings) / np.bincount(user_index)
+    centered = sparse.csr_matrix((ratings - user_mean[user_index], (user_index, game_index)), shape=shape)
+    rated = sparse.csr_matrix((np.ones(len(ratings)), (user_index, game_index)), shape=shape)
+
+    norms = np.sqrt(np.asarray(centered.multiply(centered).sum(axis=0))).ravel()
+    norms[norms == 0] = 1.0
+    centered = centered.multiply(1.0 / norms).tocsc()
+    rated = rated.tocsc()
+
+    rows = []
+    for start in range(0, len(games), BLOCK_SIZE):
+        stop = min(start + BLOCK_SIZE, len(games))
+        cosine = (centered[:, start:stop].T @ centered).toarray()
+        common = (rated[:, start:stop].T @ rated).toarray()
+        block = cosine * common / (common + SHRINKAGE)
+        # сама игра и игры без общих оценщиков соседями не считаются
+        block[np.arange(stop - start), np.arange(start, stop)] = 0.0
+        block[common == 0] = 0.0
+        columns, scores = _top_k(block, top_k)
+        for offset in range(stop - start):
+            for column, score in zip(columns[offset], scores[offset]):
+                if score > 0:
+                    rows.append((int(games[start + offset]), int(games[column]), float(score)))
+    return rows
+
+
+def _load_ratings(connection):
+    '''
+    :return: ndarray (n, 3) - (user_id, game_id, rating_int) всех оценок
+    '''
+    import numpy as np
+
+    result = connection.execute(select(UserGameRating.user_id, UserGameRating.game_id, UserGameRating.rating_int)
+                                .where(UserGameRating.user_id.is_not(None), UserGameRating.game_id.is_not(None),
+                                       UserGameRating.rating_int.is_not(None)))
+    return np.array(result.all(), dtype=np.int64).reshape(-1, 3)
+
+
+def _compute(data, top_k):
+    return compute_similarity(data[:, 0], data[:, 1], data[:, 2], top_k)
+
+
+def _store_similarity(connection, rows, version):
+    '''
+    Заменяет таблицу game_similarity и запоминает версию оценок, по которой она построена
+    '''
+    connection.execute(delete(GameSimilarity))
+    if rows:
+        connection.execute(insert(GameSimilarity),
+                           [{'game_id': game_id, 'similar_game_id': similar_game_id, 'score': score}
+                            for game_id, similar_game_id, score in rows])
+    set_version(connection, SIMILARITY, version)
+
+
+def build_similarity(connection, top_k=SIMILAR_TOP_K):
+    '''
+    :param connection: Connection (синхронное соединение в транзакции)
+    :param top_k: int
+    :return: int - количество сохранённых пар игр
+    Функция пересчитывает таблицу game_similarity по всем оценкам в транзакции вызывающего.
+    Она подходит для новой базы (benchmarks/dataset.py); на работающей базе используется
+    refresh_similarity, который не держит блокировку записи во время расчёта
+    '''
+    version = ratings_version(connection)
+    rows = _compute(_load_ratings(connection), top_k)
+    _store_similarity(connection, rows, version)
+    return len(rows)
+
+
+def refresh_similarity(engine, top_k=SIMILAR_TOP_K, force=False):
+    '''
+    :param engine: Engine (синхронный)
+    :param force: bool - пересчитать, даже если оценки не менялись
+    :return: int | None - количество пар игр или None, если пересчёт не нужен или не удался
+    Оценки читаются в короткой читающей транзакции, расчёт идёт вне транзакции, а запись таблицы
+    и версии - в одной короткой пишущей: блокировка записи SQLite не держится во время расчёта.
+    Если за время расчёта оценки изменились, расчёт повторяется (до REFRESH_ATTEMPTS раз),
+    иначе остаётся до следующего прохода. Версия, по которой построены соседи, хранится в базе:
+    воркеры не пересчитывают то, что уже пересчитал другой
+    '''
+    for attempt in range(REFRESH_ATTEMPTS):
+        with engine.connect() as connection:
+            # версия читается до оценок: данные не старше версии, а совпадение версии при записи
+            # значит, что оценки с момента чтения не менялись
+            version = ratings_version(connection)
+            if not force and get_version(connection, SIMILARITY) == version:
+                return None
+            data = _load_ratings(connection)
+        rows = _compute(data, top_k)
+        with engine.begin() as connection:
+            if ratings_version(connection) == version:
+                _store_similarity(connection, rows, version)
+                return len(rows)
+    logger.info('game similarity rebuild skipped: ratings changed during %d attempts', REFRESH_ATTEMPTS)
+    return None
+
+
+async def similarity_refresher(engine, interval):
+    '''
+    Фоновая задача приложения: раз в interval секунд пересчитывает соседей,
+    если оценки изменились. Пересчёт идёт в пуле потоков, чтобы не блокировать event loop.
+    '''
+    while True:
+        try:
+            await run_in_threadpool(refresh_similarity, engine)
+        except Exception:
+            logger.exception('game similarity rebuild failed')
+        await asyncio.sleep(interval)
+
+
+def similar_games_query(game_id, limit=SIMILAR_TOP_K):
+    return (select(Game.id, Game.title, Game.slug, GameSimilarity.score)
+            .join(Game, Game.id == GameSimilarity.similar_game_id)
+            .where(GameSimilarity.game_id == game_id)
+            .order_by(GameSimilarity.score.desc())
+            .limit(limit))
+
+
+def recommended_games_query(user_id, limit=SIMILAR_TOP_K):
+    '''
+    Игры-соседи оценённых пользователем игр, которые он ещё не оценивал.
+    Вес соседа - сходство, умноженное на оценку пользователя исходной игре.
+    '''
+    rated = select(UserGameRating.game_id, UserGameRating.rating_int).where(UserGameRating.user_id == user_id).subquery()
+    score = func.sum(GameSimilarity.score * rated.c.rating_int)
+    return (select(Game.id, Game.title, Game.slug, score.label('score'))
+            .join(rated, rated.c.game_id == GameSimilarity.game_id)
+            .join(Game, Game.id == GameSimilarity.similar_game_id)
+            .where(GameSimilarity.similar_game_id.not_in(select(UserGameRating.game_id)
+                                                         .where(UserGameRating.user_id == user_id)))
+            .group_by(Game.id)
+            .having(score > 0)
+            .order_by(score.desc(), Game.id)
+            .limit(limit))
@@ -0,0 +1,155 @@
+import logging
+import os
+
+from sqlalchemy import MetaData, Table, Column, Index, select, func, text
+
+from .config import DB_PATH, SHARDS
+from .db import make_engine
+from .leaderboard import rebuild_leaderboard
+from .rating_stats import SHARD_STATS_TRIGGERS, rebuild_rating_stats
+from .search import FEEDBACK_INDEX_SQL
+from .shards import MAX_SHARDS, shard_path
+from .versions import RATINGS, get_version, set_version, ratings_version
+from ..models.user_game_rating import UserGameRating
+from ..models.user_game_feedback import UserGameFeedback
+from ..models.game_rating_stats import GameRatingStats
+from ..models.data_version import DataVersion
+
+logger = logging.getLogger(__name__)
+
+MOVED_TABLES = (UserGameRating.__table__, UserGameFeedback.__table__)
+# Новые строки шарда k получают id из диапазона (base + k * ID_SPAN, base + (k + 1) * ID_SPAN], где base -
+# наибольший id на момент перешардирования (sqlite_sequence при AUTOINCREMENT). Перенесённые строки сохраняют
+# свои id (они не больше base), поэтому id остаются уникальными во всех шардах и не меняются
+ID_SPAN = 1 << 40
+NEW = 'reshard_new'
+
+
+def shard_metadata():
+    '''
+    :return: MetaData - таблицы файла шарда: оценки, отзывы, агрегаты и счётчик изменений оценок
+             с индексами моделей, но без внешних ключей (users и games лежат в основной базе)
+    '''
+    metadata = MetaData()
+    for table in (UserGameRating.__table__, UserGameFeedback.__table__, GameRatingStats.__table__,
+                  DataVersion.__table__):
+        copy = Table(table.name, metadata,
+                     *[Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable)
+                       for column in table.columns],
+                     sqlite_autoincrement='id' in table.columns)
+        for index in table.indexes:
+            Index(index.name, *[copy.c[column.name] for column in index.columns], unique=index.unique)
+    return metadata
+
+
+def _remove(path):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def _fill_shard(source, path, shard, shards, bases):
+    '''
+    Функция создаёт файл шарда path и переносит в него строки игр шарда из source
+    (основная база с подключёнными старыми шардами), затем строит агрегаты, FTS-индекс и триггеры.
+    Триггеры создаются после переноса: пересчитать агрегаты и индекс один раз дешевле, чем по строке
+    '''
+    _remove(path)
+    target = make_engine(path, shards=0)
+    shard_metadata().create_all(target)
+    with source.connect() as connection:
+        # ATTACH и DETACH выполняются вне транзакции
+        connection.execute(text(f'ATTACH DATABASE :path AS {NEW}'), {'path': path})
+        connection.commit()
+        for table in MOVED_TABLES:
+            columns = ', '.join(column.name for column in table.columns)
+            connection.execute(text(f'INSERT INTO {NEW}.{table.name} ({columns}) SELECT {columns} '
+                                    f'FROM {table.name} WHERE COALESCE(game_id, 0) % :shards = :shard'),
+                               {'shards': shards, 'shard': shard})
+            connection.execute(text(f'DELETE FROM {NEW}.sqlite_sequence WHERE name = :name'), {'name': table.name})
+            connection.execute(text(f'INSERT INTO {NEW}.sqlite_sequence (name, seq) VALUES (:name, :seq)'),
+                               {'name': table.name, 'seq': bases[table.name] + shard * ID_SPAN})
+        rebuild_rating_stats(connection.execution_options(schema_translate_map={None: NEW}))
+        connection.commit()
+        connection.execute(text(f'DETACH DATABASE {NEW}'))
+        connection.commit()
+    with target.begin() as connection:
+        for statement in SHARD_STATS_TRIGGERS + FEEDBACK_INDEX_SQL:
+            connection.execute(text(statement))
+        connection.execute(text("INSERT INTO user_game_feedback_fts (user_game_feedback_fts) VALUES ('rebuild')"))
+    with target.connect() as connection:
+        counts = {table.name: connection.scalar(select(func.count()).select_from(table)) for table in MOVED_TABLES}
+    target.dispose()
+    return counts
+
+
+def reshard(to_shards, from_shards=SHARDS, db_path=DB_PATH):
+    '''
+    :param to_shards: int - новое число шардов, 0 - вернуть оценки и отзывы в основную базу
+    :param from_shards: int - текущее число шардов (по умолчанию SHARDS)
+    :param db_path: str - основная база
+    :return: dict[str, list[int]] - число строк каждой таблицы по новым шардам
+    Функция перераспределяет оценки и отзывы по шардам. Приложение на время перешардирования
+    должно быть остановлено, а после него запущено с SHARDS=to_shards.
+    Новые шарды сначала полностью собираются во временных файлах и сверяются по числу строк;
+    старые данные удаляются только после этого. Прерванный до замены файлов запуск можно повторить.
+    '''
+    if not 0 <= to_shards <= MAX_SHARDS:
+        raise ValueError(f'number of shards must be between 0 and {MAX_SHARDS}')
+    if from_shards == to_shards:
+        raise ValueError(f'database already has {to_shards} shards')
+    if from_shards == MAX_SHARDS and to_shards:
+        # старые шарды и строящийся новый подключаются одновременно
+        raise ValueError(f'reshard from {MAX_SHARDS} shards to 0 first')
+    if os.path.exists(shard_path(from_shards, db_path)):
+        # --from меньше настоящего числа шардов: новые шарды собрались бы без строк из лишних файлов,
+        # а затем заменили бы их. Отсутствие файла из первых from_shards обнаружит attach_shards
+        raise ValueError(f'{shard_path(from_shards, db_path)} exists, the database has more than {from_shards} shards')
+
+    source = make_engine(db_path, shards=from_shards)
+    with source.connect() as connection:
+        expected = {table.name: connection.scalar(select(func.count()).select_from(table)) for table in MOVED_TABLES}
+        bases = {table.name: connection.scalar(select(func.coalesce(func.max(table.c.id), 0))) for table in MOVED_TABLES}
+        version = ratings_version(connection)
+
+    report = {table.name: [] for table in MOVED_TABLES}
+    if to_shards:
+        for shard in range(to_shards):
+            counts = _fill_shard(source, shard_path(shard, db_path) + '.new', shard, to_shards, bases)
+            for name, count in counts.items():
+                report[name].append(count)
+        for name, count in expected.items():
+            if sum(report[name]) != count:
+                raise RuntimeError(f'{name}: {count} rows expected, {sum(report[name])} copied')
+    else:
+        # триггеры основной базы сами поддерживают агрегаты и FTS-индекс отзывов
+        with source.begin() as connection:
+            for table in MOVED_TABLES:
+                columns = ', '.join(column.name for column in table.columns)
+                connection.execute(text(f'INSERT INTO main.{table.name} ({columns}) SELECT {columns} FROM {table.name}'))
+                report[table.name].append(expected[table.name])
+    source.dispose()
+
+    # замена файлов: старые шарды -> .old, новые на их место, затем удаление старых
+    for shard in range(from_shards):
+        os.replace(shard_path(shard, db_path), shard_path(shard, db_path) + '.old')
+        _remove(shard_path(shard, db_path))
+    for shard in range(to_shards):
+        os.replace(shard_path(shard, db_path) + '.new', shard_path(shard, db_path))
+
+    engine = make_engine(db_path, shards=to_shards)
+    with engine.begin() as connection:
+        if not from_shards:
+            # строки переехали в шарды, копии в основной базе больше не читаются
+            for table in MOVED_TABLES + (GameRatingStats.__table__,):
+                connection.execute(text(f'DELETE FROM main.{table.name}'))
+        # счётчики новых шардов начинаются с нуля: счётчик основной базы поднимается выше прежней суммы,
+        # чтобы версия оценок (versions.ratings_version) не вернулась к уже виденному значению
+        set_version(connection, RATINGS, max(get_version(connection, RATINGS) or 0, version) + 1)
+        # при шардировании агрегаты основной базы не обновляются, рейтинг считается по шардам
+        rebuild_leaderboard(connection)
+    engine.dispose()
+    for shard in range(from_shards):
+        _remove(shard_path(shard, db_path) + '.old')
+    logger.info('resharded %s: %s -> %s shards', db_path, from_shards, to_shards)
+    return report
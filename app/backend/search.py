@@ -0,0 +1,129 @@
+import re
+
+from sqlalchemy import event, DDL, text
+
+from .db import Base
+from .shards import SHARDS, shard_schema
+
+SEARCH_LIMIT = 20
+SEARCH_LIMIT_MAX = 100
+
+# unicode61 приводит кириллицу к нижнему регистру, но не считает «ё» и «е» одной буквой,
+# поэтому в индекс попадает текст, в котором «ё» заменена на «е» (так же нормализуется запрос)
+_TOKENIZE = "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'"
+
+
+def _fold(column):
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _index_sql(table, source, columns, weights):
+    '''
+    SQL для FTS5-индекса по таблице table: представление source с нормализованным текстом,
+    external content таблица {table}_fts поверх него и триггеры синхронизации
+    '''
+    fts = f'{table}_fts'
+    names = ', '.join(columns)
+    new = ', '.join(_fold(f'NEW.{column}') for column in columns)
+    old = ', '.join(_fold(f'OLD.{column}') for column in columns)
+    return [
+        f'CREATE VIEW IF NOT EXISTS {source} AS SELECT id, {", ".join(f"{_fold(c)} AS {c}" for c in columns)} '
+        f'FROM {table}',
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({names}, content = '{source}', "
+        f"content_rowid = 'id', {_TOKENIZE})",
+        # ранжирование bm25 с весами колонок используется в ORDER BY rank
+        f"INSERT INTO {fts} ({fts}, rank) VALUES ('rank', 'bm25({weights})')",
+        f'CREATE TRIGGER IF NOT EXISTS trg_{fts}_insert AFTER INSERT ON {table} '
+        f'BEGIN INSERT INTO {fts} (rowid, {names}) VALUES (NEW.id, {new}); END',
+        f'CREATE TRIGGER IF NOT EXISTS trg_{fts}_update AFTER UPDATE OF {names} ON {table} '
+        f"BEGIN INSERT INTO {fts} ({fts}, rowid, {names}) VALUES ('delete', OLD.id, {old}); "
+        f'INSERT INTO {fts} (rowid, {names}) VALUES (NEW.id, {new}); END',
+        f'CREATE TRIGGER IF NOT EXISTS trg_{fts}_delete AFTER DELETE ON {table} '
+        f"BEGIN INSERT INTO {fts} ({fts}, rowid, {names}) VALUES ('delete', OLD.id, {old}); END",
+    ]
+
+
+# название игры важнее описания
+GAMES_INDEX_SQL = _index_sql('games', 'games_search', ['title', 'description'], '10.0, 1.0')
+# при шардировании индекс отзывов есть и в каждом файле шарда (app/backend/reshard.py)
+FEEDBACK_INDEX_SQL = _index_sql('user_game_feedback', 'user_game_feedback_search', ['feedback_text'], '1.0')
+SEARCH_INDEX_SQL = GAMES_INDEX_SQL + FEEDBACK_INDEX_SQL
+SEARCH_TABLES = ('games_fts', 'user_game_feedback_fts')
+
+for _statement in SEARCH_INDEX_SQL:
+    event.listen(Base.metadata, 'after_create', DDL(_statement))
+
+
+def match_query(query):
+    '''
+    :param query: str - строка поиска от пользователя
+    :return: str | None - выражение для MATCH или None, если в строке нет слов
+    Каждое слово ищется как префикс («игр» найдёт «игра», «игры»), все слова обязательны.
+    Операторы FTS5 из пользовательского ввода не интерпретируются.
+    '''
+    words = re.findall(r'\w+', query.replace('ё', 'е').replace('Ё', 'Е'))
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _search_sql(table, columns):
+    # сначала выбираем страницу по rank внутри FTS-таблицы, затем подтягиваем строки по первичному ключу
+    fts = f'{table}_fts'
+    return text(f'SELECT {", ".join(f"{table}.{column}" for column in columns)}, hits.rank '
+                f'FROM (SELECT rowid, rank FROM {fts} WHERE {fts} MATCH :match '
+                f'ORDER BY rank LIMIT :limit OFFSET :offset) AS hits '
+                f'JOIN {table} ON {table}.id = hits.rowid ORDER BY hits.rank')
+
+
+def _sharded_search_sql(table, columns, shards):
+    # MATCH не проходит через представление над шардами: каждый шард отдаёт свои limit + offset лучших,
+    # общая страница выбирается по rank. bm25 считается по статистике своего шарда, поэтому
+    # ранги разных шардов сравнимы приближённо
+    fts = f'{table}_fts'
+    parts = []
+    for shard in range(shards):
+        schema = shard_schema(shard)
+        parts.append(f'SELECT {", ".join(f"{table}.{column}" for column in columns)}, hits.rank '
+                     f'FROM (SELECT rowid, rank FROM {schema}.{fts} WHERE {fts} MATCH :match '
+                     f'ORDER BY rank LIMIT :limit + :offset) AS hits '
+                     f'JOIN {schema}.{table} AS {table} ON {table}.id = hits.rowid')
+    return text(' UNION ALL '.join(parts) + ' ORDER BY rank LIMIT :limit OFFSET :offset')
+
+
+SEARCH_QUERIES = {'game': _search_sql('games', ['id', 'title', 'slug', 'description']),
+                  'feedback': (_sharded_search_sql('user_game_feedback', ['id', 'user_id', 'game_id', 'feedback_text'],
+                                                   SHARDS)
+                               if SHARDS else
+                               _search_sql('user_game_feedback', ['id', 'user_id', 'game_id', 'feedback_text']))}
+
+
+async def search(db, query, kind='game', limit=SEARCH_LIMIT, offset=0):
+    '''
+    :param db: AsyncSession
+    :param query: str - строка поиска
+    :param kind: str - 'game' (название и описание игр) или 'feedback' (тексты отзывов)
+    :param limit: int - размер страницы
+    :param offset: int - сколько лучших результатов пропустить
+    :return: {'items': [...], 'next_offset': int | None}
+    Функция возвращает страницу результатов, отсортированных по релевантности (bm25).
+    '''
+    match = match_query(query)
+    if match is None:
+        return {'items': [], 'next_offset': None}
+    rows = (await db.execute(SEARCH_QUERIES[kind], {'match': match, 'limit': limit, 'offset': offset})).mappings()
+    items = [dict(row) for row in rows]
+    next_offset = offset + limit if len(items) == limit else None
+    return {'items': items, 'next_offset': next_offset}
+
+
+def rebuild_search_index(connection):
+    '''
+    :param connection: Connection (синхронное соединение в транзакции)
+    Функция заново строит FTS-индексы по содержимому таблиц
+    '''
+    for fts in SEARCH_TABLES:
+        connection.execute(text(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')"))
+    for shard in range(SHARDS):
+        fts = 'user_game_feedback_fts'
+        connection.execute(text(f"INSERT INTO {shard_schema(shard)}.{fts} ({fts}) VALUES ('rebuild')"))
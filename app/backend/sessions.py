@@ -0,0 +1,80 @@
+import hashlib
+import hmac
+import time
+
+from sqlalchemy import select
+
+from .config import SESSION_SECRET, SESSION_COOKIE, SESSION_TTL, IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL
+from .page_cache import PageCache
+from ..models.user import User
+
+# Кэш личностей: id пользователя -> ключ сессии. Запись удаляется при изменении или удалении
+# пользователя (/user/update, /user/delete); в других процессах её устаревание ограничено TTL.
+identity_cache = PageCache(IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL, name='identity')
+
+
+def identity_key(user_id):
+    return ('identity', user_id)
+
+
+def _sign(value):
+    return hmac.new(SESSION_SECRET.encode(), value.encode(), hashlib.sha256).hexdigest()
+
+
+def session_key(user_id, username, password):
+    '''
+    Ключ сессии зависит от логина и пароля: после их смены (или удаления пользователя и
+    повторного использования его id) ранее выданные сессии перестают действовать
+    '''
+    return _sign(f'{user_id}\0{username}\0{password}')[:16]
+
+
+def issue_session(user, ttl=SESSION_TTL):
+    '''
+    :param user: User
+    :param ttl: int - срок действия в секундах
+    :return: str - подписанный токен "id.истекает.ключ.подпись"
+    '''
+    key = session_key(user.id, user.username, user.password)
+    identity_cache.set(identity_key(user.id), key)
+    payload = f'{user.id}.{int(time.time()) + ttl}.{key}'
+    return f'{payload}.{_sign(payload)}'
+
+
+def set_session_cookie(response, user):
+    response.set_cookie(SESSION_COOKIE, issue_session(user), max_age=SESSION_TTL, httponly=True, samesite='lax')
+    return response
+
+
+def _parse(token):
+    try:
+        user_id, expires, key, signature = token.split('.')
+        user_id, expires = int(user_id), int(expires)
+    except ValueError:
+        return None
+    if not hmac.compare_digest(signature, _sign(f'{user_id}.{expires}.{key}')) or expires < time.time():
+        return None
+    return user_id, key
+
+
+async def session_user_id(request, db):
+    '''
+    :param request: Request
+    :param db: AsyncSession
+    :return: int | None - id пользователя из cookie сессии или None, если сессии нет или она недействительна
+    Подпись проверяется без обращения к базе; база читается, только если пользователя нет в identity_cache.
+    '''
+    token = request.cookies.get(SESSION_COOKIE)
+    parsed = _parse(token) if token else None
+    if parsed is None:
+        return None
+    user_id, key = parsed
+
+    expected = identity_cache.get(identity_key(user_id))
+    if expected is None:
+        row = (await db.execute(select(User.username, User.password).where(User.id == user_id))).first()
+        if row is None:
+            return None
+        expected = session_key(user_id, row.username, row.password)
+        identity_cache.set(identity_key(user_id), expected)
+    return user_id if hmac.compare_digest(key, expected) else None
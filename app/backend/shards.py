@@ -0,0 +1,130 @@
+import contextlib
+import os
+
+from .config import DB_PATH, SHARDS
+
+# Шардирование оценок и отзывов (SHARDS > 0). Строки user_game_ratings и user_game_feedback, а вместе
+# с ними агрегаты game_rating_stats и FTS-индекс отзывов хранятся в SHARDS отдельных файлах SQLite;
+# шард выбирается по game_id, поэтому все оценки и агрегаты одной игры лежат в одном файле.
+# Блокировка записи в SQLite своя у каждого файла: оценки игр из разных шардов пишутся параллельно
+# и не ждут записи в основную базу.
+#
+# Каждое соединение пула подключает шарды через ATTACH как shard_0 .. shard_{N-1} и создаёт
+# временные (TEMP) представления с именами шардированных таблиц, объединяющие шарды через UNION ALL.
+# Временная схема при разрешении имён просматривается раньше основной, поэтому все запросы на чтение
+# работают без изменений: SQLite переносит условия WHERE внутрь каждой ветки (по индексам шарда),
+# а ORDER BY id выполняет слиянием веток - scatter-gather за одно SQL-выражение.
+# В представление писать нельзя: INSERT/UPDATE/DELETE направляются в файл шарда через route()/on_shard().
+SHARDED_TABLES = ('user_game_ratings', 'user_game_feedback', 'game_rating_stats')
+MAX_SHARDS = 10  # SQLITE_MAX_ATTACHED стандартной сборки SQLite
+
+
+def shard_schema(shard):
+    return f'shard_{shard}'
+
+
+def shard_path(shard, db_path=DB_PATH):
+    '''
+    :param shard: int
+    :param db_path: str - путь к основной базе
+    :return: str - файл шарда рядом с основной базой: gamemanage.db -> gamemanage.shard0.db
+    '''
+    root, ext = os.path.splitext(db_path)
+    return f'{root}.shard{shard}{ext}'
+
+
+def shard_for(game_id, shards=SHARDS):
+    '''
+    :param game_id: int | None
+    :return: int | None - номер шарда игры или None без шардирования
+    '''
+    if not shards:
+        return None
+    return (game_id or 0) % shards
+
+
+def all_shards(shards=SHARDS):
+    # без шардирования - одна «шардированная» область, сама основная база
+    return list(range(shards)) or [None]
+
+
+def attached_shards(connection):
+    '''
+    :param connection: Connection (синхронное)
+    :return: list[int] - шарды, подключённые к соединению (не обязательно SHARDS: manage.py reshard
+             открывает базу и со старым, и с новым числом шардов)
+    '''
+    schemas = {row[1] for row in connection.exec_driver_sql('PRAGMA database_list')}
+    return [shard for shard in range(MAX_SHARDS) if shard_schema(shard) in schemas]
+
+
+def on_shard(statement, shard):
+    '''
+    :param statement: INSERT/UPDATE/DELETE над одной шардированной таблицей
+    :param shard: int | None
+    :return: то же выражение, выполняемое в файле шарда (schema_translate_map переводит
+             таблицы без схемы в shard_N, поэтому другие таблицы в выражении участвовать не должны)
+    '''
+    if shard is None:
+        return statement
+    return statement.execution_options(schema_translate_map={None: shard_schema(shard)})
+
+
+def route(statement, game_id):
+    return on_shard(statement, shard_for(game_id))
+
+
+@contextlib.contextmanager
+def on_shard_connection(connection, shard):
+    '''
+    :param connection: Connection (синхронное)
+    :param shard: int | None
+    Внутри блока все выражения соединения выполняются в шарде (служебные пересчёты). В SQLAlchemy 2.0
+    Connection.execution_options меняет само соединение, поэтому после блока прежняя настройка возвращается
+    '''
+    if shard is None:
+        yield connection
+        return
+    previous = connection.get_execution_options().get('schema_translate_map')
+    connection.execution_options(schema_translate_map={None: shard_schema(shard)})
+    try:
+        yield connection
+    finally:
+        connection.execution_options(schema_translate_map=previous)
+
+
+def by_shard(rows, shards=SHARDS):
+    '''
+    :param rows: list[dict] - значения строк с ключом game_id
+    :param shards: int - число шардов (по умолчанию SHARDS)
+    :return: dict[int | None, list[dict]] - строки, сгруппированные по шардам (для executemany)
+    '''
+    groups = {}
+    for row in rows:
+        groups.setdefault(shard_for(row['game_id'], shards), []).append(row)
+    return groups
+
+
+def attach_shards(dbapi_connection, profile, db_path=DB_PATH, shards=SHARDS):
+    '''
+    :param dbapi_connection: соединение sqlite3 / aiosqlite
+    :param profile: dict - настройки движка (config.engine_profile)
+    Функция подключает файлы шардов к новому соединению пула и создаёт представления над ними.
+    Файлы создаёт только manage.py reshard: пустой файл, созданный ATTACH, спрятал бы все оценки
+    '''
+    if shards > MAX_SHARDS:
+        raise RuntimeError(f'SHARDS={shards}: SQLite attaches at most {MAX_SHARDS} databases')
+    cursor = dbapi_connection.cursor()
+    for shard in range(shards):
+        path = shard_path(shard, db_path)
+        if not os.path.exists(path):
+            raise RuntimeError(f'shard file {path} not found, run "python manage.py reshard --to {shards}"')
+        schema = shard_schema(shard)
+        cursor.execute(f'ATTACH DATABASE ? AS {schema}', (path,))
+        for pragma in ('journal_mode', 'synchronous', 'mmap_size', 'cache_size'):
+            cursor.execute(f'PRAGMA {schema}.{pragma}={profile[pragma]}')
+    if shards:
+        for table in SHARDED_TABLES:
+            union = ' UNION ALL '.join(f'SELECT * FROM {shard_schema(shard)}.{table}' for shard in range(shards))
+            cursor.execute(f'CREATE TEMP VIEW IF NOT EXISTS {table} AS {union}')
+    cursor.close()
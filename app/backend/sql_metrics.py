@@ -0,0 +1,128 @@
+import json
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+from .config import SQL_LOG, SQL_REPEAT_WARN, SQL_BUDGET_ENFORCE
+
+logger = logging.getLogger(__name__)
+
+# Бюджет SQL-выражений на один HTTP-запрос по шаблону пути маршрута. Если обработчику
+# понадобилось больше, скорее всего появилась ленивая загрузка или запрос в цикле (N+1).
+STATEMENT_BUDGETS = {
+    '/list_game/{game_id}': 3,
+    '/list_user/{user_id}': 3,
+    '/list_game': 1,
+    '/list_user': 1,
+    '/top_game': 1,
+    '/check_rating_entry': 2,
+    '/check_feedback_entry': 2,
+    '/rating_finish': 3,  # сессия + игра + upsert; без чтения пользователя, если он есть в identity_cache
+    '/feedback_finish': 3,  # сессия + игра + upsert; без чтения пользователя, если он есть в identity_cache
+    '/game/game_id': 1,  # при попадании в entity_cache - ни одного
+    '/user/user_id': 1,
+    '/rating/rating_id': 1,
+    '/feedback/feedback_id': 1,
+    '/game/batch': 1,
+    '/game/game_id/full': 3,
+    '/user/user_id/full': 3,
+    '/user/batch': 1,
+    '/game/game_id/rating': 1,
+    '/game/game_id/rating_stats': 1,
+    '/game/game_id/similar': 2,
+    '/game/top': 1,
+    '/user/user_id/recommended': 2,
+    '/search': 1,
+}
+DEFAULT_BUDGET = 10
+
+
+class StatementBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestStats:
+    '''
+    Статистика SQL одного HTTP-запроса: число выражений, суммарное время и повторы одинакового SQL
+    '''
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+        self.sql = Counter()
+
+    def repeated(self, threshold=SQL_REPEAT_WARN):
+        return {sql: count for sql, count in self.sql.items() if count > threshold}
+
+
+_current = ContextVar('sql_request_stats', default=None)
+
+
+def instrument(engine):
+    '''
+    :param engine: Engine (для AsyncEngine - его sync_engine)
+    Функция подписывается на события выполнения SQL и прибавляет их к статистике текущего запроса
+    '''
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault('sql_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(connection, cursor, statement, parameters, context, executemany):
+        started = connection.info['sql_started'].pop()
+        stats = _current.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.seconds += time.perf_counter() - started
+            stats.sql[statement] += 1
+
+
+def route_path(request):
+    route = request.scope.get('route')
+    return getattr(route, 'path', request.url.path)
+
+
+def server_timing(stats):
+    return f'db;dur={stats.seconds * 1000:.2f};desc="{stats.statements} statements"'
+
+
+async def sql_metrics_middleware(request, call_next):
+    '''
+    HTTP-middleware: собирает статистику SQL запроса, добавляет заголовок Server-Timing,
+    пишет JSON-строку в лог (SQL_LOG) и предупреждает о повторах одинакового SQL.
+    При SQL_BUDGET_ENFORCE превышение STATEMENT_BUDGETS приводит к StatementBudgetExceeded.
+    Выражения, выполненные при отдаче тела StreamingResponse, сюда не попадают.
+    '''
+    stats = RequestStats()
+    token = _current.set(stats)
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _current.reset(token)
+    path = route_path(request)
+    response.headers['Server-Timing'] = server_timing(stats)
+
+    repeated = stats.repeated()
+    if repeated:
+        logger.warning('possible N+1 in %s %s: %s', request.method, path, repeated)
+    if SQL_LOG:
+        logger.info(json.dumps({'method': request.method, 'route': path, 'status': response.status_code,
+                                'statements': stats.statements, 'db_ms': round(stats.seconds * 1000, 2),
+                                'total_ms': round((time.perf_counter() - started) * 1000, 2)}))
+    budget = STATEMENT_BUDGETS.get(path, DEFAULT_BUDGET)
+    if SQL_BUDGET_ENFORCE and stats.statements > budget:
+        raise StatementBudgetExceeded(f'{request.method} {path}: {stats.statements} SQL statements, budget {budget}')
+    return response
+
+
+def parse_server_timing(header):
+    '''
+    :param header: str - значение Server-Timing, выставленное sql_metrics_middleware
+    :return: (int, float) - число выражений и время в мс
+    '''
+    metric = dict(part.split('=', 1) for part in header.split(';')[1:])
+    return int(metric['desc'].strip('"').split()[0]), float(metric['dur'])
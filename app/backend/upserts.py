@@ -0,0 +1,59 @@
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from ..models.user_game_feedback import UserGameFeedback
+from ..models.user_game_rating import UserGameRating
+
+
+def rating_upsert_statement():
+    '''
+    :return: Insert
+    INSERT ... ON CONFLICT (user_id, game_id) DO UPDATE без значений - для executemany
+    '''
+    statement = sqlite_insert(UserGameRating)
+    return statement.on_conflict_do_update(index_elements=[UserGameRating.user_id, UserGameRating.game_id],
+                                           set_={'rating_int': statement.excluded.rating_int})
+
+
+def feedback_upsert_statement():
+    '''
+    :return: Insert
+    INSERT ... ON CONFLICT (user_id, game_id) DO UPDATE без значений - для executemany
+    '''
+    statement = sqlite_insert(UserGameFeedback)
+    return statement.on_conflict_do_update(index_elements=[UserGameFeedback.user_id, UserGameFeedback.game_id],
+                                           set_={'feedback_text': statement.excluded.feedback_text})
+
+
+def rating_upsert(user_id, game_id, rating_int):
+    '''
+    :return: Insert
+    Один INSERT ... ON CONFLICT (user_id, game_id) DO UPDATE: создаёт оценку или
+    перезаписывает уже поставленную пользователем оценку игры
+    '''
+    return rating_upsert_statement().values(user_id=user_id, game_id=game_id, rating_int=rating_int)
+
+
+def rating_insert_new(user_id, game_id, rating_int):
+    '''
+    :return: Insert
+    INSERT ... ON CONFLICT DO NOTHING: rowcount == 0, если оценка уже есть
+    '''
+    return (sqlite_insert(UserGameRating).values(user_id=user_id, game_id=game_id, rating_int=rating_int)
+            .on_conflict_do_nothing(index_elements=[UserGameRating.user_id, UserGameRating.game_id]))
+
+
+def feedback_upsert(user_id, game_id, feedback_text):
+    '''
+    :return: Insert
+    Один INSERT ... ON CONFLICT (user_id, game_id) DO UPDATE для отзыва
+    '''
+    return feedback_upsert_statement().values(user_id=user_id, game_id=game_id, feedback_text=feedback_text)
+
+
+def feedback_insert_new(user_id, game_id, feedback_text):
+    '''
+    :return: Insert
+    INSERT ... ON CONFLICT DO NOTHING: rowcount == 0, если отзыв уже есть
+    '''
+    return (sqlite_insert(UserGameFeedback).values(user_id=user_id, game_id=game_id, feedback_text=feedback_text)
+            .on_conflict_do_nothing(index_elements=[UserGameFeedback.user_id, UserGameFeedback.game_id]))
@@ -0,0 +1,45 @@
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .shards import on_shard, attached_shards
+from ..models.data_version import DataVersion
+
+# Счётчики изменений в data_versions: их увеличивают триггеры в той же транзакции, что и запись,
+# поэтому любое изменение из любого процесса видно всем воркерам. Производные таблицы хранят там же
+# версию, по которой построены, и пересчитываются, только если она отстала.
+RATINGS = 'user_game_ratings'    # триггеры агрегатов оценок (rating_stats.py)
+GAMES = 'games'                  # триггеры рейтинга на games (leaderboard.py)
+SIMILARITY = 'game_similarity'   # версия оценок, по которой построены соседи
+LEADERBOARD = 'game_leaderboard'
+
+
+def bump_sql(name):
+    # SQL для тела триггера
+    return (f"INSERT INTO data_versions (name, version) VALUES ('{name}', 1) "
+            f"ON CONFLICT (name) DO UPDATE SET version = version + 1;")
+
+
+def get_version(connection, name, shard=None):
+    '''
+    :param connection: Connection (синхронное)
+    :param shard: int | None - прочитать счётчик файла шарда
+    :return: int | None - None, если строки ещё нет (счётчик не увеличивался, таблица не строилась)
+    '''
+    return connection.scalar(on_shard(select(DataVersion.version).where(DataVersion.name == name), shard))
+
+
+def set_version(connection, name, version):
+    statement = sqlite_insert(DataVersion).values(name=name, version=version)
+    connection.execute(statement.on_conflict_do_update(index_elements=[DataVersion.name],
+                                                       set_={'version': statement.excluded.version}))
+
+
+def ratings_version(connection):
+    '''
+    :param connection: Connection (синхронное)
+    :return: int - версия всех оценок
+    При шардировании оценки меняют триггеры файлов шардов, у каждого свой счётчик. Версия - сумма
+    счётчиков основной базы и шардов: все они только растут, поэтому сумма меняется при любом изменении
+    (перешардирование поднимает счётчик основной базы выше прежней суммы, см. reshard)
+    '''
+    return sum(get_version(connection, RATINGS, shard) or 0 for shard in [None, *attached_shards(connection)])
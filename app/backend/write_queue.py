@@ -0,0 +1,158 @@
+import asyncio
+import logging
+
+from .config import WRITE_BATCH_SIZE, WRITE_BATCH_DELAY, WRITE_QUEUE_SIZE
+from .db import AsyncSessionLocal
+from .entity_cache import entity_cache
+from .shards import route, on_shard, by_shard
+from .upserts import rating_upsert, feedback_upsert, rating_upsert_statement, feedback_upsert_statement
+from ..models.user_game_rating import UserGameRating
+from ..models.user_game_feedback import UserGameFeedback
+
+logger = logging.getLogger(__name__)
+
+RATING = 'rating'
+FEEDBACK = 'feedback'
+STATEMENTS = {RATING: rating_upsert_statement, FEEDBACK: feedback_upsert_statement}
+MODELS = {RATING: UserGameRating, FEEDBACK: UserGameFeedback}
+
+
+class WriteQueue:
+    '''
+    Очередь upsert'ов оценок и отзывов с одной фоновой задачей-писателем.
+    Писатель забирает из очереди до max_batch записей (ждёт пополнения не дольше max_delay секунд)
+    и записывает их одной транзакцией через executemany; каждый submit завершается после COMMIT своей пачки.
+    Записи одной пары (user_id, game_id) выполняются в порядке поступления, последняя побеждает.
+    Если пачка не записалась (например, игру удалили), записи повторяются по одной, и ошибку
+    получает только тот, чья запись её вызвала. Очередь своя у каждого процесса.
+    '''
+
+    def __init__(self, max_batch=WRITE_BATCH_SIZE, max_delay=WRITE_BATCH_DELAY, max_size=WRITE_QUEUE_SIZE):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_size = max_size
+        self._queue = None
+        self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None
+
+    def start(self):
+        # очередь создаётся в работающем event loop (lifespan)
+        self._queue = asyncio.Queue(self.max_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # всё, что уже в очереди, записывается до остановки
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, kind, values):
+        '''
+        :param kind: RATING | FEEDBACK
+        :param values: dict - значения колонок (user_id, game_id, rating_int / feedback_text)
+        Корутина ждёт, пока запись будет закоммичена; при переполненной очереди - пока в ней не освободится место
+        '''
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((kind, values, future))
+        await future
+
+    async def _next_batch(self):
+        item = await self._queue.get()
+        if item is None:
+            return [], True
+        batch = [item]
+        deadline = asyncio.get_running_loop().time() + self.max_delay
+        while len(batch) < self.max_batch:
+            timeout = deadline - asyncio.get_running_loop().time()
+            try:
+                item = self._queue.get_nowait() if timeout <= 0 else await asyncio.wait_for(self._queue.get(), timeout)
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = await self._next_batch()
+            if not batch:
+                continue
+            try:
+                await self._write(batch)
+            except Exception:
+                logger.warning('batch of %s writes failed, retrying one by one', len(batch), exc_info=True)
+                for item in batch:
+                    await self._write_one(item)
+                continue
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+
+    async def _write(self, batch):
+        written = {}
+        async with AsyncSessionLocal() as db:
+            for kind, statement in STATEMENTS.items():
+                rows = [values for item_kind, values, _ in batch if item_kind == kind]
+                model = MODELS[kind]
+                # при шардировании - по executemany на каждый затронутый шард
+                for shard, shard_rows in by_shard(rows).items():
+                    ids = (await db.scalars(on_shard(statement().returning(model.id), shard), shard_rows)).all()
+                    written.setdefault(model, []).extend(ids)
+            await db.commit()
+        # перезаписанные оценки и отзывы убираются из кэша записей до того, как submit вернёт управление
+        for model, ids in written.items():
+            await entity_cache.invalidate(model, *ids)
+
+    async def _write_one(self, item):
+        _, _, future = item
+        try:
+            await self._write([item])
+        except Exception as error:
+            if not future.done():
+                future.set_exception(error)
+        else:
+            if not future.done():
+                future.set_result(None)
+
+
+write_queue = WriteQueue()
+
+
+async def release(db):
+    # Запрос ждёт коммита пачки без соединения: иначе тысячи ждущих запросов держали бы все соединения
+    # пула, и писателю было бы не из чего взять своё. Сессия вернёт соединение в пул, закончив транзакцию
+    await db.commit()
+
+
+async def save_rating(db, user_id, game_id, rating_int):
+    '''
+    :param db: AsyncSession
+    Функция создаёт или перезаписывает оценку: через очередь, если она запущена, иначе своей транзакцией
+    '''
+    if write_queue.running:
+        await release(db)
+        await write_queue.submit(RATING, {'user_id': user_id, 'game_id': game_id, 'rating_int': rating_int})
+        return
+    rating_id = await db.scalar(route(rating_upsert(user_id, game_id, rating_int).returning(UserGameRating.id), game_id))
+    await db.commit()
+    await entity_cache.invalidate(UserGameRating, rating_id)
+
+
+async def save_feedback(db, user_id, game_id, feedback_text):
+    '''
+    :param db: AsyncSession
+    Функция создаёт или перезаписывает отзыв: через очередь, если она запущена, иначе своей транзакцией
+    '''
+    if write_queue.running:
+        await release(db)
+        await write_queue.submit(FEEDBACK, {'user_id': user_id, 'game_id': game_id, 'feedback_text': feedback_text})
+        return
+    feedback_id = await db.scalar(route(feedback_upsert(user_id, game_id, feedback_text).returning(UserGameFeedback.id),
+                                        game_id))
+    await db.commit()
+    await entity_cache.invalidate(UserGameFeedback, feedback_id)
@@ -23,8 +23,20 @@ from app.models.game import Game
 from app.models.user import User
 from app.models.user_game_rating import UserGameRating
 from app.models.user_game_feedback import UserGameFeedback
+from app.models.game_rating_stats import GameRatingStats
+from app.models.game_similarity import GameSimilarity
+from app.models.game_leaderboard import GameLeaderboard
+from app.models.data_version import DataVersion
 target_metadata = Base.metadata
 
+
+def include_object(object, name, type_, reflected, compare_to):
+    # FTS5-индексы поиска и их служебные таблицы создаются миграцией вручную,
+    # autogenerate не должен предлагать их удалить
+    if type_ == 'table' and reflected and compare_to is None and '_fts' in name:
+        return False
+    return True
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -47,6 +59,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -70,7 +83,8 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata,
+            include_object=include_object,
         )
 
         with context.begin_transaction():
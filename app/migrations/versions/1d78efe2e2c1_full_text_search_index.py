@@ -0,0 +1,62 @@
+"""Full-text search index
+
+Revision ID: 1d78efe2e2c1
+Revises: 931d3fa4a18d
+Create Date: 2026-10-18 13:23:38.633503
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1d78efe2e2c1'
+down_revision: Union[str, None] = '931d3fa4a18d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# unicode61 не считает «ё» и «е» одной буквой, поэтому индексируется текст с заменой ё -> е
+TOKENIZE = "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'"
+INDEXES = [
+    # (таблица, представление-источник, колонки, веса bm25)
+    ('games', 'games_search', ['title', 'description'], '10.0, 1.0'),
+    ('user_game_feedback', 'user_game_feedback_search', ['feedback_text'], '1.0'),
+]
+
+
+def _fold(column):
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def upgrade() -> None:
+    for table, source, columns, weights in INDEXES:
+        fts = f'{table}_fts'
+        names = ', '.join(columns)
+        new = ', '.join(_fold(f'NEW.{column}') for column in columns)
+        old = ', '.join(_fold(f'OLD.{column}') for column in columns)
+        op.execute(f'CREATE VIEW {source} AS SELECT id, {", ".join(f"{_fold(c)} AS {c}" for c in columns)} '
+                   f'FROM {table}')
+        op.execute(f"CREATE VIRTUAL TABLE {fts} USING fts5({names}, content = '{source}', "
+                   f"content_rowid = 'id', {TOKENIZE})")
+        op.execute(f"INSERT INTO {fts} ({fts}, rank) VALUES ('rank', 'bm25({weights})')")
+        op.execute(f'CREATE TRIGGER trg_{fts}_insert AFTER INSERT ON {table} '
+                   f'BEGIN INSERT INTO {fts} (rowid, {names}) VALUES (NEW.id, {new}); END')
+        op.execute(f'CREATE TRIGGER trg_{fts}_update AFTER UPDATE OF {names} ON {table} '
+                   f"BEGIN INSERT INTO {fts} ({fts}, rowid, {names}) VALUES ('delete', OLD.id, {old}); "
+                   f'INSERT INTO {fts} (rowid, {names}) VALUES (NEW.id, {new}); END')
+        op.execute(f'CREATE TRIGGER trg_{fts}_delete AFTER DELETE ON {table} '
+                   f"BEGIN INSERT INTO {fts} ({fts}, rowid, {names}) VALUES ('delete', OLD.id, {old}); END")
+        # заполняем индекс существующими данными
+        op.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    for table, source, columns, weights in reversed(INDEXES):
+        fts = f'{table}_fts'
+        for trigger in ('delete', 'update', 'insert'):
+            op.execute(f'DROP TRIGGER IF EXISTS trg_{fts}_{trigger}')
+        op.execute(f'DROP TABLE IF EXISTS {fts}')
+        op.execute(f'DROP VIEW IF EXISTS {source}')
@@ -0,0 +1,84 @@
+"""Data version counters
+
+Revision ID: 4d26326b49a6
+Revises: 745c3f1590e1
+Create Date: 2026-10-18 16:12:40.318266
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4d26326b49a6'
+down_revision: Union[str, None] = '745c3f1590e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SCORES = range(0, 11)
+COLUMNS = ', '.join(f'score_{score}' for score in SCORES)
+PRIOR_WEIGHT = 5
+DEFAULT_PRIOR = 5
+
+
+def _bump(name):
+    return (f"INSERT INTO data_versions (name, version) VALUES ('{name}', 1) "
+            f"ON CONFLICT (name) DO UPDATE SET version = version + 1;")
+
+
+def _add_sql(row, sign):
+    # как в 745c3f1590e1: строка агрегатов создаётся только для существующей игры
+    zeros = ', '.join('0' for _ in SCORES)
+    histogram = ', '.join(f'score_{score} = score_{score} {sign} ({row}.rating_int = {score})' for score in SCORES)
+    return (f'INSERT INTO game_rating_stats (game_id, count, total, {COLUMNS}) '
+            f'SELECT id, 0, 0, {zeros} FROM games WHERE id = {row}.game_id AND {row}.rating_int IS NOT NULL '
+            f'AND NOT EXISTS (SELECT 1 FROM game_rating_stats WHERE game_id = {row}.game_id); '
+            f'UPDATE game_rating_stats SET count = count {sign} 1, total = total {sign} {row}.rating_int, {histogram} '
+            f'WHERE game_id = {row}.game_id AND {row}.rating_int IS NOT NULL;')
+
+
+def _refresh_sql(game_id):
+    # как в b46de260acab
+    votes = f'COALESCE((SELECT count FROM game_rating_stats WHERE game_id = {game_id}), 0)'
+    total = f'COALESCE((SELECT total FROM game_rating_stats WHERE game_id = {game_id}), 0)'
+    prior = f'COALESCE((SELECT rating FROM games WHERE id = {game_id}), {DEFAULT_PRIOR})'
+    return (f'INSERT INTO game_leaderboard (game_id, votes, score) SELECT id, 0, 0 FROM games '
+            f'WHERE id = {game_id} AND NOT EXISTS (SELECT 1 FROM game_leaderboard WHERE game_id = {game_id}); '
+            f'UPDATE game_leaderboard SET votes = {votes}, '
+            f'score = ({PRIOR_WEIGHT} * {prior} + {total}) * 1.0 / ({PRIOR_WEIGHT} + {votes}) '
+            f'WHERE game_id = {game_id};')
+
+
+def _triggers(ratings_bump, games_bump):
+    # триггеры агрегатов оценок и рейтинга на games пересоздаются с увеличением счётчиков (или без него)
+    for name in ('rating_stats_insert', 'rating_stats_update', 'rating_stats_delete',
+                 'leaderboard_game_insert', 'leaderboard_game_update', 'leaderboard_game_delete'):
+        op.execute(f'DROP TRIGGER IF EXISTS trg_{name}')
+    op.execute(f'CREATE TRIGGER trg_rating_stats_insert AFTER INSERT ON user_game_ratings '
+               f'BEGIN {_add_sql("NEW", "+")} {ratings_bump} END')
+    op.execute(f'CREATE TRIGGER trg_rating_stats_update AFTER UPDATE OF game_id, rating_int ON user_game_ratings '
+               f'BEGIN {_add_sql("OLD", "-")} {_add_sql("NEW", "+")} {ratings_bump} END')
+    op.execute(f'CREATE TRIGGER trg_rating_stats_delete AFTER DELETE ON user_game_ratings '
+               f'BEGIN {_add_sql("OLD", "-")} {ratings_bump} END')
+    op.execute(f'CREATE TRIGGER trg_leaderboard_game_insert AFTER INSERT ON games '
+               f'BEGIN {_refresh_sql("NEW.id")} {games_bump} END')
+    op.execute(f'CREATE TRIGGER trg_leaderboard_game_update AFTER UPDATE OF rating ON games '
+               f'BEGIN {_refresh_sql("NEW.id")} {games_bump} END')
+    op.execute(f'CREATE TRIGGER trg_leaderboard_game_delete AFTER DELETE ON games '
+               f'BEGIN DELETE FROM game_leaderboard WHERE game_id = OLD.id; {games_bump} END')
+
+
+def upgrade() -> None:
+    op.create_table('data_versions',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    _triggers(_bump('user_game_ratings'), _bump('games'))
+
+
+def downgrade() -> None:
+    _triggers('', '')
+    op.drop_table('data_versions')
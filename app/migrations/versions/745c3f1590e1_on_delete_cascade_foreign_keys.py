@@ -0,0 +1,100 @@
+"""On delete cascade foreign keys
+
+Revision ID: 745c3f1590e1
+Revises: b46de260acab
+Create Date: 2026-10-18 13:45:43.505288
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '745c3f1590e1'
+down_revision: Union[str, None] = 'b46de260acab'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# в SQLite внешние ключи безымянные: имена задаются соглашением, чтобы batch-режим мог их пересоздать
+NAMING_CONVENTION = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+FOREIGN_KEYS = {
+    # таблица: [(колонка, родительская таблица)]
+    'user_game_ratings': [('user_id', 'users'), ('game_id', 'games')],
+    'user_game_feedback': [('user_id', 'users'), ('game_id', 'games')],
+    'game_rating_stats': [('game_id', 'games')],
+    'game_similarity': [('game_id', 'games'), ('similar_game_id', 'games')],
+    'game_leaderboard': [('game_id', 'games')],
+}
+
+SCORES = range(0, 11)
+COLUMNS = ', '.join(f'score_{score}' for score in SCORES)
+
+
+def _add_sql(row, sign, source):
+    # как в a19833c7fae9, но строка агрегатов создаётся по source: после каскадного удаления игры
+    # триггер на удаление её оценок не должен вставлять агрегаты несуществующей игры
+    zeros = ', '.join('0' for _ in SCORES)
+    histogram = ', '.join(f'score_{score} = score_{score} {sign} ({row}.rating_int = {score})' for score in SCORES)
+    return (f'INSERT INTO game_rating_stats (game_id, count, total, {COLUMNS}) '
+            f'{source(row, zeros)} AND {row}.rating_int IS NOT NULL '
+            f'AND NOT EXISTS (SELECT 1 FROM game_rating_stats WHERE game_id = {row}.game_id); '
+            f'UPDATE game_rating_stats SET count = count {sign} 1, total = total {sign} {row}.rating_int, {histogram} '
+            f'WHERE game_id = {row}.game_id AND {row}.rating_int IS NOT NULL;')
+
+
+def _existing_game(row, zeros):
+    return f'SELECT id, 0, 0, {zeros} FROM games WHERE id = {row}.game_id'
+
+
+def _any_game(row, zeros):
+    return f'SELECT {row}.game_id, 0, 0, {zeros} WHERE {row}.game_id IS NOT NULL'
+
+
+def _stats_triggers(source):
+    op.execute('DROP TRIGGER IF EXISTS trg_rating_stats_insert')
+    op.execute('DROP TRIGGER IF EXISTS trg_rating_stats_update')
+    op.execute('DROP TRIGGER IF EXISTS trg_rating_stats_delete')
+    op.execute(f'CREATE TRIGGER trg_rating_stats_insert AFTER INSERT ON user_game_ratings '
+               f'BEGIN {_add_sql("NEW", "+", source)} END')
+    op.execute(f'CREATE TRIGGER trg_rating_stats_update AFTER UPDATE OF game_id, rating_int ON user_game_ratings '
+               f'BEGIN {_add_sql("OLD", "-", source)} {_add_sql("NEW", "+", source)} END')
+    op.execute(f'CREATE TRIGGER trg_rating_stats_delete AFTER DELETE ON user_game_ratings '
+               f'BEGIN {_add_sql("OLD", "-", source)} END')
+
+
+def _rebuild(ondelete):
+    # Таблица пересоздаётся копированием (ALTER TABLE в SQLite не меняет внешние ключи), а вместе со старой таблицей
+    # удаляются её триггеры; переименование новой таблицы к тому же проверяет все представления и триггеры схемы.
+    # Поэтому все триггеры и представления снимаются заранее и создаются заново по сохранённому SQL
+    connection = op.get_bind()
+    schema = connection.execute(sa.text("SELECT type, name, sql FROM sqlite_master "
+                                        "WHERE type IN ('trigger', 'view') AND sql IS NOT NULL")).all()
+    for type_, name, _ in sorted(schema, key=lambda row: row.type != 'trigger'):
+        op.execute(f'DROP {type_.upper()} {name}')
+
+    for table, keys in FOREIGN_KEYS.items():
+        with op.batch_alter_table(table, recreate='always', naming_convention=NAMING_CONVENTION) as batch_op:
+            for column, parent in keys:
+                name = f'fk_{table}_{column}_{parent}'
+                batch_op.drop_constraint(name, type_='foreignkey')
+                batch_op.create_foreign_key(name, parent, [column], ['id'], ondelete=ondelete)
+
+    for _, _, sql in sorted(schema, key=lambda row: row.type != 'view'):
+        op.execute(sql)
+
+
+def upgrade() -> None:
+    # строки, оставшиеся от прежних удалений по частям; триггеры ещё на месте и поправят агрегаты
+    for table, keys in FOREIGN_KEYS.items():
+        orphan = ' OR '.join(f'{column} NOT IN (SELECT id FROM {parent})' for column, parent in keys)
+        op.execute(f'DELETE FROM {table} WHERE {orphan}')
+    _rebuild('CASCADE')
+    _stats_triggers(_existing_game)
+
+
+def downgrade() -> None:
+    _stats_triggers(_any_game)
+    _rebuild(None)
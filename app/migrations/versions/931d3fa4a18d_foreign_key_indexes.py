@@ -0,0 +1,32 @@
+"""Foreign key indexes
+
+Revision ID: 931d3fa4a18d
+Revises: a19833c7fae9
+Create Date: 2026-10-18 12:21:54.640137
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '931d3fa4a18d'
+down_revision: Union[str, None] = 'a19833c7fae9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # поиск по user_id уже покрывается уникальным индексом (user_id, game_id)
+    op.create_index(op.f('ix_user_game_ratings_game_id'), 'user_game_ratings', ['game_id'], unique=False)
+    op.create_index(op.f('ix_user_game_feedback_game_id'), 'user_game_feedback', ['game_id'], unique=False)
+    # вход и регистрация ищут пользователя по логину
+    op.create_index(op.f('ix_users_username'), 'users', ['username'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_users_username'), table_name='users')
+    op.drop_index(op.f('ix_user_game_feedback_game_id'), table_name='user_game_feedback')
+    op.drop_index(op.f('ix_user_game_ratings_game_id'), table_name='user_game_ratings')
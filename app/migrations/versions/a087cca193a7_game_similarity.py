@@ -0,0 +1,34 @@
+"""Game similarity
+
+Revision ID: a087cca193a7
+Revises: 1d78efe2e2c1
+Create Date: 2026-10-18 13:27:58.713685
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a087cca193a7'
+down_revision: Union[str, None] = '1d78efe2e2c1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # таблица заполняется командой python manage.py build-similar-games или фоновой задачей приложения
+    op.create_table('game_similarity',
+    sa.Column('game_id', sa.Integer(), nullable=False),
+    sa.Column('similar_game_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['game_id'], ['games.id'], ),
+    sa.ForeignKeyConstraint(['similar_game_id'], ['games.id'], ),
+    sa.PrimaryKeyConstraint('game_id', 'similar_game_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('game_similarity')
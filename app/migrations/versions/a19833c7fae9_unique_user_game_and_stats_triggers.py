@@ -0,0 +1,63 @@
+"""Unique user/game pairs and rating stats triggers
+
+Revision ID: a19833c7fae9
+Revises: ff04b1ae4700
+Create Date: 2026-10-18 11:03:27.905512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a19833c7fae9'
+down_revision: Union[str, None] = 'ff04b1ae4700'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SCORES = range(0, 11)
+COLUMNS = ', '.join(f'score_{score}' for score in SCORES)
+
+
+def _add_sql(row, sign):
+    zeros = ', '.join('0' for _ in SCORES)
+    histogram = ', '.join(f'score_{score} = score_{score} {sign} ({row}.rating_int = {score})' for score in SCORES)
+    return (f'INSERT INTO game_rating_stats (game_id, count, total, {COLUMNS}) '
+            f'SELECT {row}.game_id, 0, 0, {zeros} WHERE {row}.game_id IS NOT NULL AND {row}.rating_int IS NOT NULL '
+            f'AND NOT EXISTS (SELECT 1 FROM game_rating_stats WHERE game_id = {row}.game_id); '
+            f'UPDATE game_rating_stats SET count = count {sign} 1, total = total {sign} {row}.rating_int, {histogram} '
+            f'WHERE game_id = {row}.game_id AND {row}.rating_int IS NOT NULL;')
+
+
+def upgrade() -> None:
+    # перед созданием уникальных индексов оставляем только последнюю запись для каждой пары
+    op.execute('DELETE FROM user_game_ratings WHERE id NOT IN '
+               '(SELECT MAX(id) FROM user_game_ratings GROUP BY user_id, game_id)')
+    op.execute('DELETE FROM user_game_feedback WHERE id NOT IN '
+               '(SELECT MAX(id) FROM user_game_feedback GROUP BY user_id, game_id)')
+    op.create_index('ix_user_game_ratings_user_id_game_id', 'user_game_ratings', ['user_id', 'game_id'], unique=True)
+    op.create_index('ix_user_game_feedback_user_id_game_id', 'user_game_feedback', ['user_id', 'game_id'], unique=True)
+
+    # агрегаты game_rating_stats теперь поддерживаются триггерами
+    op.execute(f'CREATE TRIGGER trg_rating_stats_insert AFTER INSERT ON user_game_ratings '
+               f'BEGIN {_add_sql("NEW", "+")} END')
+    op.execute(f'CREATE TRIGGER trg_rating_stats_update AFTER UPDATE OF game_id, rating_int ON user_game_ratings '
+               f'BEGIN {_add_sql("OLD", "-")} {_add_sql("NEW", "+")} END')
+    op.execute(f'CREATE TRIGGER trg_rating_stats_delete AFTER DELETE ON user_game_ratings '
+               f'BEGIN {_add_sql("OLD", "-")} END')
+
+    histogram = ', '.join(f'SUM(CASE WHEN rating_int = {score} THEN 1 ELSE 0 END)' for score in SCORES)
+    op.execute('DELETE FROM game_rating_stats')
+    op.execute(f'INSERT INTO game_rating_stats (game_id, count, total, {COLUMNS}) '
+               f'SELECT game_id, COUNT(*), SUM(rating_int), {histogram} FROM user_game_ratings '
+               f'WHERE game_id IS NOT NULL AND rating_int IS NOT NULL GROUP BY game_id')
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER IF EXISTS trg_rating_stats_delete')
+    op.execute('DROP TRIGGER IF EXISTS trg_rating_stats_update')
+    op.execute('DROP TRIGGER IF EXISTS trg_rating_stats_insert')
+    op.drop_index('ix_user_game_feedback_user_id_game_id', table_name='user_game_feedback')
+    op.drop_index('ix_user_game_ratings_user_id_game_id', table_name='user_game_ratings')
@@ -0,0 +1,70 @@
+"""Game leaderboard
+
+Revision ID: b46de260acab
+Revises: a087cca193a7
+Create Date: 2026-10-18 13:29:31.877206
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b46de260acab'
+down_revision: Union[str, None] = 'a087cca193a7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PRIOR_WEIGHT = 5
+DEFAULT_PRIOR = 5
+
+
+def _refresh_sql(game_id):
+    votes = f'COALESCE((SELECT count FROM game_rating_stats WHERE game_id = {game_id}), 0)'
+    total = f'COALESCE((SELECT total FROM game_rating_stats WHERE game_id = {game_id}), 0)'
+    prior = f'COALESCE((SELECT rating FROM games WHERE id = {game_id}), {DEFAULT_PRIOR})'
+    return (f'INSERT INTO game_leaderboard (game_id, votes, score) SELECT id, 0, 0 FROM games '
+            f'WHERE id = {game_id} AND NOT EXISTS (SELECT 1 FROM game_leaderboard WHERE game_id = {game_id}); '
+            f'UPDATE game_leaderboard SET votes = {votes}, '
+            f'score = ({PRIOR_WEIGHT} * {prior} + {total}) * 1.0 / ({PRIOR_WEIGHT} + {votes}) '
+            f'WHERE game_id = {game_id};')
+
+
+def upgrade() -> None:
+    op.create_table('game_leaderboard',
+    sa.Column('game_id', sa.Integer(), nullable=False),
+    sa.Column('votes', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['game_id'], ['games.id'], ),
+    sa.PrimaryKeyConstraint('game_id')
+    )
+    op.create_index('ix_game_leaderboard_score_game_id', 'game_leaderboard', ['score', 'game_id'], unique=False)
+
+    op.execute(f'CREATE TRIGGER trg_leaderboard_stats_insert AFTER INSERT ON game_rating_stats '
+               f'BEGIN {_refresh_sql("NEW.game_id")} END')
+    op.execute(f'CREATE TRIGGER trg_leaderboard_stats_update AFTER UPDATE OF count, total ON game_rating_stats '
+               f'BEGIN {_refresh_sql("NEW.game_id")} END')
+    op.execute(f'CREATE TRIGGER trg_leaderboard_stats_delete AFTER DELETE ON game_rating_stats '
+               f'BEGIN {_refresh_sql("OLD.game_id")} END')
+    op.execute(f'CREATE TRIGGER trg_leaderboard_game_insert AFTER INSERT ON games '
+               f'BEGIN {_refresh_sql("NEW.id")} END')
+    op.execute(f'CREATE TRIGGER trg_leaderboard_game_update AFTER UPDATE OF rating ON games '
+               f'BEGIN {_refresh_sql("NEW.id")} END')
+    op.execute('CREATE TRIGGER trg_leaderboard_game_delete AFTER DELETE ON games '
+               'BEGIN DELETE FROM game_leaderboard WHERE game_id = OLD.id; END')
+
+    # заполняем рейтинг по уже существующим играм и оценкам
+    op.execute('INSERT INTO game_leaderboard (game_id, votes, score) '
+               'SELECT games.id, COALESCE(game_rating_stats.count, 0), '
+               f'({PRIOR_WEIGHT} * COALESCE(games.rating, {DEFAULT_PRIOR}) + COALESCE(game_rating_stats.total, 0)) '
+               f'* 1.0 / ({PRIOR_WEIGHT} + COALESCE(game_rating_stats.count, 0)) '
+               'FROM games LEFT JOIN game_rating_stats ON game_rating_stats.game_id = games.id')
+
+
+def downgrade() -> None:
+    for trigger in ('game_delete', 'game_update', 'game_insert', 'stats_delete', 'stats_update', 'stats_insert'):
+        op.execute(f'DROP TRIGGER IF EXISTS trg_leaderboard_{trigger}')
+    op.drop_index('ix_game_leaderboard_score_game_id', table_name='game_leaderboard')
+    op.drop_table('game_leaderboard')
@@ -0,0 +1,41 @@
+"""Game rating stats
+
+Revision ID: ff04b1ae4700
+Revises: 2cd14cb836d1
+Create Date: 2026-10-18 10:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'ff04b1ae4700'
+down_revision: Union[str, None] = '2cd14cb836d1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SCORES = range(0, 11)
+
+
+def upgrade() -> None:
+    op.create_table('game_rating_stats',
+    sa.Column('game_id', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    *[sa.Column(f'score_{score}', sa.Integer(), nullable=False) for score in SCORES],
+    sa.ForeignKeyConstraint(['game_id'], ['games.id'], ),
+    sa.PrimaryKeyConstraint('game_id')
+    )
+    # заполняем агрегаты по уже существующим оценкам
+    histogram = ', '.join(f'SUM(CASE WHEN rating_int = {score} THEN 1 ELSE 0 END)' for score in SCORES)
+    columns = ', '.join(f'score_{score}' for score in SCORES)
+    op.execute(f'INSERT INTO game_rating_stats (game_id, count, total, {columns}) '
+               f'SELECT game_id, COUNT(*), SUM(rating_int), {histogram} FROM user_game_ratings '
+               f'WHERE game_id IS NOT NULL AND rating_int IS NOT NULL GROUP BY game_id')
+
+
+def downgrade() -> None:
+    op.drop_table('game_rating_stats')
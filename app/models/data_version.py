@@ -0,0 +1,12 @@
+from app.backend.db import Base
+from sqlalchemy import Column, Integer, String
+from app.models import *
+
+
+class DataVersion(Base):
+    __tablename__ = 'data_versions'
+    __table_args__ = {'keep_existing': True}
+    # счётчик изменений таблицы (его увеличивают триггеры) или версия данных, по которой построена
+    # производная таблица (game_similarity, game_leaderboard)
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
@@ -14,8 +14,11 @@ class Game(Base):
     price = Column(Float)
     feedback = Column(String)
     slug = Column(String, unique=True, index=True)
+    # дочерние строки удаляет сама база (ON DELETE CASCADE), ORM их перед удалением не загружает
     game_ratings = relationship('UserGameRating',
-                                back_populates='send_to_game')
+                                back_populates='send_to_game', passive_deletes=True)
     game_feedbacks = relationship('UserGameFeedback',
-                                  back_populates='send_to_game')
+                                  back_populates='send_to_game', passive_deletes=True)
+    # агрегаты пишут триггеры (app/backend/rating_stats.py), поэтому связь только для чтения
+    rating_stats = relationship('GameRatingStats', uselist=False, viewonly=True)
 
@@ -0,0 +1,13 @@
+from app.backend.db import Base
+from sqlalchemy import Column, ForeignKey, Integer, Float, Index
+from app.models import *
+
+
+class GameLeaderboard(Base):
+    __tablename__ = 'game_leaderboard'
+    # индекс (score, game_id) отдаёт страницу рейтинга без сортировки всей таблицы
+    __table_args__ = (Index('ix_game_leaderboard_score_game_id', 'score', 'game_id'),
+                      {'keep_existing': True})
+    game_id = Column(Integer, ForeignKey('games.id', ondelete='CASCADE'), primary_key=True)
+    votes = Column(Integer, nullable=False, default=0)
+    score = Column(Float, nullable=False)
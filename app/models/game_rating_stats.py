@@ -0,0 +1,25 @@
+from app.backend.db import Base
+from sqlalchemy import Column, ForeignKey, Integer
+from app.models import *
+
+RATING_MIN = 0
+RATING_MAX = 10
+
+
+class GameRatingStats(Base):
+    __tablename__ = 'game_rating_stats'
+    __table_args__ = {'keep_existing': True}
+    game_id = Column(Integer, ForeignKey('games.id', ondelete='CASCADE'), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    total = Column(Integer, nullable=False, default=0)
+    score_0 = Column(Integer, nullable=False, default=0)
+    score_1 = Column(Integer, nullable=False, default=0)
+    score_2 = Column(Integer, nullable=False, default=0)
+    score_3 = Column(Integer, nullable=False, default=0)
+    score_4 = Column(Integer, nullable=False, default=0)
+    score_5 = Column(Integer, nullable=False, default=0)
+    score_6 = Column(Integer, nullable=False, default=0)
+    score_7 = Column(Integer, nullable=False, default=0)
+    score_8 = Column(Integer, nullable=False, default=0)
+    score_9 = Column(Integer, nullable=False, default=0)
+    score_10 = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,12 @@
+from app.backend.db import Base
+from sqlalchemy import Column, ForeignKey, Integer, Float
+from app.models import *
+
+
+class GameSimilarity(Base):
+    __tablename__ = 'game_similarity'
+    __table_args__ = {'keep_existing': True}
+    # первичный ключ (game_id, similar_game_id) покрывает выборку соседей игры
+    game_id = Column(Integer, ForeignKey('games.id', ondelete='CASCADE'), primary_key=True)
+    similar_game_id = Column(Integer, ForeignKey('games.id', ondelete='CASCADE'), primary_key=True)
+    score = Column(Float, nullable=False)
@@ -7,15 +7,17 @@ class User(Base):
     __tablename__ = 'users'
     __table_args__ = {'keep_existing': True}
     id = Column(Integer, primary_key=True, index=True)
-    username = Column(String, unique=True)
+    username = Column(String, unique=True, index=True)
     firstname = Column(String)
     lastname = Column(String)
     password = Column(String, unique=True)
     slug = Column(String, unique=True, index=True)
 
-    user_ratings = relationship('UserGameRating',
-                                back_populates='send_to_user')
-    user_feedbacks = relationship('UserGameFeedback',
-                                  back_populates='send_to_user')
+    # дочерние строки удаляет сама база (ON DELETE CASCADE), ORM их перед удалением не загружает.
+    # order_by: при шардировании строки пользователя собираются из нескольких шардов, порядок задаётся явно
+    user_ratings = relationship('UserGameRating', order_by='UserGameRating.id',
+                                back_populates='send_to_user', passive_deletes=True)
+    user_feedbacks = relationship('UserGameFeedback', order_by='UserGameFeedback.id',
+                                  back_populates='send_to_user', passive_deletes=True)
 
 
@@ -1,14 +1,15 @@
 from app.backend.db import Base
-from sqlalchemy import Column, ForeignKey, Integer, String, Boolean
+from sqlalchemy import Column, ForeignKey, Integer, String, Boolean, Index
 from sqlalchemy.orm import relationship
 from app.models import *
 
 class UserGameRating(Base):
     __tablename__ = 'user_game_ratings'
-    __table_args__ = {'keep_existing': True}
+    __table_args__ = (Index('ix_user_game_ratings_user_id_game_id', 'user_id', 'game_id', unique=True),
+                      {'keep_existing': True})
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey('users.id'))
-    game_id = Column(Integer, ForeignKey('games.id'))
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'))
+    game_id = Column(Integer, ForeignKey('games.id', ondelete='CASCADE'), index=True)
     rating_int = Column(Integer)
     send_to_game = relationship('Game',
                                back_populates='game_ratings')
@@ -1,15 +1,30 @@
-from fastapi import APIRouter, Depends, status, HTTPException
+from fastapi import APIRouter, Depends, status, HTTPException, Query, UploadFile, BackgroundTasks
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..backend.db_depends import get_db
-
-from typing import Annotated
+from ..backend.rating_stats import stats_to_dict
+from ..backend.bulk_import import import_upload
+from ..backend.page_cache import page_cache, LIST_GAME, game_key, user_key
+from ..backend.entity_cache import entity_cache
+from ..backend.pagination import keyset_page, ndjson_response, columns_select, PAGE_LIMIT, PAGE_LIMIT_MAX
+from ..backend.recommendations import similar_games_query
+from ..backend.leaderboard import top_page, TOP_LIMIT, TOP_LIMIT_MAX
+from ..backend.config import SIMILAR_TOP_K
+from ..backend.loaders import Loaders, get_loaders, batch_response, BATCH_LIMIT
+from ..backend.details import game_details
+from ..backend.purge import purge, count_children, delete_shard_children
+from ..backend.config import PURGE_THRESHOLD
+
+from typing import Annotated, Literal
 
 from ..models.game import Game
 from ..models.user_game_feedback import UserGameFeedback
 from ..models.user_game_rating import UserGameRating
-from ..schemas import CreateGame, UpdateGame
+from ..models.game_rating_stats import GameRatingStats
+from ..models.game_similarity import GameSimilarity
+from ..schemas import (CreateGame, UpdateGame, ReadGame, ReadRating, ReadFeedback, RatingStats, SimilarGame,
+                       TopPage, Page, Batch, GameFull)
 
 from sqlalchemy import insert, select, update, delete
 
@@ -20,75 +35,149 @@ from fastapi import APIRouter
 router_game = APIRouter(prefix='/game', tags=['game'])
 
 
-@router_game.get('/all_games')
-async def all_games(db: Annotated[Session, Depends(get_db)]):
-    games = db.scalars(select(Game)).all()
-    return games
+@router_game.get('/all_games', response_model=Page[ReadGame])
+async def all_games(db: Annotated[AsyncSession, Depends(get_db)],
+                    limit: int = Query(PAGE_LIMIT, ge=1, le=PAGE_LIMIT_MAX),
+                    after: int | None = None, stream: bool = False):
+    if stream:
+        return ndjson_response(Game, after)
+    return await keyset_page(db, Game, limit, after)
+
+
+@router_game.get('/top', response_model=TopPage)
+async def top_games(db: Annotated[AsyncSession, Depends(get_db)],
+                    limit: int = Query(TOP_LIMIT, ge=1, le=TOP_LIMIT_MAX),
+                    offset: int = Query(0, ge=0)):
+    # рейтинг заранее посчитан в game_leaderboard (app/backend/leaderboard.py)
+    return await top_page(db, limit, offset)
+
+
+@router_game.get('/batch', response_model=Batch[ReadGame])
+async def games_batch(loaders: Annotated[Loaders, Depends(get_loaders)],
+                      ids: str = Query(..., description=f'id игр через запятую, не больше {BATCH_LIMIT}')):
+    return await batch_response(loaders.games, ids)
 
 
-@router_game.get('/game_id')
-async def game_by_id(db: Annotated[Session, Depends(get_db)], game_id: int):
-    game = db.scalar(select(Game).where(Game.id == game_id))
+@router_game.get('/game_id', response_model=ReadGame)
+async def game_by_id(db: Annotated[AsyncSession, Depends(get_db)], game_id: int):
+    game = await entity_cache.get(db, Game, game_id)
     if game is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
     return game
 
 
+@router_game.get('/game_id/full', response_model=GameFull)
+async def game_full_by_id(db: Annotated[AsyncSession, Depends(get_db)], game_id: int):
+    # игра с агрегатами, оценками и отзывами вместе с авторами - те же три запроса, что и у страницы игры
+    details = await game_details(db, game_id)
+    if details['game'] is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
+    return details
+
+
 @router_game.post('/create')
-async def create_game(db: Annotated[Session, Depends(get_db)], create_game: CreateGame):
-    db.execute(insert(Game).values(title=create_game.title,
-                                   description=create_game.description,
-                                   rating=create_game.rating,
-                                   price=create_game.price,
-                                   feedback=create_game.feedback,
-                                   slug=slugify(create_game.title)))
-    db.commit()
+async def create_game(db: Annotated[AsyncSession, Depends(get_db)], create_game: CreateGame):
+    await db.execute(insert(Game).values(title=create_game.title,
+                                         description=create_game.description,
+                                         rating=create_game.rating,
+                                         price=create_game.price,
+                                         feedback=create_game.feedback,
+                                         slug=slugify(create_game.title)))
+    await db.commit()
+    page_cache.invalidate(LIST_GAME)
 
     return {'status_code': status.HTTP_201_CREATED, 'transaction': 'Successful'}
 
 
+@router_game.post('/bulk')
+async def bulk_create_games(file: UploadFile, fmt: Literal['ndjson', 'csv'] | None = Query(None, alias='format')):
+    report = await import_upload('games', file, fmt)
+    page_cache.invalidate(LIST_GAME)
+    return report
+
+
 @router_game.put('/update')
-async def update_game(db: Annotated[Session, Depends(get_db)], game_id: int, update_game: UpdateGame):
-    game = db.scalar(select(Game).where(Game.id == game_id))
+async def update_game(db: Annotated[AsyncSession, Depends(get_db)], game_id: int, update_game: UpdateGame):
+    game = await db.scalar(select(Game).where(Game.id == game_id))
     if game is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
 
-    db.execute(update(Game).where(Game.id == game_id).values(
+    await db.execute(update(Game).where(Game.id == game_id).values(
                                    description=update_game.description,
                                    rating=update_game.rating,
                                    price=update_game.price,
                                    feedback=update_game.feedback,
                                    ))
 
-    db.commit()
+    await db.commit()
+    page_cache.invalidate(game_key(game_id))
+    await entity_cache.invalidate(Game, game_id)
 
     return {'status_code': status.HTTP_200_OK, 'transaction': 'game update'}
 
 
 @router_game.delete('/delete')
-async def delete_game(db: Annotated[Session, Depends(get_db)], game_id: int):
-    game = db.scalar(select(Game).where(Game.id == game_id))
+async def delete_game(db: Annotated[AsyncSession, Depends(get_db)], background_tasks: BackgroundTasks, game_id: int):
+    game = await db.scalar(select(Game).where(Game.id == game_id))
     if game is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
 
-    db.execute(delete(Game).where(Game.id == game_id))
-    db.execute(delete(UserGameFeedback).where(UserGameFeedback.game_id == game_id))
-    db.execute(delete(UserGameRating).where(UserGameRating.game_id == game_id))
-    db.commit()
+    authors = (await db.scalars(select(UserGameRating.user_id).where(UserGameRating.game_id == game_id).union(
+        select(UserGameFeedback.user_id).where(UserGameFeedback.game_id == game_id)))).all()
+
+    # оценки, отзывы, агрегаты и похожие игры удаляет ON DELETE CASCADE (в файлах шардов - delete_shard_children)
+    if await count_children(db, Game, game_id) > PURGE_THRESHOLD:
+        background_tasks.add_task(purge_game, game_id, authors)
+        return {'status_code': status.HTTP_202_ACCEPTED, 'transaction': 'game delete scheduled'}
+
+    ratings = (await db.scalars(select(UserGameRating.id).where(UserGameRating.game_id == game_id))).all()
+    feedbacks = (await db.scalars(select(UserGameFeedback.id).where(UserGameFeedback.game_id == game_id))).all()
+    await delete_shard_children(db, Game, game_id)
+    await db.execute(delete(Game).where(Game.id == game_id))
+    await db.commit()
+    page_cache.invalidate(LIST_GAME, game_key(game_id), *[user_key(user_id) for user_id in authors])
+    await entity_cache.invalidate(Game, game_id)
+    await entity_cache.invalidate(UserGameRating, *ratings)
+    await entity_cache.invalidate(UserGameFeedback, *feedbacks)
 
     return {'status_code': status.HTTP_200_OK, 'transaction': 'game delete'}
 
 
-@router_game.get('/game_id/rating')
-async def rating_by_game_id(db: Annotated[Session, Depends(get_db)], game_id: int):
-    ratings = db.scalars(select(UserGameRating).where(UserGameRating.game_id == game_id)).all()
+async def purge_game(game_id, authors):
+    await purge(Game, game_id)
+    page_cache.invalidate(LIST_GAME, game_key(game_id), *[user_key(user_id) for user_id in authors])
+    # id удалённых оценок и отзывов не собираем (их больше PURGE_THRESHOLD) - записи вытеснит TTL
+    await entity_cache.invalidate(Game, game_id)
+
+
+@router_game.get('/game_id/rating', response_model=list[ReadRating])
+async def rating_by_game_id(db: Annotated[AsyncSession, Depends(get_db)], game_id: int):
+    ratings = (await db.execute(columns_select(UserGameRating).where(UserGameRating.game_id == game_id))).all()
     if ratings is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
     return ratings
 
-@router_game.get('/game_id/feedback')
-async def feedback_by_game_id(db: Annotated[Session, Depends(get_db)], game_id: int):
-    feedbacks = db.scalars(select(UserGameFeedback).where(UserGameFeedback.game_id == game_id)).all()
+@router_game.get('/game_id/feedback', response_model=list[ReadFeedback])
+async def feedback_by_game_id(db: Annotated[AsyncSession, Depends(get_db)], game_id: int):
+    feedbacks = (await db.execute(columns_select(UserGameFeedback).where(UserGameFeedback.game_id == game_id))).all()
     if feedbacks is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
-    return feedbacks
\ No newline at end of file
+    return feedbacks
+
+
+@router_game.get('/game_id/rating_stats', response_model=RatingStats)
+async def rating_stats_by_game_id(db: Annotated[AsyncSession, Depends(get_db)], game_id: int):
+    stats = await db.get(GameRatingStats, game_id)
+    if stats is None and await db.get(Game, game_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
+    return stats_to_dict(game_id, stats)
+
+
+@router_game.get('/game_id/similar', response_model=list[SimilarGame])
+async def similar_games_by_game_id(db: Annotated[AsyncSession, Depends(get_db)], game_id: int,
+                                   limit: int = Query(SIMILAR_TOP_K, ge=1, le=SIMILAR_TOP_K)):
+    # соседи заранее посчитаны в game_similarity (app/backend/recommendations.py)
+    if await db.get(Game, game_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
+    rows = (await db.execute(similar_games_query(game_id, limit))).mappings()
+    return [dict(row) for row in rows]
@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Depends, Query
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..backend.db_depends import get_db
+from ..backend.search import search, SEARCH_LIMIT, SEARCH_LIMIT_MAX
+
+from typing import Annotated, Literal
+
+router_search = APIRouter(prefix='/search', tags=['search'])
+
+
+@router_search.get('')
+async def search_all(db: Annotated[AsyncSession, Depends(get_db)],
+                     q: str = Query(min_length=1, max_length=200),
+                     kind: Literal['game', 'feedback'] = 'game',
+                     limit: int = Query(SEARCH_LIMIT, ge=1, le=SEARCH_LIMIT_MAX),
+                     offset: int = Query(0, ge=0)):
+    return await search(db, q, kind, limit, offset)
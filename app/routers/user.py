@@ -1,15 +1,26 @@
-from fastapi import APIRouter, Depends, status, HTTPException
+from fastapi import APIRouter, Depends, status, HTTPException, Query, BackgroundTasks
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..backend.db_depends import get_db
+from ..backend.page_cache import page_cache, LIST_USER, game_key, user_key
+from ..backend.sessions import identity_cache, identity_key
+from ..backend.entity_cache import entity_cache
+from ..backend.passwords import hash_password_async
+from ..backend.pagination import keyset_page, ndjson_response, columns_select, PAGE_LIMIT, PAGE_LIMIT_MAX
+from ..backend.recommendations import recommended_games_query
+from ..backend.config import SIMILAR_TOP_K
+from ..backend.loaders import Loaders, get_loaders, batch_response, BATCH_LIMIT
+from ..backend.details import user_details
+from ..backend.purge import purge, count_children, delete_shard_children
+from ..backend.config import PURGE_THRESHOLD
 
 from typing import Annotated
 
 from ..models.user import User
 from ..models.user_game_feedback import UserGameFeedback
 from ..models.user_game_rating import UserGameRating
-from ..schemas import CreateUser, UpdateUser
+from ..schemas import CreateUser, UpdateUser, ReadUser, ReadRating, ReadFeedback, SimilarGame, Page, Batch, UserFull
 
 from sqlalchemy import insert, select, update, delete
 
@@ -20,70 +31,125 @@ from fastapi import APIRouter
 router_user = APIRouter(prefix='/user', tags=['user'])
 
 
-@router_user.get('/all_users')
-async def all_users(db: Annotated[Session, Depends(get_db)]):
-    users = db.scalars(select(User)).all()
-    return users
+@router_user.get('/all_users', response_model=Page[ReadUser])
+async def all_users(db: Annotated[AsyncSession, Depends(get_db)],
+                    limit: int = Query(PAGE_LIMIT, ge=1, le=PAGE_LIMIT_MAX),
+                    after: int | None = None, stream: bool = False):
+    if stream:
+        return ndjson_response(User, after)
+    return await keyset_page(db, User, limit, after)
 
 
-@router_user.get('/user_id')
-async def user_by_id(db: Annotated[Session, Depends(get_db)], user_id: int):
-    user = db.scalar(select(User).where(User.id == user_id))
+@router_user.get('/batch', response_model=Batch[ReadUser])
+async def users_batch(loaders: Annotated[Loaders, Depends(get_loaders)],
+                      ids: str = Query(..., description=f'id пользователей через запятую, не больше {BATCH_LIMIT}')):
+    return await batch_response(loaders.users, ids)
+
+
+@router_user.get('/user_id', response_model=ReadUser | None)
+async def user_by_id(db: Annotated[AsyncSession, Depends(get_db)], user_id: int):
+    user = await entity_cache.get(db, User, user_id)
     return user
 
 
+@router_user.get('/user_id/full', response_model=UserFull)
+async def user_full_by_id(db: Annotated[AsyncSession, Depends(get_db)], user_id: int):
+    # пользователь с оценками и отзывами вместе с играми - те же три запроса, что и у страницы пользователя
+    details = await user_details(db, user_id)
+    if details['user'] is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
+    return details
+
+
 @router_user.post('/create')
-async def create_user(db: Annotated[Session, Depends(get_db)], create_user: CreateUser):
-    db.execute(insert(User).values(username=create_user.username,
-                                   firstname=create_user.firstname,
-                                   lastname=create_user.lastname,
-                                   password=create_user.password,
-                                   slug=slugify(create_user.username)))
-    db.commit()
+async def create_user(db: Annotated[AsyncSession, Depends(get_db)], create_user: CreateUser):
+    await db.execute(insert(User).values(username=create_user.username,
+                                         firstname=create_user.firstname,
+                                         lastname=create_user.lastname,
+                                         password=await hash_password_async(create_user.password),
+                                         slug=slugify(create_user.username)))
+    await db.commit()
+    page_cache.invalidate(LIST_USER)
 
     return {'status_code': status.HTTP_201_CREATED, 'transaction': 'Successful'}
 
 
 @router_user.put('/update')
-async def update_user(db: Annotated[Session, Depends(get_db)], user_id: int, update_user: UpdateUser):
-    user = db.scalar(select(User).where(User.id == user_id))
+async def update_user(db: Annotated[AsyncSession, Depends(get_db)], user_id: int, update_user: UpdateUser):
+    user = await db.scalar(select(User).where(User.id == user_id))
     if user is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
 
-    db.execute(update(User).where(User.id == user_id).values(
+    await db.execute(update(User).where(User.id == user_id).values(
         firstname=update_user.firstname,
         lastname=update_user.lastname,
     ))
 
-    db.commit()
+    await db.commit()
+    page_cache.invalidate(user_key(user_id))
+    identity_cache.invalidate(identity_key(user_id))
+    await entity_cache.invalidate(User, user_id)
 
     return {'status_code': status.HTTP_200_OK, 'transaction': 'user update'}
 
 
 @router_user.delete('/delete')
-async def delete_user(db: Annotated[Session, Depends(get_db)], user_id: int):
-    user = db.scalar(select(User).where(User.id == user_id))
+async def delete_user(db: Annotated[AsyncSession, Depends(get_db)], background_tasks: BackgroundTasks, user_id: int):
+    user = await db.scalar(select(User).where(User.id == user_id))
     if user is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
 
-    db.execute(delete(User).where(User.id == user_id))
-    db.execute(delete(UserGameFeedback).where(UserGameFeedback.user_id == user_id))
-    db.execute(delete(UserGameRating).where(UserGameRating.user_id == user_id))
-    db.commit()
+    games = (await db.scalars(select(UserGameRating.game_id).where(UserGameRating.user_id == user_id).union(
+        select(UserGameFeedback.game_id).where(UserGameFeedback.user_id == user_id)))).all()
+
+    # оценки и отзывы удаляет ON DELETE CASCADE (в файлах шардов - delete_shard_children)
+    if await count_children(db, User, user_id) > PURGE_THRESHOLD:
+        background_tasks.add_task(purge_user, user_id, games)
+        return {'status_code': status.HTTP_202_ACCEPTED, 'transaction': 'user delete scheduled'}
+
+    ratings = (await db.scalars(select(UserGameRating.id).where(UserGameRating.user_id == user_id))).all()
+    feedbacks = (await db.scalars(select(UserGameFeedback.id).where(UserGameFeedback.user_id == user_id))).all()
+    await delete_shard_children(db, User, user_id)
+    await db.execute(delete(User).where(User.id == user_id))
+    await db.commit()
+    page_cache.invalidate(LIST_USER, user_key(user_id), *[game_key(game_id) for game_id in games])
+    identity_cache.invalidate(identity_key(user_id))
+    await entity_cache.invalidate(User, user_id)
+    await entity_cache.invalidate(UserGameRating, *ratings)
+    await entity_cache.invalidate(UserGameFeedback, *feedbacks)
 
     return {'status_code': status.HTTP_200_OK, 'transaction': 'user delete'}
 
 
-@router_user.get('/user_id/rating')
-async def rating_by_user_id(db: Annotated[Session, Depends(get_db)], user_id: int):
-    ratings = db.scalars(select(UserGameRating).where(UserGameRating.user_id == user_id)).all()
+async def purge_user(user_id, games):
+    await purge(User, user_id)
+    page_cache.invalidate(LIST_USER, user_key(user_id), *[game_key(game_id) for game_id in games])
+    identity_cache.invalidate(identity_key(user_id))
+    # id удалённых оценок и отзывов не собираем (их больше PURGE_THRESHOLD) - записи вытеснит TTL
+    await entity_cache.invalidate(User, user_id)
+
+
+@router_user.get('/user_id/rating', response_model=list[ReadRating])
+async def rating_by_user_id(db: Annotated[AsyncSession, Depends(get_db)], user_id: int):
+    ratings = (await db.execute(columns_select(UserGameRating).where(UserGameRating.user_id == user_id)
+                                .order_by(UserGameRating.id))).all()
     if ratings is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
     return ratings
 
-@router_user.get('/user_id/feedback')
-async def feedback_by_user_id(db: Annotated[Session, Depends(get_db)], user_id: int):
-    feedbacks = db.scalars(select(UserGameFeedback).where(UserGameFeedback.user_id == user_id)).all()
+@router_user.get('/user_id/feedback', response_model=list[ReadFeedback])
+async def feedback_by_user_id(db: Annotated[AsyncSession, Depends(get_db)], user_id: int):
+    feedbacks = (await db.execute(columns_select(UserGameFeedback).where(UserGameFeedback.user_id == user_id)
+                                  .order_by(UserGameFeedback.id))).all()
     if feedbacks is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
-    return feedbacks
\ No newline at end of file
+    return feedbacks
+
+
+@router_user.get('/user_id/recommended', response_model=list[SimilarGame])
+async def recommended_by_user_id(db: Annotated[AsyncSession, Depends(get_db)], user_id: int,
+                                 limit: int = Query(SIMILAR_TOP_K, ge=1, le=100)):
+    if await db.get(User, user_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
+    rows = (await db.execute(recommended_games_query(user_id, limit))).mappings()
+    return [dict(row) for row in rows]
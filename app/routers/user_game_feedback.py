@@ -1,15 +1,22 @@
-from fastapi import APIRouter, Depends, status, HTTPException
+from fastapi import APIRouter, Depends, status, HTTPException, Query, UploadFile
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..backend.db_depends import get_db
+from ..backend.upserts import feedback_insert_new
+from ..backend.bulk_import import import_upload
+from ..backend.export import stream_response
+from ..backend.page_cache import page_cache, game_key, user_key
+from ..backend.entity_cache import entity_cache
+from ..backend.shards import route
+from ..backend.pagination import keyset_page, ndjson_response, PAGE_LIMIT, PAGE_LIMIT_MAX
 
-from typing import Annotated
+from typing import Annotated, Literal
 
 from ..models.game import Game
 from ..models.user import User
 from ..models.user_game_feedback import UserGameFeedback
-from ..schemas import CreateFeedback, UpdateFeedback
+from ..schemas import CreateFeedback, UpdateFeedback, ReadFeedback, Page
 
 from sqlalchemy import insert, select, update, delete
 
@@ -20,65 +27,84 @@ from fastapi import APIRouter
 router_feedback = APIRouter(prefix='/feedback', tags=['feedback'])
 
 
-@router_feedback.get('/all_feedback')
-async def all_feedback(db: Annotated[Session, Depends(get_db)]):
-    feedback = db.scalars(select(UserGameFeedback)).all()
-    return feedback
+@router_feedback.get('/all_feedback', response_model=Page[ReadFeedback])
+async def all_feedback(db: Annotated[AsyncSession, Depends(get_db)],
+                       limit: int = Query(PAGE_LIMIT, ge=1, le=PAGE_LIMIT_MAX),
+                       after: int | None = None, stream: bool = False):
+    if stream:
+        return ndjson_response(UserGameFeedback, after)
+    return await keyset_page(db, UserGameFeedback, limit, after)
+
+
+@router_feedback.get('/export')
+async def export_feedback(fmt: Literal['ndjson', 'csv'] = Query('ndjson', alias='format'), gzip: bool = False,
+                          game_id: int | None = None, user_id: int | None = None):
+    return stream_response(UserGameFeedback, fmt, gzip, 'feedback', game_id=game_id, user_id=user_id)
 
 
-@router_feedback.get('/feedback_id')
-async def feedback_by_id(db: Annotated[Session, Depends(get_db)], feedback_id: int):
-    feedback = db.scalar(select(UserGameFeedback).where(UserGameFeedback.id == feedback_id))
+@router_feedback.get('/feedback_id', response_model=ReadFeedback | None)
+async def feedback_by_id(db: Annotated[AsyncSession, Depends(get_db)], feedback_id: int):
+    feedback = await entity_cache.get(db, UserGameFeedback, feedback_id)
     return feedback
 
 
 @router_feedback.post('/create')
-async def create_feedback(db: Annotated[Session, Depends(get_db)], create_feedback: CreateFeedback,
+async def create_feedback(db: Annotated[AsyncSession, Depends(get_db)], create_feedback: CreateFeedback,
                           user_id: int, game_id: int):
-    user = db.scalar(select(User).where(User.id == user_id))
+    user = await db.scalar(select(User).where(User.id == user_id))
     if user is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="FEEDBACK NOT FOUND")
 
-    game = db.scalar(select(Game).where(Game.id == game_id))
+    game = await db.scalar(select(Game).where(Game.id == game_id))
     if game is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="FEEDBACK NOT FOUND")
 
-    existing_feedback = db.scalar(select(UserGameFeedback).where(
-        UserGameFeedback.user_id == user_id,
-        UserGameFeedback.game_id == game_id))
-    if existing_feedback is not None:
+    result = await db.execute(route(feedback_insert_new(create_feedback.user_id,
+                                                        create_feedback.game_id,
+                                                        create_feedback.feedback_text), create_feedback.game_id))
+    if result.rowcount == 0:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User has already left feedback for this game")
-
-    db.execute(insert(UserGameFeedback).values(user_id=create_feedback.user_id,
-                                               game_id=create_feedback.game_id,
-                                               feedback_text=create_feedback.feedback_text))
-    db.commit()
+    await db.commit()
+    page_cache.invalidate(game_key(create_feedback.game_id), user_key(create_feedback.user_id))
 
     return {'status_code': status.HTTP_201_CREATED, 'transaction': 'Successful'}
 
 
+@router_feedback.post('/bulk')
+async def bulk_create_feedback(file: UploadFile, fmt: Literal['ndjson', 'csv'] | None = Query(None, alias='format')):
+    report = await import_upload('feedback', file, fmt)
+    page_cache.clear()
+    # импорт перезаписывает существующие записи, их id заранее неизвестны
+    await entity_cache.clear(UserGameFeedback)
+    return report
+
+
 @router_feedback.put('/update')
-async def update_feedback(db: Annotated[Session, Depends(get_db)], feedback_id: int, update_feedback: UpdateFeedback):
-    feedback = db.scalar(select(UserGameFeedback).where(UserGameFeedback.id == feedback_id))
+async def update_feedback(db: Annotated[AsyncSession, Depends(get_db)], feedback_id: int, update_feedback: UpdateFeedback):
+    feedback = await db.scalar(select(UserGameFeedback).where(UserGameFeedback.id == feedback_id))
     if feedback is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
 
-    db.execute(update(UserGameFeedback).where(UserGameFeedback.id == feedback_id).values(
+    await db.execute(route(update(UserGameFeedback).where(UserGameFeedback.id == feedback_id).values(
         feedback_text=update_feedback.feedback_text
-    ))
+    ), feedback.game_id))
 
-    db.commit()
+    await db.commit()
+    page_cache.invalidate(game_key(feedback.game_id), user_key(feedback.user_id))
+    await entity_cache.invalidate(UserGameFeedback, feedback_id)
 
     return {'status_code': status.HTTP_200_OK, 'transaction': 'rating update'}
 
 
 @router_feedback.delete('/delete')
-async def delete_feedback(db: Annotated[Session, Depends(get_db)], feedback_id: int):
-    feedback = db.scalars(select(UserGameFeedback).where(UserGameFeedback.id == feedback_id))
+async def delete_feedback(db: Annotated[AsyncSession, Depends(get_db)], feedback_id: int):
+    feedback = await db.scalar(select(UserGameFeedback).where(UserGameFeedback.id == feedback_id))
     if feedback is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
 
-    db.execute(delete(UserGameFeedback).where(UserGameFeedback.id == feedback_id))
-    db.commit()
+    await db.execute(route(delete(UserGameFeedback).where(UserGameFeedback.id == feedback_id), feedback.game_id))
+    await db.commit()
+    page_cache.invalidate(game_key(feedback.game_id), user_key(feedback.user_id))
+    await entity_cache.invalidate(UserGameFeedback, feedback_id)
 
     return {'status_code': status.HTTP_200_OK, 'transaction': 'rating delete'}
@@ -1,15 +1,22 @@
-from fastapi import APIRouter, Depends, status, HTTPException
+from fastapi import APIRouter, Depends, status, HTTPException, Query, UploadFile
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..backend.db_depends import get_db
+from ..backend.upserts import rating_insert_new
+from ..backend.bulk_import import import_upload
+from ..backend.export import stream_response
+from ..backend.page_cache import page_cache, game_key, user_key
+from ..backend.entity_cache import entity_cache
+from ..backend.shards import route
+from ..backend.pagination import keyset_page, ndjson_response, PAGE_LIMIT, PAGE_LIMIT_MAX
 
-from typing import Annotated
+from typing import Annotated, Literal
 
 from ..models.game import Game
 from ..models.user import User
 from ..models.user_game_rating import UserGameRating
-from ..schemas import CreateRating, UpdateRating
+from ..schemas import CreateRating, UpdateRating, ReadRating, Page
 
 from sqlalchemy import insert, select, update, delete
 
@@ -20,65 +27,84 @@ from fastapi import APIRouter
 router_rating = APIRouter(prefix='/rating', tags=['rating'])
 
 
-@router_rating.get('/all_rating')
-async def all_rating(db: Annotated[Session, Depends(get_db)]):
-    ratings = db.scalars(select(UserGameRating)).all()
-    return ratings
+@router_rating.get('/all_rating', response_model=Page[ReadRating])
+async def all_rating(db: Annotated[AsyncSession, Depends(get_db)],
+                     limit: int = Query(PAGE_LIMIT, ge=1, le=PAGE_LIMIT_MAX),
+                     after: int | None = None, stream: bool = False):
+    if stream:
+        return ndjson_response(UserGameRating, after)
+    return await keyset_page(db, UserGameRating, limit, after)
 
 
-@router_rating.get('/rating_id')
-async def rating_by_id(db: Annotated[Session, Depends(get_db)], rating_id: int):
-    rating = db.scalar(select(UserGameRating).where(UserGameRating.id == rating_id))
+@router_rating.get('/export')
+async def export_ratings(fmt: Literal['ndjson', 'csv'] = Query('ndjson', alias='format'), gzip: bool = False,
+                         game_id: int | None = None, user_id: int | None = None):
+    return stream_response(UserGameRating, fmt, gzip, 'ratings', game_id=game_id, user_id=user_id)
+
+
+@router_rating.get('/rating_id', response_model=ReadRating | None)
+async def rating_by_id(db: Annotated[AsyncSession, Depends(get_db)], rating_id: int):
+    rating = await entity_cache.get(db, UserGameRating, rating_id)
     return rating
 
 
 @router_rating.post('/create')
-async def create_rating(db: Annotated[Session, Depends(get_db)], create_rating: CreateRating,
+async def create_rating(db: Annotated[AsyncSession, Depends(get_db)], create_rating: CreateRating,
                         user_id: int, game_id: int):
-    user = db.scalar(select(User).where(User.id == user_id))
+    user = await db.scalar(select(User).where(User.id == user_id))
     if user is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="RATING NOT FOUND")
 
-    game = db.scalar(select(Game).where(Game.id == game_id))
+    game = await db.scalar(select(Game).where(Game.id == game_id))
     if game is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="RATING NOT FOUND")
 
-    existing_rating = db.scalar(select(UserGameRating).where(
-        UserGameRating.user_id == user_id,
-        UserGameRating.game_id == game_id))
-    if UserGameRating is not None:
+    result = await db.execute(route(rating_insert_new(create_rating.user_id,
+                                                      create_rating.game_id,
+                                                      create_rating.rating_int), create_rating.game_id))
+    if result.rowcount == 0:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User has already left rating for this game")
-
-    db.execute(insert(UserGameRating).values(user_id=create_rating.user_id,
-                                             game_id=create_rating.game_id,
-                                             rating_int=create_rating.rating_int))
-    db.commit()
+    await db.commit()
+    page_cache.invalidate(game_key(create_rating.game_id), user_key(create_rating.user_id))
 
     return {'status_code': status.HTTP_201_CREATED, 'transaction': 'Successful'}
 
 
+@router_rating.post('/bulk')
+async def bulk_create_ratings(file: UploadFile, fmt: Literal['ndjson', 'csv'] | None = Query(None, alias='format')):
+    report = await import_upload('ratings', file, fmt)
+    page_cache.clear()
+    # импорт перезаписывает существующие записи, их id заранее неизвестны
+    await entity_cache.clear(UserGameRating)
+    return report
+
+
 @router_rating.put('/update')
-async def update_rating(db: Annotated[Session, Depends(get_db)], rating_id: int, update_rating: UpdateRating):
-    rating = db.scalar(select(UserGameRating).where(UserGameRating.id == rating_id))
+async def update_rating(db: Annotated[AsyncSession, Depends(get_db)], rating_id: int, update_rating: UpdateRating):
+    rating = await db.scalar(select(UserGameRating).where(UserGameRating.id == rating_id))
     if rating is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
 
-    db.execute(update(UserGameRating).where(UserGameRating.id == rating_id).values(
+    await db.execute(route(update(UserGameRating).where(UserGameRating.id == rating_id).values(
         rating_int=update_rating.rating_int
-    ))
+    ), rating.game_id))
 
-    db.commit()
+    await db.commit()
+    page_cache.invalidate(game_key(rating.game_id), user_key(rating.user_id))
+    await entity_cache.invalidate(UserGameRating, rating_id)
 
     return {'status_code': status.HTTP_200_OK, 'transaction': 'rating update'}
 
 
 @router_rating.delete('/delete')
-async def delete_rating(db: Annotated[Session, Depends(get_db)], rating_id: int):
-    rating = db.scalars(select(UserGameRating).where(UserGameRating.id == rating_id))
+async def delete_rating(db: Annotated[AsyncSession, Depends(get_db)], rating_id: int):
+    rating = await db.scalar(select(UserGameRating).where(UserGameRating.id == rating_id))
     if rating is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
 
-    db.execute(delete(UserGameRating).where(UserGameRating.id == rating_id))
-    db.commit()
+    await db.execute(route(delete(UserGameRating).where(UserGameRating.id == rating_id), rating.game_id))
+    await db.commit()
+    page_cache.invalidate(game_key(rating.game_id), user_key(rating.user_id))
+    await entity_cache.invalidate(UserGameRating, rating_id)
 
     return {'status_code': status.HTTP_200_OK, 'transaction': 'rating delete'}
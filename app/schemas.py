@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+from typing import Generic, TypeVar
+
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class CreateUser(BaseModel):
@@ -12,6 +14,16 @@ class UpdateUser(BaseModel):
     firstname: str
     lastname: str
 
+
+class ReadUser(BaseModel):
+    # пароль (хэш) в ответы API не попадает
+    model_config = ConfigDict(from_attributes=True)
+    id: int
+    username: str | None
+    firstname: str | None
+    lastname: str | None
+    slug: str | None
+
 #_____________________________________________________________________________
 class CreateGame(BaseModel):
     title: str
@@ -27,14 +39,61 @@ class UpdateGame(BaseModel):
     price: float
     feedback: str
 
+
+class ReadGame(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    id: int
+    title: str | None
+    description: str | None
+    rating: int | None
+    price: float | None
+    feedback: str | None
+    slug: str | None
+
+
+class SimilarGame(BaseModel):
+    id: int
+    title: str | None
+    slug: str | None
+    score: float
+
+
+class TopGame(BaseModel):
+    id: int
+    title: str | None
+    slug: str | None
+    critic_rating: int | None
+    votes: int
+    score: float
+
+
+class TopPage(BaseModel):
+    items: list[TopGame]
+    next_offset: int | None
+
+
+class RatingStats(BaseModel):
+    game_id: int
+    count: int
+    sum: int
+    mean: float | None
+    histogram: list[int]
+
 #_____________________________________________________________________________
 class CreateRating(BaseModel):
     user_id: int
     game_id: int
-    rating_int: int
+    rating_int: int = Field(ge=0, le=10)
 
 class UpdateRating(BaseModel):
-    rating_int: int
+    rating_int: int = Field(ge=0, le=10)
+
+class ReadRating(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    id: int
+    user_id: int | None
+    game_id: int | None
+    rating_int: int | None
 
 #________________________________________________________________________________
 class CreateFeedback(BaseModel):
@@ -43,4 +102,69 @@ class CreateFeedback(BaseModel):
     feedback_text: str
 
 class UpdateFeedback(BaseModel):
-    feedback_text: str
\ No newline at end of file
+    feedback_text: str
+
+class ReadFeedback(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    id: int
+    user_id: int | None
+    game_id: int | None
+    feedback_text: str | None
+
+#________________________________________________________________________________
+# Страницы игры и пользователя целиком (/game/game_id/full, /user/user_id/full, app/backend/details.py).
+# Поля-связи ORM читаются по validation_alias, в ответе они называются user и game
+class GameRating(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    id: int
+    rating_int: int | None
+    user: ReadUser | None = Field(validation_alias='send_to_user')
+
+
+class GameFeedback(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    id: int
+    feedback_text: str | None
+    user: ReadUser | None = Field(validation_alias='send_to_user')
+
+
+class GameFull(BaseModel):
+    game: ReadGame
+    stats: RatingStats
+    ratings: list[GameRating]
+    feedbacks: list[GameFeedback]
+
+
+class UserRating(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    id: int
+    rating_int: int | None
+    game: ReadGame | None = Field(validation_alias='send_to_game')
+
+
+class UserFeedback(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    id: int
+    feedback_text: str | None
+    game: ReadGame | None = Field(validation_alias='send_to_game')
+
+
+class UserFull(BaseModel):
+    user: ReadUser
+    ratings: list[UserRating]
+    feedbacks: list[UserFeedback]
+
+#________________________________________________________________________________
+Item = TypeVar('Item')
+
+
+class Page(BaseModel, Generic[Item]):
+    # страница keyset-пагинации (app/backend/pagination.py)
+    items: list[Item]
+    next_after: int | None
+
+
+class Batch(BaseModel, Generic[Item]):
+    # ответ /game/batch, /user/batch (app/backend/loaders.py): None - записи с таким id нет
+    items: dict[int, Item | None]
+    not_found: list[int]
@@ -0,0 +1,127 @@
+'''
+Генерация синтетического набора данных в отдельный файл SQLite для нагрузочных тестов.
+
+    python -m benchmarks.dataset /tmp/bench.db --users 100000 --games 10000 --ratings 5000000 --feedback 5000000
+
+Схема создаётся моделями приложения (как create_all), триггеры на время загрузки снимаются,
+а агрегаты, рейтинг и полнотекстовый индекс затем строятся одним проходом.
+Пароли пользователей хранятся открытым текстом ("password<id>"): при первом входе они
+перехэшируются, как старые записи.
+'''
+import argparse
+import json
+import os
+import random
+import time
+
+from sqlalchemy import text
+
+from app.backend.db import Base, make_engine
+from app.backend.config import engine_profile
+from app.backend.rating_stats import RATING_STATS_TRIGGERS, rebuild_rating_stats
+from app.backend.leaderboard import LEADERBOARD_TRIGGERS, rebuild_leaderboard
+from app.backend.search import SEARCH_INDEX_SQL, rebuild_search_index
+from app.backend.recommendations import build_similarity
+from app.models.game import Game
+from app.models.user import User
+from app.models.user_game_rating import UserGameRating
+from app.models.user_game_feedback import UserGameFeedback
+from app.models.game_rating_stats import GameRatingStats
+from app.models.game_similarity import GameSimilarity
+from app.models.game_leaderboard import GameLeaderboard
+from app.models.data_version import DataVersion
+
+CHUNK = 50000
+WORDS = ('игра стратегия отличная скучно графика сюжет кампания мир война экономика дипломатия интерфейс '
+         'музыка баги патч моды армия флот торговля наука культура религия ёжики зелёные империя '
+         'город карта ход юниты тактика сложность баланс оптимизация сетевая').split()
+
+
+def _text(rnd, words):
+    return ' '.join(rnd.choices(WORDS, k=words))
+
+
+def _pairs(rnd, rows, users, games):
+    # каждая пара (пользователь, игра) встречается не больше одного раза (уникальный индекс)
+    per_user, extra = divmod(min(rows, users * games), users)
+    for user_id in range(1, users + 1):
+        for game_id in rnd.sample(range(1, games + 1), per_user + (user_id <= extra)):
+            yield user_id, game_id
+
+
+def _insert(connection, sql, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == CHUNK:
+            connection.exec_driver_sql(sql, batch)
+            batch.clear()
+    if batch:
+        connection.exec_driver_sql(sql, batch)
+
+
+def generate(path, users, games, ratings, feedback, seed=0, similar=True):
+    '''
+    :param path: str - файл базы (перезаписывается)
+    :param similar: bool - посчитать похожие игры (нужны NumPy и SciPy)
+    :return: dict - размеры набора и время генерации
+    '''
+    if os.path.exists(path):
+        os.remove(path)
+    rnd = random.Random(seed)
+    profile = engine_profile('production')
+    profile['echo'] = False
+    engine = make_engine(path, profile)
+    Base.metadata.create_all(engine)
+    started = time.perf_counter()
+
+    with engine.begin() as connection:
+        triggers = connection.scalars(text("SELECT name FROM sqlite_master WHERE type = 'trigger'")).all()
+        for trigger in triggers:
+            connection.exec_driver_sql(f'DROP TRIGGER {trigger}')
+
+        _insert(connection, 'INSERT INTO users (id, username, firstname, lastname, password, slug) '
+                            'VALUES (?, ?, ?, ?, ?, ?)',
+                ((n, f'user{n}', f'Имя{n}', f'Фамилия{n}', f'password{n}', f'user{n}') for n in range(1, users + 1)))
+        _insert(connection, 'INSERT INTO games (id, title, description, rating, price, feedback, slug) '
+                            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                ((n, f'Игра {n}', _text(rnd, 40), rnd.randint(3, 10), rnd.randint(1, 60) * 100.0,
+                  _text(rnd, 10), f'game-{n}') for n in range(1, games + 1)))
+        _insert(connection, 'INSERT INTO user_game_ratings (user_id, game_id, rating_int) VALUES (?, ?, ?)',
+                ((user_id, game_id, min(10, max(0, round(rnd.gauss(6.5, 2)))))
+                 for user_id, game_id in _pairs(rnd, ratings, users, games)))
+        _insert(connection, 'INSERT INTO user_game_feedback (user_id, game_id, feedback_text) VALUES (?, ?, ?)',
+                ((user_id, game_id, _text(rnd, rnd.randint(5, 30)))
+                 for user_id, game_id in _pairs(rnd, feedback, users, games)))
+        loaded = time.perf_counter()
+
+        for statement in RATING_STATS_TRIGGERS + LEADERBOARD_TRIGGERS + SEARCH_INDEX_SQL:
+            connection.exec_driver_sql(statement)
+        rebuild_rating_stats(connection)
+        rebuild_leaderboard(connection)
+        rebuild_search_index(connection)
+        if similar:
+            build_similarity(connection)
+        counts = {table: connection.scalar(text(f'SELECT COUNT(*) FROM {table}'))
+                  for table in ('users', 'games', 'user_game_ratings', 'user_game_feedback')}
+    engine.dispose()
+    return {'path': path, 'seed': seed, 'rows': counts,
+            'load_seconds': round(loaded - started, 1), 'total_seconds': round(time.perf_counter() - started, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path')
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--ratings', type=int, default=5000000)
+    parser.add_argument('--feedback', type=int, default=5000000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-similar', dest='similar', action='store_false', help='не считать похожие игры')
+    args = parser.parse_args()
+    report = generate(args.path, args.users, args.games, args.ratings, args.feedback, args.seed, args.similar)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+'''
+Нагрузочный тест приложения: маршруты main.py и app/routers/ вызываются через ASGI-клиент
+в том же процессе с заданной конкурентностью. Результат - JSON с пропускной способностью
+и задержками p50/p95/p99 по каждому маршруту, чтобы сравнивать прогоны между собой.
+
+    python -m benchmarks.dataset /tmp/bench.db --users 100000 --games 10000 --ratings 5000000 --feedback 5000000
+    python -m benchmarks.load /tmp/bench.db --concurrency 32 --duration 30 --output run.json
+
+По умолчанию тест работает с копией базы, чтобы записи не меняли набор данных между прогонами.
+'''
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+SEARCH_WORDS = ('стратегия', 'ежики', 'дипломат', 'флот', 'игра баланс', 'музыка баги', 'империя')
+
+
+def _id(rnd, ids, table):
+    return rnd.randint(1, ids[table])
+
+
+# Маршрут: (имя в отчёте, вес, построитель запроса). Построитель получает Random и максимальные id
+# таблиц и возвращает аргументы httpx.AsyncClient.request.
+ROUTES = [
+    ('GET /', 1, lambda rnd, ids: {'method': 'GET', 'url': '/'}),
+    ('GET /list_game/{id}', 10, lambda rnd, ids: {'method': 'GET', 'url': f"/list_game/{_id(rnd, ids, 'games')}"}),
+    ('GET /list_user/{id}', 5, lambda rnd, ids: {'method': 'GET', 'url': f"/list_user/{_id(rnd, ids, 'users')}"}),
+    ('GET /top_game', 3, lambda rnd, ids: {'method': 'GET', 'url': '/top_game',
+                                           'params': {'page': rnd.randint(1, 5)}}),
+    ('GET /game/all_games', 3, lambda rnd, ids: {'method': 'GET', 'url': '/game/all_games',
+                                                 'params': {'after': _id(rnd, ids, 'games')}}),
+    ('GET /game/game_id', 5, lambda rnd, ids: {'method': 'GET', 'url': '/game/game_id',
+                                               'params': {'game_id': _id(rnd, ids, 'games')}}),
+    ('GET /game/game_id/rating', 3, lambda rnd, ids: {'method': 'GET', 'url': '/game/game_id/rating',
+                                                      'params': {'game_id': _id(rnd, ids, 'games')}}),
+    ('GET /game/game_id/rating_stats', 5, lambda rnd, ids: {'method': 'GET', 'url': '/game/game_id/rating_stats',
+                                                            'params': {'game_id': _id(rnd, ids, 'games')}}),
+    ('GET /game/game_id/similar', 3, lambda rnd, ids: {'method': 'GET', 'url': '/game/game_id/similar',
+                                                       'params': {'game_id': _id(rnd, ids, 'games')}}),
+    ('GET /game/top', 3, lambda rnd, ids: {'method': 'GET', 'url': '/game/top',
+                                           'params': {'offset': rnd.randint(0, 10) * 50}}),
+    ('GET /user/user_id/rating', 3, lambda rnd, ids: {'method': 'GET', 'url': '/user/user_id/rating',
+                                                      'params': {'user_id': _id(rnd, ids, 'users')}}),
+    ('GET /user/user_id/recommended', 2, lambda rnd, ids: {'method': 'GET', 'url': '/user/user_id/recommended',
+                                                           'params': {'user_id': _id(rnd, ids, 'users')}}),
+    ('GET /rating/all_rating', 3, lambda rnd, ids: {'method': 'GET', 'url': '/rating/all_rating',
+                                                    'params': {'after': _id(rnd, ids, 'user_game_ratings')}}),
+    ('GET /feedback/all_feedback', 2, lambda rnd, ids: {'method': 'GET', 'url': '/feedback/all_feedback',
+                                                        'params': {'after': _id(rnd, ids, 'user_game_feedback')}}),
+    ('GET /search', 3, lambda rnd, ids: {'method': 'GET', 'url': '/search',
+                                         'params': {'q': rnd.choice(SEARCH_WORDS),
+                                                    'kind': rnd.choice(('game', 'feedback'))}}),
+    ('POST /rating_finish', 5, lambda rnd, ids: {'method': 'POST', 'url': '/rating_finish',
+                                                 'data': {'game_id': _id(rnd, ids, 'games'),
+                                                          'rating_int': rnd.randint(0, 10)}}),
+    ('POST /feedback_finish', 2, lambda rnd, ids: {'method': 'POST', 'url': '/feedback_finish',
+                                                   'data': {'game_id': _id(rnd, ids, 'games'),
+                                                            'feedback_text': rnd.choice(SEARCH_WORDS)}}),
+]
+
+
+def summarize(latencies, errors, elapsed):
+    '''
+    :param latencies: list[float] - задержки успешных запросов в мс
+    :return: dict - количество, ошибки, запросов в секунду, среднее и перцентили
+    '''
+    summary = {'count': len(latencies), 'errors': errors, 'rps': round(len(latencies) / elapsed, 1)}
+    if len(latencies) >= 2:
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+        summary.update(mean_ms=round(statistics.fmean(latencies), 2), p50_ms=round(cuts[49], 2),
+                       p95_ms=round(cuts[94], 2), p99_ms=round(cuts[98], 2), max_ms=round(max(latencies), 2))
+    return summary
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+async def run(args, routes, ids):
+    import httpx
+    import main
+    from app.backend.db import async_engine
+
+    transport = httpx.ASGITransport(app=main.app)
+    names = [name for name, _, _ in routes]
+    weights = [weight for _, weight, _ in routes]
+    builders = dict((name, builder) for name, _, builder in routes)
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    state = {'measuring': False, 'sent': 0}
+
+    async def virtual_user(number):
+        rnd = random.Random(args.seed * 1000 + number)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            # вход выдаёт cookie сессии, нужную для /rating_finish и /feedback_finish
+            user_id = _id(rnd, ids, 'users')
+            await client.post('/check_rating_entry', data={'username': f'user{user_id}',
+                                                           'password': f'password{user_id}', 'user_id': user_id})
+            while not stop.is_set():
+                name = rnd.choices(names, weights)[0]
+                request = builders[name](rnd, ids)
+                started = time.perf_counter()
+                try:
+                    response = await client.request(**request)
+                    failed = response.status_code >= 400
+                except Exception:
+                    failed = True
+                duration = (time.perf_counter() - started) * 1000
+                if state['measuring']:
+                    if failed:
+                        errors[name] += 1
+                    else:
+                        latencies[name].append(duration)
+                    state['sent'] += 1
+                    if args.requests and state['sent'] >= args.requests:
+                        stop.set()
+
+    stop = asyncio.Event()
+    users = [asyncio.create_task(virtual_user(number)) for number in range(args.concurrency)]
+    await asyncio.sleep(args.warmup)
+    state['measuring'] = True
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(stop.wait(), timeout=args.duration)
+    except asyncio.TimeoutError:
+        stop.set()
+    elapsed = time.perf_counter() - started
+    await asyncio.gather(*users)
+    await async_engine.dispose()
+
+    everything = [value for values in latencies.values() for value in values]
+    return {'elapsed_seconds': round(elapsed, 2),
+            'total': summarize(everything, sum(errors.values()), elapsed),
+            'routes': {name: summarize(latencies[name], errors[name], elapsed) for name in names}}
+
+
+def table_sizes(path):
+    import sqlite3
+
+    with sqlite3.connect(path) as connection:
+        return {table: connection.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}').fetchone()[0]
+                for table in ('users', 'games', 'user_game_ratings', 'user_game_feedback')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='база, созданная benchmarks.dataset')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=30, help='секунд измерения')
+    parser.add_argument('--requests', type=int, default=0, help='остановиться после N запросов (0 - по времени)')
+    parser.add_argument('--warmup', type=float, default=2, help='секунд прогрева без измерения')
+    parser.add_argument('--routes', nargs='+', help='подстроки имён маршрутов, которые нужно нагружать')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--in-place', action='store_true', help='писать прямо в базу, без копии')
+    parser.add_argument('--output', help='файл для JSON-отчёта (по умолчанию stdout)')
+    args = parser.parse_args()
+
+    routes = [route for route in ROUTES if not args.routes or any(part in route[0] for part in args.routes)]
+    if not routes:
+        parser.error('ни один маршрут не подходит под --routes')
+    ids = table_sizes(args.path)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.path
+        if not args.in_place:
+            path = os.path.join(tmp, 'bench.db')
+            shutil.copyfile(args.path, path)
+        # настройки читаются при импорте приложения, поэтому задаются до него
+        os.environ['DB_PATH'] = path
+        os.environ['DB_ECHO'] = '0'
+        os.environ['SIMILAR_REBUILD_INTERVAL'] = '0'
+        result = asyncio.run(run(args, routes, ids))
+
+    report = {'meta': {'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                       'git_commit': _git_commit(),
+                       'python': sys.version.split()[0],
+                       'platform': platform.platform(),
+                       'database': os.path.abspath(args.path),
+                       'rows': ids,
+                       'concurrency': args.concurrency,
+                       'warmup_seconds': args.warmup,
+                       'seed': args.seed},
+              **result}
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
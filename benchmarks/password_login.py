@@ -0,0 +1,113 @@
+'''
+Пропускная способность входа (/check_rating_entry) при конкурентных запросах и задержка
+лёгкого запроса (/game/top), выполняющегося параллельно со входами.
+
+Режим inline считает scrypt прямо в event loop (как было бы без пула), остальные режимы -
+в пуле app/backend/passwords.py с указанным числом потоков.
+
+    python -m benchmarks.password_login --concurrency 32 --logins 256 --workers 1 2 4 8
+'''
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else float('nan')
+
+
+async def run(mode, args, app, passwords, users):
+    import httpx
+    from concurrent.futures import ThreadPoolExecutor
+
+    if mode == 'inline':
+        async def verify(password, stored):
+            return passwords.verify_password(password, stored)
+        passwords.verify_password_async, restore = verify, passwords.verify_password_async
+    else:
+        passwords._executor, restore = ThreadPoolExecutor(max_workers=mode), passwords._executor
+
+    transport = httpx.ASGITransport(app=app)
+    queue = asyncio.Queue()
+    for n in range(args.logins):
+        queue.put_nowait(users[n % len(users)])
+    probe_latencies = []
+
+    async def login_worker():
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            while not queue.empty():
+                user_id, username, password = queue.get_nowait()
+                response = await client.post('/check_rating_entry',
+                                             data={'username': username, 'password': password, 'user_id': user_id})
+                assert 'session' in response.cookies, response.text[:200]
+
+    async def probe(stop):
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            while not stop.is_set():
+                started = time.perf_counter()
+                await client.get('/game/top', params={'limit': 10})
+                probe_latencies.append((time.perf_counter() - started) * 1000)
+                await asyncio.sleep(0.01)
+
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(stop))
+    started = time.perf_counter()
+    await asyncio.gather(*[login_worker() for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe_task
+
+    if mode == 'inline':
+        passwords.verify_password_async = restore
+    else:
+        passwords._executor.shutdown()
+        passwords._executor = restore
+    label = 'inline' if mode == 'inline' else f'pool={mode}'
+    print(f'{label:<10} logins/s={args.logins / elapsed:>8.1f}  '
+          f'probe p50={statistics.median(probe_latencies or [float("nan")]):>7.1f} ms  '
+          f'p95={percentile(probe_latencies, 0.95):>7.1f} ms  probes={len(probe_latencies)}')
+
+
+async def main_async(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        # приложение импортируется после выбора базы: движки создаются при импорте app.backend.db
+        os.environ['DB_PATH'] = os.path.join(tmp, 'bench.db')
+        os.environ['SIMILAR_REBUILD_INTERVAL'] = '0'
+        os.environ['DB_ECHO'] = '0'
+        import main
+        from sqlalchemy import insert
+        from app.backend import passwords
+        from app.backend.db import Base, engine, async_engine
+        from app.models.user import User
+
+        Base.metadata.create_all(engine)
+        users = [(n, f'user{n}', f'password{n}') for n in range(1, args.users + 1)]
+        hashes = await asyncio.gather(*[passwords.hash_password_async(password) for _, _, password in users])
+        with engine.begin() as connection:
+            connection.execute(insert(User), [{'id': user_id, 'username': username, 'firstname': 'f',
+                                               'lastname': 'l', 'password': password_hash, 'slug': username}
+                                              for (user_id, username, _), password_hash in zip(users, hashes)])
+        print(f'scrypt n={passwords.SCRYPT_N} r={passwords.SCRYPT_R} p={passwords.SCRYPT_P}  '
+              f'concurrency={args.concurrency} logins={args.logins}')
+        for mode in ['inline'] + sorted(set(args.workers)):
+            await run(mode, args, main.app, passwords, users)
+        await async_engine.dispose()
+        engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--logins', type=int, default=256)
+    parser.add_argument('--users', type=int, default=64)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count() or 1])
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+'''
+Сравнение пропускной способности SQLite при смешанной нагрузке чтение/запись
+для профилей движка development (как было) и production (WAL + PRAGMA).
+
+    python -m benchmarks.sqlite_profile --workers 8 --seconds 5 --write-ratio 0.2
+'''
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import sessionmaker
+
+from app.backend.config import engine_profile
+from app.backend.db import Base, make_engine
+from app.backend.upserts import rating_upsert
+# все модели должны быть импортированы, чтобы SQLAlchemy настроил связи между ними
+from app.models.game import Game
+from app.models.game_rating_stats import GameRatingStats
+from app.models.user import User
+from app.models.user_game_feedback import UserGameFeedback
+from app.models.user_game_rating import UserGameRating
+
+
+def seed(engine, users, games, ratings):
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{'username': f'user{i}', 'firstname': 'f', 'lastname': 'l',
+                                     'password': f'p{i}', 'slug': f'user{i}'} for i in range(1, users + 1)])
+        conn.execute(insert(Game), [{'title': f'game{i}', 'description': 'd', 'rating': 5, 'price': 1.0,
+                                     'feedback': 'f', 'slug': f'game{i}'} for i in range(1, games + 1)])
+        # пара (пользователь, игра) встречается не больше одного раза (уникальный индекс)
+        pairs = random.sample(range(users * games), min(ratings, users * games))
+        conn.execute(insert(UserGameRating), [{'user_id': pair // games + 1,
+                                               'game_id': pair % games + 1,
+                                               'rating_int': random.randint(0, 10)} for pair in pairs])
+
+
+def run(profile_name, args):
+    profile = engine_profile(profile_name)
+    profile['echo'] = False
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(os.path.join(tmp, 'bench.db'), profile)
+        seed(engine, args.users, args.games, args.ratings)
+        Session = sessionmaker(bind=engine)
+        counts = {'read': 0, 'write': 0, 'error': 0}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + args.seconds
+
+        def worker():
+            rnd = random.Random()
+            local = {'read': 0, 'write': 0, 'error': 0}
+            with Session() as db:
+                while time.perf_counter() < deadline:
+                    game_id = rnd.randint(1, args.games)
+                    try:
+                        if rnd.random() < args.write_ratio:
+                            # повторная оценка той же игры перезаписывает прежнюю, как в rating_finish
+                            db.execute(rating_upsert(rnd.randint(1, args.users), game_id, rnd.randint(0, 10)))
+                            db.commit()
+                            local['write'] += 1
+                        else:
+                            db.execute(select(UserGameRating, User).join(User)
+                                       .where(UserGameRating.game_id == game_id)).all()
+                            db.commit()
+                            local['read'] += 1
+                    except Exception:
+                        db.rollback()
+                        local['error'] += 1
+            with lock:
+                for key in counts:
+                    counts[key] += local[key]
+
+        threads = [threading.Thread(target=worker) for _ in range(args.workers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        engine.dispose()
+    total = counts['read'] + counts['write']
+    print(f"{profile_name:<12} ops/s={total / elapsed:>9.1f}  reads={counts['read']:<7} "
+          f"writes={counts['write']:<7} errors={counts['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--ratings', type=int, default=20000)
+    args = parser.parse_args()
+    for profile_name in ('development', 'production'):
+        run(profile_name, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,33 +1,92 @@
+import asyncio
+import os
 import uvicorn
 # uvicorn main:app --reload
 # alembic revision --autogenerate -m "Initial migration"
 # alembic upgrade head
 
 from fastapi import FastAPI, status, Body, HTTPException, Request, Form
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response
 
 from fastapi import APIRouter, Depends, status, HTTPException
 from slugify import slugify
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.staticfiles import StaticFiles
 
+from app.backend.db import engine, async_engine
+from app.backend.config import SIMILAR_REBUILD_INTERVAL, WRITE_QUEUE, SHARDS, LEADERBOARD_REFRESH_INTERVAL
 from app.backend.db_depends import get_db
+from app.backend.loaders import Loaders, get_loaders
+from app.backend.details import game_details, user_details
 
 from typing import Annotated
+from contextlib import asynccontextmanager
 from fastapi.templating import Jinja2Templates
 
 from app.models.game import Game
 from app.models.user import User
 from app.models.user_game_feedback import UserGameFeedback
 from app.models.user_game_rating import UserGameRating
-
-from app.routers import user, game, user_game_feedback, user_game_rating
+from app.models.game_rating_stats import GameRatingStats
+from app.models.game_similarity import GameSimilarity
+from app.models.game_leaderboard import GameLeaderboard
+from app.models.data_version import DataVersion
+
+from app.backend.write_queue import write_queue, save_rating, save_feedback
+from app.backend.entity_cache import entity_cache
+from app.backend.page_cache import page_cache, LIST_GAME, LIST_USER, game_key, user_key
+from app.backend.images import ImmutableStaticFiles, VARIANTS_DIR, background_css
+from app.backend.recommendations import similarity_refresher
+from app.backend.leaderboard import top_page, TOP_LIMIT, leaderboard_refresher
+from app.backend.sessions import set_session_cookie, session_user_id
+from app.backend.passwords import hash_password_async, check_login
+from app.backend.sql_metrics import sql_metrics_middleware
+from app.backend.metrics import MetricsMiddleware, TimedTemplate, instrument_pool, render_metrics
+
+from app.routers import user, game, user_game_feedback, user_game_rating, search
 
 from sqlalchemy import insert, select, update, delete
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # соседи для /game/game_id/similar пересчитываются в фоне, когда меняются оценки
+    refresher = None
+    if SIMILAR_REBUILD_INTERVAL > 0:
+        refresher = asyncio.create_task(similarity_refresher(engine, SIMILAR_REBUILD_INTERVAL))
+    # при шардировании триггеры основной базы не видят оценок, рейтинг игр пересчитывается в фоне
+    leaderboard = None
+    if SHARDS:
+        leaderboard = asyncio.create_task(leaderboard_refresher(engine, LEADERBOARD_REFRESH_INTERVAL))
+    # оценки и отзывы из rating_finish/feedback_finish пишутся пачками (WRITE_QUEUE=1)
+    if WRITE_QUEUE:
+        write_queue.start()
+    yield
+    if write_queue.running:
+        await write_queue.stop()
+    if refresher is not None:
+        refresher.cancel()
+    if leaderboard is not None:
+        leaderboard.cancel()
+    await entity_cache.close()
+    # закрываем соединения пула, иначе потоки aiosqlite не дают процессу завершиться
+    await async_engine.dispose()
+
+
+# JSON-ответы роутеров сериализуются orjson; HTML-страницы возвращают HTMLResponse сами
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+# число SQL-выражений и время в базе по каждому запросу: заголовок Server-Timing и лог (SQL_LOG=1)
+app.middleware('http')(sql_metrics_middleware)
+# метрики Prometheus (GET /metrics); middleware добавляется последним, чтобы быть внешним и мерить всё время запроса
+app.add_middleware(MetricsMiddleware)
+instrument_pool(async_engine.sync_engine, 'async')
 templates = Jinja2Templates(directory='templates')
+templates.env.template_class = TimedTemplate
+templates.env.globals['background_css'] = background_css
 
+# варианты картинок (python manage.py build-images) монтируются раньше /photo
+os.makedirs(VARIANTS_DIR, exist_ok=True)
+app.mount("/photo/variants", ImmutableStaticFiles(directory=VARIANTS_DIR), name="photo_variants")
 app.mount("/photo", StaticFiles(directory="photo"), name="photo")
 
 
@@ -41,76 +100,111 @@ async def get_welcome(request: Request) -> HTMLResponse:
     return templates.TemplateResponse('welcome.html', {"request": request})
 
 
+@app.get("/metrics", include_in_schema=False)
+def get_metrics() -> Response:
+    '''
+    :return: Response - метрики в текстовом формате Prometheus
+    Функция отдаёт метрики для сборщика Prometheus (при PROMETHEUS_MULTIPROC_DIR - суммарно по всем воркерам).
+    Обработчик синхронный: сбор метрик из файлов воркеров выполняется в пуле потоков.
+    '''
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
+
+
 @app.get("/list_user")
-async def get_list_user(request: Request, db: Annotated[Session, Depends(get_db)]) -> HTMLResponse:
+async def get_list_user(request: Request, db: Annotated[AsyncSession, Depends(get_db)]) -> HTMLResponse:
     '''
     :param request: Request
-    :param db: Annotated[Session, Depends(get_db)]
+    :param db: Annotated[AsyncSession, Depends(get_db)]
     :return: 'list_user.html', {"request": request, "users": users}
-    Функция возвращает список зарегистрированных пользователей
+    Функция возвращает список зарегистрированных пользователей (страница кэшируется в page_cache)
     '''
-    users = db.scalars(select(User)).all()
-    return templates.TemplateResponse('list_user.html', {"request": request, "users": users})
+    cached = page_cache.get(LIST_USER)
+    if cached is not None:
+        return HTMLResponse(cached)
+    users = (await db.scalars(select(User))).all()
+    response = templates.TemplateResponse('list_user.html', {"request": request, "users": users})
+    page_cache.set(LIST_USER, response.body)
+    return response
 
 
 @app.get("/list_game")
-async def get_list_game(request: Request, db: Annotated[Session, Depends(get_db)]) -> HTMLResponse:
+async def get_list_game(request: Request, db: Annotated[AsyncSession, Depends(get_db)]) -> HTMLResponse:
     '''
     :param request: Request
-    :param db: Annotated[Session, Depends(get_db)]
+    :param db: Annotated[AsyncSession, Depends(get_db)]
     :return: 'list_games.html', {"request": request, "games": games}
-    Функция возвращает список игр
+    Функция возвращает список игр (страница кэшируется в page_cache)
     '''
-    games = db.scalars(select(Game)).all()
-    return templates.TemplateResponse('list_games.html', {"request": request, "games": games})
+    cached = page_cache.get(LIST_GAME)
+    if cached is not None:
+        return HTMLResponse(cached)
+    games = (await db.scalars(select(Game))).all()
+    response = templates.TemplateResponse('list_games.html', {"request": request, "games": games})
+    page_cache.set(LIST_GAME, response.body)
+    return response
 
 
-@app.get("/list_game/{game_id}")
-async def get_game(request: Request, db: Annotated[Session, Depends(get_db)], game_id: int) -> HTMLResponse:
+@app.get("/top_game")
+async def get_top_game(request: Request, db: Annotated[AsyncSession, Depends(get_db)], page: int = 1) -> HTMLResponse:
     '''
     :param request: Request
-    :param db: Annotated[Session, Depends(get_db)]
-    :param game_id: int
-    :return: 'game.html', {"request": request, "game": game, "ratings": ratings, "feedbacks": feedbacks}
-    Функция возвращает информацию о конкретной игре
+    :param db: Annotated[AsyncSession, Depends(get_db)]
+    :param page: int - номер страницы рейтинга, начиная с 1
+    :return: 'top_games.html', {"request": request, "games": games, "page": page, "has_next": has_next, "offset": offset}
+    Функция возвращает рейтинг игр по байесовскому среднему оценок пользователей и критиков
     '''
-    game = db.scalar(select(Game).where(Game.id == game_id))
+    page = max(page, 1)
+    offset = (page - 1) * TOP_LIMIT
+    top = await top_page(db, TOP_LIMIT, offset)
+    return templates.TemplateResponse('top_games.html', {"request": request,
+                                                         "games": top['items'],
+                                                         "page": page,
+                                                         "has_next": top['next_offset'] is not None,
+                                                         "offset": offset})
 
-    ratings_query = select(UserGameRating, User).join(User).where(UserGameRating.game_id == game_id)
-    ratings = db.execute(ratings_query).all()
 
-    feedbacks_query = select(UserGameFeedback, User).join(User).where(UserGameFeedback.game_id == game_id)
-    feedbacks = db.execute(feedbacks_query).all()
+@app.get("/list_game/{game_id}")
+async def get_game(request: Request, db: Annotated[AsyncSession, Depends(get_db)], game_id: int) -> HTMLResponse:
+    '''
+    :param request: Request
+    :param db: Annotated[AsyncSession, Depends(get_db)]
+    :param game_id: int
+    :return: 'game.html', {"request": request, "game": game, "ratings": ratings, "feedbacks": feedbacks, "stats": stats}
+    Функция возвращает информацию о конкретной игре (средняя оценка берётся из готовых агрегатов game_rating_stats).
+    Игра, агрегаты, оценки и отзывы с авторами загружаются тремя запросами (app/backend/details.py).
+    Страница кэшируется в page_cache.
+    '''
+    cached = page_cache.get(game_key(game_id))
+    if cached is not None:
+        return HTMLResponse(cached)
 
-    return templates.TemplateResponse('game.html', {"request": request,
-                                                    "game": game,
-                                                    "ratings": ratings,
-                                                    "feedbacks": feedbacks})
+    details = await game_details(db, game_id)
+    response = templates.TemplateResponse('game.html', {"request": request, **details})
+    if details['game'] is not None:
+        page_cache.set(game_key(game_id), response.body)
+    return response
 
 
 @app.get("/list_user/{user_id}")
-async def get_user(request: Request, db: Annotated[Session, Depends(get_db)], user_id: int) -> HTMLResponse:
+async def get_user(request: Request, db: Annotated[AsyncSession, Depends(get_db)], user_id: int) -> HTMLResponse:
     '''
     :param request: Request
-    :param db: Annotated[Session, Depends(get_db)]
+    :param db: Annotated[AsyncSession, Depends(get_db)]
     :param user_id: int
     :return: 'user.html', { "request": request, "user": user, "ratings": ratings, "feedbacks": feedbacks}
-    Функция возвращает информацию о конкретном пользователе
+    Функция возвращает информацию о конкретном пользователе вместе с его оценками и отзывами
+    (три запроса, app/backend/details.py). Страница кэшируется в page_cache
     '''
-    user = db.scalar(select(User).where(User.id == user_id))
+    cached = page_cache.get(user_key(user_id))
+    if cached is not None:
+        return HTMLResponse(cached)
 
-    ratings_query = select(UserGameRating, Game).join(Game).where(UserGameRating.user_id == user_id)
-    ratings = db.execute(ratings_query).all()
-
-    feedbacks_query = (select(UserGameFeedback, Game).join(Game).where(UserGameFeedback.user_id == user_id))
-    feedbacks = db.execute(feedbacks_query).all()
-
-    return templates.TemplateResponse('user.html', {
-        "request": request,
-        "user": user,
-        "ratings": ratings,
-        "feedbacks": feedbacks
-    })
+    details = await user_details(db, user_id)
+    response = templates.TemplateResponse('user.html', {"request": request, **details})
+    if details['user'] is not None:
+        page_cache.set(user_key(user_id), response.body)
+    return response
 
 
 @app.get("/regist_user")
@@ -124,11 +218,11 @@ async def get_registration_form(request: Request):
 
 
 @app.post("/register")
-async def reg_user(request: Request, db: Annotated[Session, Depends(get_db)], username: str = Form(...),
+async def reg_user(request: Request, db: Annotated[AsyncSession, Depends(get_db)], username: str = Form(...),
                    firstname: str = Form(...), lastname: str = Form(...), password: str = Form(...)) -> HTMLResponse:
     '''
     :param request: Request
-    :param db: Annotated[Session, Depends(get_db)]
+    :param db: Annotated[AsyncSession, Depends(get_db)]
     :param username: str = Form(...)
     :param firstname: str = Form(...)
     :param lastname: Form(...)
@@ -137,16 +231,17 @@ async def reg_user(request: Request, db: Annotated[Session, Depends(get_db)], us
     Функция обрабатывает информацию, полученную при регистрации пользователя, и добавляет её в базу данных.
     Если логин уже есть в базе данных, то выводится ошибка и сообщение "Логин уже занят((( Попробуйте другой"
     '''
-    user = db.scalar(select(User).where(User.username == username))
+    user = await db.scalar(select(User).where(User.username == username))
     if user:
         return HTMLResponse(f'Логин уже занят((( Попробуйте другой', status_code=400)
-    db.execute(insert(User).values(username=username,
-                                   firstname=firstname,
-                                   lastname=lastname,
-                                   password=password,
-                                   slug=slugify(username)))
-    db.commit()
-    user_id = db.scalar(select(User.id).where(User.username == username))
+    await db.execute(insert(User).values(username=username,
+                                         firstname=firstname,
+                                         lastname=lastname,
+                                         password=await hash_password_async(password),
+                                         slug=slugify(username)))
+    await db.commit()
+    page_cache.invalidate(LIST_USER)
+    user_id = await db.scalar(select(User.id).where(User.username == username))
     return templates.TemplateResponse('welcome_user.html', {"request": request, "username": username,
                                                             'user_id': user_id})
 
@@ -163,11 +258,11 @@ async def feedback_entry(request: Request):
 
 
 @app.post("/check_feedback_entry")
-async def feedback_entry(request: Request, db: Annotated[Session, Depends(get_db)], username: str = Form(...),
+async def feedback_entry(request: Request, db: Annotated[AsyncSession, Depends(get_db)], username: str = Form(...),
                          password: str = Form(...), user_id: int = Form(...)) -> HTMLResponse:
     '''
     :param request: Request
-    :param db: Annotated[Session, Depends(get_db)]
+    :param db: Annotated[AsyncSession, Depends(get_db)]
     :param username: str = Form(...),
     :param password: str = Form(...)
     :param user_id: int = Form(...)
@@ -177,15 +272,16 @@ async def feedback_entry(request: Request, db: Annotated[Session, Depends(get_db
     Если введенные данные не совпадаю с теми, что записаны в базе данных, то выводится ошибка с надписью:
     "Что-то пошло не так ((\nПопробуйте снова"
     '''
-    user = db.scalar(select(User).where(User.id == user_id))
+    user = await db.scalar(select(User).where(User.id == user_id))
     if user is None:
         error = 'Пользователь не найден -_-\nПопробуйте снова'
         return templates.TemplateResponse('feedback_entry.html', {"request": request, 'error': error})
 
-    if username == user.username and password == user.password and user_id == user.id:
-        global global_user
-        global_user = user
-        return templates.TemplateResponse('feedback.html', {"request": request})
+    # пароль проверяется (и при необходимости перехэшируется) в пуле потоков app/backend/passwords.py
+    if username == user.username and user_id == user.id and await check_login(db, user, password):
+        # пользователь запоминается в подписанной cookie сессии, а не в глобальной переменной
+        response = templates.TemplateResponse('feedback.html', {"request": request})
+        return set_session_cookie(response, user)
     else:
         error = 'Что-то пошло не так ((\nПопробуйте снова'
         return templates.TemplateResponse('feedback_entry.html', {"request": request, 'error': error})
@@ -202,36 +298,32 @@ async def feedback(request: Request):
 
 
 @app.post("/feedback_finish")
-async def feedback(request: Request, db: Annotated[Session, Depends(get_db)], feedback_text: str = Form(...),
+async def feedback(request: Request, db: Annotated[AsyncSession, Depends(get_db)],
+                   loaders: Annotated[Loaders, Depends(get_loaders)], feedback_text: str = Form(...),
                    game_id: int = Form(...)) -> HTMLResponse:
     '''
     :param request: Request
-    :param db: Annotated[Session, Depends(get_db)]
+    :param db: Annotated[AsyncSession, Depends(get_db)]
+    :param loaders: Annotated[Loaders, Depends(get_loaders)]
     :param feedback_text: str = Form(...)
     :param game_id: int = Form(...)
     :return: 'finish_feedback.html', {"request": request}
     Функция обрабатывает информацию, полученную от пользователя при оставлении отзыва.
     Если отзыв у пользователя к игре уже есть, то отзыв будет отредактирован.
+    При WRITE_QUEUE=1 запись идёт пачками через write_queue, ответ отдаётся после коммита пачки.
     Если id игры нет в базе данные, выводится ошибка с надписью "GAME NOT FOUND".
+    Пользователь определяется по cookie сессии, выданной при входе (check_feedback_entry).
     '''
-    if global_user is None:
+    user_id = await session_user_id(request, db)
+    if user_id is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User is not authenticated")
-    user_id = global_user.id
 
-    game = db.scalar(select(Game).where(Game.id == game_id))
+    game = await loaders.games.load(game_id)
     if game is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="GAME NOT FOUND")
 
-    existing_feedback = db.scalar(select(UserGameFeedback).where(
-        UserGameFeedback.user_id == user_id, UserGameFeedback.game_id == game_id))
-    if existing_feedback is not None:
-        existing_feedback.feedback_text = feedback_text
-        db.commit()
-    else:
-        db.execute(insert(UserGameFeedback).values(user_id=global_user.id,
-                                                   game_id=game_id,
-                                                   feedback_text=feedback_text))
-        db.commit()
+    await save_feedback(db, user_id, game_id, feedback_text)
+    page_cache.invalidate(game_key(game_id), user_key(user_id))
     return templates.TemplateResponse('finish_feedback.html',
                                       {"request": request})
 
@@ -248,11 +340,11 @@ async def rating_entry(request: Request):
 
 
 @app.post("/check_rating_entry")
-async def check_rating_entry(request: Request, db: Annotated[Session, Depends(get_db)], username: str = Form(...),
+async def check_rating_entry(request: Request, db: Annotated[AsyncSession, Depends(get_db)], username: str = Form(...),
                              password: str = Form(...), user_id: int = Form(...)) -> HTMLResponse:
     '''
     :param request: Request
-    :param db: Annotated[Session, Depends(get_db)]
+    :param db: Annotated[AsyncSession, Depends(get_db)]
     :param username: str = Form(...),
     :param password: str = Form(...)
     :param user_id: int = Form(...)
@@ -262,15 +354,14 @@ async def check_rating_entry(request: Request, db: Annotated[Session, Depends(ge
     Если введенные данные не совпадаю с теми, что записаны в базе данных, то выводится ошибка с надписью:
     "Что-то пошло не так ((\nПопробуйте снова"
     '''
-    user = db.scalar(select(User).where(User.id == user_id))
+    user = await db.scalar(select(User).where(User.id == user_id))
     if user is None:
         error = 'Пользователь не найден -_-\nПопробуйте снова'
         return templates.TemplateResponse('rating_entry.html', {"request": request, 'error': error})
 
-    if username == user.username and password == user.password and user_id == user.id:
-        global global_user
-        global_user = user
-        return templates.TemplateResponse('rating.html', {"request": request})
+    if username == user.username and user_id == user.id and await check_login(db, user, password):
+        response = templates.TemplateResponse('rating.html', {"request": request})
+        return set_session_cookie(response, user)
     else:
         error = 'Что-то пошло не так ((\nПопробуйте снова'
         return templates.TemplateResponse('rating_entry.html', {"request": request, 'error': error})
@@ -287,24 +378,28 @@ async def rating(request: Request):
 
 
 @app.post("/rating_finish")
-async def rating_finish(request: Request, db: Annotated[Session, Depends(get_db)], rating_int: int = Form(...),
+async def rating_finish(request: Request, db: Annotated[AsyncSession, Depends(get_db)],
+                        loaders: Annotated[Loaders, Depends(get_loaders)], rating_int: int = Form(...),
                         game_id: int = Form(...)) -> HTMLResponse:
     '''
     :param request: Request
-    :param db: Annotated[Session, Depends(get_db)]
+    :param db: Annotated[AsyncSession, Depends(get_db)]
+    :param loaders: Annotated[Loaders, Depends(get_loaders)]
     :rating_int: int = Form(...)
     :param game_id: int = Form(...)
     :return: 'finish_feedback.html', {"request": request}
     Функция обрабатывает информацию, полученную от пользователя при оставлении оценки.
     Если оценка у пользователя к игре уже есть, то оценка будет отредактирован.
+    При WRITE_QUEUE=1 запись идёт пачками через write_queue, ответ отдаётся после коммита пачки.
     Если id игры нет в базе данные, выводится ошибка с надписью "GAME NOT FOUND".
     Если оценка выйдет из диапазона 0-10, то выведится ошибка.
+    Пользователь определяется по cookie сессии, выданной при входе (check_rating_entry).
     '''
-    if global_user is None:
+    user_id = await session_user_id(request, db)
+    if user_id is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User is not authenticated")
-    user_id = global_user.id
 
-    game = db.scalar(select(Game).where(Game.id == game_id))
+    game = await loaders.games.load(game_id)
     if game is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="GAME NOT FOUND")
 
@@ -312,16 +407,8 @@ async def rating_finish(request: Request, db: Annotated[Session, Depends(get_db)
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Моre 10")
     if rating_int < 0:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Less 10")
-    existing_rating = db.scalar(select(UserGameRating).where(
-        UserGameRating.user_id == user_id, UserGameRating.game_id == game_id))
-    if existing_rating is not None:
-        existing_rating.rating_int = rating_int
-        db.commit()
-    else:
-        db.execute(insert(UserGameRating).values(user_id=global_user.id,
-                                                 game_id=game_id,
-                                                 rating_int=rating_int))
-        db.commit()
+    await save_rating(db, user_id, game_id, rating_int)
+    page_cache.invalidate(game_key(game_id), user_key(user_id))
     return templates.TemplateResponse('finish_feedback.html',
                                       {"request": request})
 
@@ -330,3 +417,4 @@ app.include_router(user.router_user)
 app.include_router(game.router_game)
 app.include_router(user_game_feedback.router_feedback)
 app.include_router(user_game_rating.router_rating)
+app.include_router(search.router_search)
@@ -0,0 +1,678 @@
+# python manage.py rebuild-rating-stats
+# python manage.py check-query-plans
+# python manage.py import ratings ratings.csv
+# python manage.py build-images
+# python manage.py rebuild-search-index
+# python manage.py build-similar-games
+# python manage.py rebuild-leaderboard
+# python manage.py check-statement-budgets
+# python manage.py purge user 42
+# python manage.py reshard --to 4
+# python manage.py check-import
+# python manage.py check-upserts
+# python manage.py check-entity-cache
+# python manage.py check-stream-columns
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+
+from sqlalchemy import select, func
+
+from app.backend.db import engine, async_engine, make_engine, make_async_engine, AsyncSessionLocal, SessionLocal
+from app.backend.config import DB_PATH, SHARDS, WRITE_QUEUE
+from app.backend.config import SIMILAR_TOP_K
+from app.backend.rating_stats import rebuild_rating_stats
+from app.backend.query_plan import HOT_QUERIES, check_query_plans
+from app.backend.bulk_import import IMPORTERS, FORMATS, CHUNK_SIZE, import_rows
+from app.backend.images import build_variants
+from app.backend.search import rebuild_search_index
+from app.backend.recommendations import refresh_similarity
+from app.backend.leaderboard import rebuild_leaderboard
+from app.backend.sql_metrics import STATEMENT_BUDGETS, DEFAULT_BUDGET, parse_server_timing
+from app.backend.sessions import issue_session
+from app.backend.config import SESSION_COOKIE, PURGE_CHUNK, PURGE_PAUSE
+from app.backend.purge import purge
+from app.backend.shards import all_shards, on_shard_connection
+from app.backend.reshard import reshard
+from app.backend.write_queue import write_queue
+
+# все модели должны быть импортированы, чтобы SQLAlchemy настроил связи между ними
+from app.models.game import Game
+from app.models.user import User
+from app.models.user_game_rating import UserGameRating
+from app.models.user_game_feedback import UserGameFeedback
+from app.models.game_rating_stats import GameRatingStats
+from app.models.game_similarity import GameSimilarity
+from app.models.game_leaderboard import GameLeaderboard
+from app.models.data_version import DataVersion
+
+
+def cmd_rebuild_rating_stats(args):
+    games = 0
+    with engine.begin() as connection:
+        # при шардировании агрегаты игр лежат в шардах вместе с их оценками
+        for shard in all_shards():
+            with on_shard_connection(connection, shard) as shard_connection:
+                games += rebuild_rating_stats(shard_connection)
+    print(f'game_rating_stats rebuilt: {games} games')
+
+
+def cmd_rebuild_search_index(args):
+    with engine.begin() as connection:
+        rebuild_search_index(connection)
+    print('search index rebuilt')
+
+
+def cmd_build_similar_games(args):
+    pairs = refresh_similarity(engine, args.top_k, force=True)
+    if pairs is None:
+        sys.exit('game_similarity not rebuilt: ratings kept changing, try again')
+    print(f'game_similarity rebuilt: {pairs} pairs')
+
+
+def cmd_rebuild_leaderboard(args):
+    with engine.begin() as connection:
+        games = rebuild_leaderboard(connection)
+    print(f'game_leaderboard rebuilt: {games} games')
+
+
+def cmd_purge(args):
+    model = {'game': Game, 'user': User}[args.kind]
+
+    async def run():
+        try:
+            return await purge(model, args.id, args.chunk, args.pause)
+        finally:
+            # иначе потоки соединений aiosqlite не дают процессу завершиться
+            await async_engine.dispose()
+
+    deleted = asyncio.run(run())
+    print(f'{args.kind} {args.id} purged: {deleted} child rows')
+
+
+def cmd_check_query_plans(args):
+    with engine.connect() as connection:
+        failures = check_query_plans(connection)
+    for name in HOT_QUERIES:
+        print(f"{'FULL SCAN' if name in failures else 'ok':<10} {name}")
+        for detail in failures.get(name, []):
+            print(f'{"":<10}   {detail}')
+    if failures:
+        sys.exit(1)
+
+
+# Набор данных временной базы проверок: оценки и отзывы ко всем играм есть только у первых CHECK_RATED
+# пользователей, у остальных все игры свободны
+CHECK_USERS = 4
+CHECK_GAMES = 4
+CHECK_RATED = 2
+
+
+def _seed_check_database(bind):
+    from sqlalchemy.orm import Session
+    from app.backend.passwords import hash_password
+
+    with Session(bind) as db, db.begin():
+        db.add_all([User(username=f'check_user_{n}', firstname=f'Check{n}', lastname='User',
+                         password=hash_password(f'check password {n}'), slug=f'check-user-{n}')
+                    for n in range(1, CHECK_USERS + 1)])
+        db.add_all([Game(title=f'Check game {n}', description=f'Game for manage.py checks {n}', rating=5 + n,
+                         price=100.0 * n, feedback=f'Critics on check game {n}', slug=f'check-game-{n}')
+                    for n in range(1, CHECK_GAMES + 1)])
+        db.flush()
+        pairs = [(user_id, game_id) for user_id in range(1, CHECK_RATED + 1) for game_id in range(1, CHECK_GAMES + 1)]
+        db.add_all([UserGameRating(user_id=user_id, game_id=game_id, rating_int=(user_id * game_id) % 11)
+                    for user_id, game_id in pairs])
+        db.add_all([UserGameFeedback(user_id=user_id, game_id=game_id, feedback_text=f'check feedback {user_id}-{game_id}')
+                    for user_id, game_id in pairs])
+    refresh_similarity(bind, force=True)
+
+
+@contextlib.contextmanager
+def check_database(shards=SHARDS):
+    '''
+    :param shards: int - раскладка базы (по умолчанию как у приложения, SHARDS)
+    :return: str - путь к временной базе: схема по миграциям alembic, CHECK_USERS пользователей, CHECK_GAMES игр,
+    оценки и отзывы первых CHECK_RATED пользователей, соседи игр.
+    В репозитории нет тестов, их роль играют команды check-*: все они, кроме check-query-plans (только читает
+    планы рабочей базы), работают с такой базой. Рабочая база не открывается и не копируется
+    '''
+    from alembic import command
+    from alembic.config import Config
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, os.path.basename(DB_PATH))
+        # Config без файла: alembic.ini настроил бы логирование всего процесса
+        config = Config()
+        config.set_main_option('script_location', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                               'app', 'migrations'))
+        config.set_main_option('sqlalchemy.url', f'sqlite:///{path}')
+        command.upgrade(config, 'head')
+        bind = make_engine(path, shards=0)
+        try:
+            _seed_check_database(bind)
+        finally:
+            bind.dispose()
+        if shards:
+            reshard(shards, 0, path)
+        yield path
+
+
+def stats_mismatches(connection):
+    '''
+    :param connection: Connection (синхронное)
+    :return: list[int] - игры, у которых count/total в game_rating_stats расходятся с user_game_ratings
+    '''
+    rating = UserGameRating.rating_int
+    actual = {row.game_id: (row.count, row.total) for row in connection.execute(
+        select(UserGameRating.game_id, func.count().label('count'), func.sum(rating).label('total'))
+        .where(UserGameRating.game_id.is_not(None), rating.is_not(None))
+        .group_by(UserGameRating.game_id))}
+    stored = {row.game_id: (row.count, row.total) for row in connection.execute(
+        select(GameRatingStats.game_id, GameRatingStats.count, GameRatingStats.total)
+        .where(GameRatingStats.count > 0))}
+    return sorted(game_id for game_id in actual.keys() | stored.keys() if actual.get(game_id) != stored.get(game_id))
+
+
+# Запросы, которыми проверяются бюджеты SQL-выражений: (метод, маршрут из STATEMENT_BUDGETS, URL, данные формы)
+BUDGET_REQUESTS = [
+    ('GET', '/list_game', '/list_game', None),
+    ('GET', '/list_user', '/list_user', None),
+    ('GET', '/top_game', '/top_game', None),
+    ('GET', '/list_game/{game_id}', '/list_game/1', None),
+    ('GET', '/list_user/{user_id}', '/list_user/1', None),
+    ('POST', '/rating_finish', '/rating_finish', {'rating_int': 7, 'game_id': 1}),
+    ('POST', '/feedback_finish', '/feedback_finish', {'feedback_text': 'budget check', 'game_id': 1}),
+    ('GET', '/game/game_id', '/game/game_id?game_id=1', None),
+    ('GET', '/user/user_id', '/user/user_id?user_id=1', None),
+    ('GET', '/rating/rating_id', '/rating/rating_id?rating_id=1', None),
+    ('GET', '/feedback/feedback_id', '/feedback/feedback_id?feedback_id=1', None),
+    ('GET', '/game/batch', '/game/batch?ids=1,2,3,1', None),
+    ('GET', '/game/game_id/full', '/game/game_id/full?game_id=1', None),
+    ('GET', '/user/user_id/full', '/user/user_id/full?user_id=1', None),
+    ('GET', '/user/batch', '/user/batch?ids=1,2,3', None),
+    ('GET', '/game/game_id/rating', '/game/game_id/rating?game_id=1', None),
+    ('GET', '/game/game_id/rating_stats', '/game/game_id/rating_stats?game_id=1', None),
+    ('GET', '/game/game_id/similar', '/game/game_id/similar?game_id=1', None),
+    ('GET', '/game/top', '/game/top', None),
+    ('GET', '/user/user_id/recommended', '/user/user_id/recommended?user_id=1', None),
+    ('GET', '/search', '/search?q=game', None),
+]
+
+
+def cmd_check_statement_budgets(args):
+    from fastapi.testclient import TestClient
+    from app.backend.page_cache import page_cache
+    from app.backend.entity_cache import entity_cache, NullBackend
+    import main as web
+
+    from sqlalchemy.orm import Session
+
+    with check_database() as path:
+        AsyncSessionLocal.configure(bind=make_async_engine(path))
+        bind = make_engine(path)
+        try:
+            with Session(bind) as db:
+                user = db.get(User, 1)
+                db.expunge(user)
+        finally:
+            bind.dispose()
+        client = TestClient(web.app, cookies={SESSION_COOKIE: issue_session(user)})
+        # бюджет задаётся для промаха кэша записей, а общий Redis-кэш мог бы отдать их и без базы
+        entity_cache.backend = NullBackend()
+
+        failed = False
+        for method, route, url, form in BUDGET_REQUESTS:
+            page_cache.clear()  # из кэша страница отдаётся без обращений к базе
+            response = client.request(method, url, data=form)
+            statements, duration = parse_server_timing(response.headers['Server-Timing'])
+            budget = STATEMENT_BUDGETS.get(route, DEFAULT_BUDGET)
+            ok = response.status_code < 400 and statements <= budget
+            failed = failed or not ok
+            print(f"{'ok' if ok else 'FAIL':<6} {method:<5} {url:<45} {statements:>3}/{budget:<3} "
+                  f"{duration:8.2f} ms  HTTP {response.status_code}")
+    if failed:
+        sys.exit(1)
+
+
+def cmd_reshard(args):
+    report = reshard(args.to, args.source)
+    for table, counts in report.items():
+        print(f"{table:<20} {' '.join(f'{count:>8}' for count in counts)}")
+    print(f'resharded: {args.source} -> {args.to} shards, start the application with SHARDS={args.to}')
+
+
+IMPORT_CHECK_ROWS = 7
+
+
+def _check_import_layout(path, shards, chunk_size):
+    '''
+    :param path: str - база проверок (check_database) с shards файлами шардов
+    :return: list[str] - найденные расхождения
+    Функция импортирует оценки и отзывы для IMPORT_CHECK_ROWS пар пользователь-игра пачками по chunk_size
+    строк и сверяет записанное с файлом, а агрегаты - с оценками
+    '''
+    bind = make_engine(path, shards=shards)
+    problems = []
+    try:
+        with bind.connect() as connection:
+            users = connection.scalars(select(User.id).order_by(User.id)).all()
+            games = connection.scalars(select(Game.id).order_by(Game.id)).all()
+        pairs = [(user_id, game_id) for user_id in users for game_id in games][:IMPORT_CHECK_ROWS]
+        files = {
+            'ratings': (UserGameRating.rating_int,
+                        [{'user_id': user_id, 'game_id': game_id, 'rating_int': (user_id + game_id) % 11}
+                         for user_id, game_id in pairs]),
+            'feedback': (UserGameFeedback.feedback_text,
+                         [{'user_id': user_id, 'game_id': game_id, 'feedback_text': f'import check {user_id}-{game_id}'}
+                          for user_id, game_id in pairs]),
+        }
+        for kind, (column, rows) in files.items():
+            stream = io.StringIO(''.join(json.dumps(row) + '\n' for row in rows))
+            report = import_rows(kind, stream, 'ndjson', chunk_size, bind=bind, shards=shards)
+            if report['written'] != len(rows) or report['error_count']:
+                problems.append(f"{kind}: {report['written']}/{len(rows)} rows written, errors: {report['errors'][:3]}")
+            model = column.class_
+            with bind.connect() as connection:
+                stored = {(row.user_id, row.game_id): row.value for row in connection.execute(
+                    select(model.user_id, model.game_id, column.label('value')))}
+            wrong = [row for row in rows if stored.get((row['user_id'], row['game_id'])) != row[column.key]]
+            if wrong:
+                problems.append(f'{kind}: {len(wrong)} imported rows not stored, first {wrong[0]}')
+        with bind.connect() as connection:
+            games = stats_mismatches(connection)
+        if games:
+            problems.append(f'game_rating_stats out of sync for games {games}')
+    finally:
+        bind.dispose()
+    return problems
+
+
+# Файлы с ошибочными строками: (вид, формат, содержимое, сколько строк записывается, номера ошибочных строк)
+MALFORMED_IMPORTS = [
+    ('ratings', 'ndjson', b'{"user_id": 3, "game_id": 1, "rating_int": 4}\n'
+                          b'{"user_id": 3, "game_id": 2, "rating_int": \xff}\n'
+                          b'{"user_id": 3, "game_id": 3, "rating_int": 6}\n', 2, [2]),
+    ('feedback', 'csv', b'\xef\xbb\xbfuser_id,game_id,feedback_text\r\n3,1,ok\r\n'
+                        b'3,2,"' + b'x' * 200000 + b'"\r\n3,3,\xd0\r\n3,4,"two\r\nlines"\r\n', 2, [3, 4]),
+]
+
+
+def _check_malformed_import(path, shards):
+    '''
+    :return: list[str] - расхождения отчёта import_rows с ожидаемым для MALFORMED_IMPORTS
+    Строки не в UTF-8 и ошибки разбора CSV должны попасть в отчёт, не прерывая загрузку остальных строк
+    '''
+    bind = make_engine(path, shards=shards)
+    problems = []
+    try:
+        for kind, fmt, data, written, lines in MALFORMED_IMPORTS:
+            report = import_rows(kind, io.BytesIO(data), fmt, bind=bind, shards=shards)
+            if report['written'] != written or [error['line'] for error in report['errors']] != lines:
+                problems.append(f'{kind} {fmt}: expected {written} written and errors on lines {lines}, got {report}')
+    finally:
+        bind.dispose()
+    return problems
+
+
+def cmd_check_import(args):
+    # файл пишется несколькими пачками (транзакциями) - в текущей раскладке базы и, на той же базе
+    # после перешардирования, в другой: без шардов база делится на 2 шарда, с шардами - собирается обратно
+    failed = False
+    with check_database() as path:
+        for shards in (SHARDS, 0 if SHARDS else 2):
+            if shards != SHARDS:
+                reshard(shards, SHARDS, path)
+            problems = _check_import_layout(path, shards, args.chunk_size)
+            failed = failed or bool(problems)
+            print(f"{'FAIL' if problems else 'ok':<6} import of {IMPORT_CHECK_ROWS} rows in chunks of "
+                  f"{args.chunk_size}, SHARDS={shards}")
+            for problem in problems:
+                print(f'{"":<6} {problem}')
+        problems = _check_malformed_import(path, shards)
+        failed = failed or bool(problems)
+        print(f"{'FAIL' if problems else 'ok':<6} undecodable and malformed lines are reported, SHARDS={shards}")
+        for problem in problems:
+            print(f'{"":<6} {problem[:300]}')
+    if failed:
+        sys.exit(1)
+
+
+def _free_pair(connection):
+    # пользователь и две игры, к которым он ещё не оставлял ни оценок, ни отзывов
+    games = connection.scalars(select(Game.id).order_by(Game.id)).all()
+    for user_id in connection.scalars(select(User.id).order_by(User.id)):
+        used = set(connection.scalars(select(UserGameRating.game_id).where(UserGameRating.user_id == user_id).union(
+            select(UserGameFeedback.game_id).where(UserGameFeedback.user_id == user_id))))
+        free = [game_id for game_id in games if game_id not in used]
+        if len(free) >= 2:
+            return user_id, free[:2]
+    return None, []
+
+
+@contextlib.asynccontextmanager
+async def app_client(path, user):
+    '''
+    :param path: str - база проверок (check_database), с которой работает приложение
+    :param user: User - владелец cookie сессии
+    :return: httpx.AsyncClient к приложению в том же event loop (нужен для одновременных запросов).
+    Очередь записи запускается, если WRITE_QUEUE=1. Ошибка обработчика становится ответом 500, а не исключением:
+    остальные запросы доходят до конца
+    '''
+    import httpx
+    import main as web
+
+    bind = make_async_engine(path)
+    AsyncSessionLocal.configure(bind=bind)
+    # массовый импорт пишет синхронным движком SessionLocal
+    sync_bind = make_engine(path)
+    SessionLocal.configure(bind=sync_bind)
+    if WRITE_QUEUE:
+        write_queue.start()
+    try:
+        transport = httpx.ASGITransport(app=web.app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url='http://check',
+                                     cookies={SESSION_COOKIE: issue_session(user)}) as client:
+            yield client
+    finally:
+        if write_queue.running:
+            await write_queue.stop()
+        await bind.dispose()
+        sync_bind.dispose()
+
+
+def _check_user(bind):
+    '''
+    :return: (User, [game_id, game_id]) - пользователь без оценок и отзывов к двум играм (отсоединён от сессии)
+    '''
+    from sqlalchemy.orm import Session
+
+    with Session(bind) as db:
+        user_id, games = _free_pair(db.connection())
+        if user_id is None:
+            sys.exit('no user without ratings for two games')
+        user = db.get(User, user_id)
+        db.expunge(user)
+    return user, games
+
+
+async def _fire_upserts(path, user, create_game, finish_game, count):
+    '''
+    :return: dict[str, list[int]] - HTTP-статусы count одновременных запросов к каждому маршруту записи
+    Запросы к одному маршруту отправляются разом (asyncio.gather) для одного и того же пользователя и игры
+    '''
+    requests = {
+        '/rating/create': lambda i: {'params': {'user_id': user.id, 'game_id': create_game},
+                                     'json': {'user_id': user.id, 'game_id': create_game, 'rating_int': i % 11}},
+        '/feedback/create': lambda i: {'params': {'user_id': user.id, 'game_id': create_game},
+                                       'json': {'user_id': user.id, 'game_id': create_game, 'feedback_text': f'check {i}'}},
+        '/rating_finish': lambda i: {'data': {'rating_int': i % 11, 'game_id': finish_game}},
+        '/feedback_finish': lambda i: {'data': {'feedback_text': f'check {i}', 'game_id': finish_game}},
+    }
+    statuses = {}
+    async with app_client(path, user) as client:
+        for url, request in requests.items():
+            responses = await asyncio.gather(*[client.post(url, **request(i)) for i in range(count)])
+            statuses[url] = [response.status_code for response in responses]
+    return statuses
+
+
+def cmd_check_upserts(args):
+    # одновременные повторные оценки и отзывы одного пользователя к одной игре
+    # должны оставить ровно одну строку, а агрегаты game_rating_stats - совпасть с оценками
+    with check_database() as path:
+        bind = make_engine(path)
+        try:
+            user, (create_game, finish_game) = _check_user(bind)
+            user_id = user.id
+            statuses = asyncio.run(_fire_upserts(path, user, create_game, finish_game, args.requests))
+            with bind.connect() as connection:
+                rows = {url: connection.scalar(select(func.count()).select_from(model)
+                                               .where(model.user_id == user_id, model.game_id == game_id))
+                        for url, model, game_id in (('/rating/create', UserGameRating, create_game),
+                                                    ('/feedback/create', UserGameFeedback, create_game),
+                                                    ('/rating_finish', UserGameRating, finish_game),
+                                                    ('/feedback_finish', UserGameFeedback, finish_game))}
+                mismatches = stats_mismatches(connection)
+        finally:
+            bind.dispose()
+
+    failed = False
+    for url, codes in statuses.items():
+        # create отвечает 400 всем, кроме первого успевшего; finish перезаписывает и всегда отвечает 200
+        expected = [200] + [400] * (len(codes) - 1) if url.endswith('/create') else [200] * len(codes)
+        ok = sorted(codes) == expected and rows[url] == 1
+        failed = failed or not ok
+        print(f"{'ok' if ok else 'FAIL':<6} {args.requests} x POST {url:<18} rows={rows[url]}  "
+              f"HTTP {' '.join(f'{code}x{codes.count(code)}' for code in sorted(set(codes)))}")
+    print(f"{'FAIL' if mismatches else 'ok':<6} game_rating_stats matches user_game_ratings"
+          + (f' (games {mismatches})' if mismatches else ''))
+    if failed or mismatches:
+        sys.exit(1)
+
+
+ENTITY_CHECK_TTL = 1
+
+
+async def _check_redis_entity_cache(path, user, game_id):
+    '''
+    :return: list[tuple[str, bool]] - проверки RedisBackend (на fakeredis) через маршруты приложения
+    '''
+    import fakeredis
+    from app.backend.entity_cache import entity_cache, RedisBackend
+
+    redis = fakeredis.FakeAsyncRedis()
+    backend = RedisBackend(client=redis, ttl=ENTITY_CHECK_TTL)
+    entity_cache.backend = backend
+    results = []
+
+    async with app_client(path, user) as client:
+        async def get(kind, id_):
+            response = await client.get(f'/{kind}/{kind}_id', params={f'{kind}_id': id_})
+            statements, _ = parse_server_timing(response.headers['Server-Timing'])
+            return response.json(), statements
+
+        for kind, model, field, values in (('rating', UserGameRating, 'rating_int', (3, 8, 5, 1)),
+                                           ('feedback', UserGameFeedback, 'feedback_text', ('one', 'two', 'three', 'four'))):
+            key = lambda id_: f'{backend.prefix}:{model.__tablename__}:{id_}'
+            await client.post(f'/{kind}_finish', data={field: values[0], 'game_id': game_id})
+            rows = (await client.get(f'/user/user_id/{kind}', params={'user_id': user.id})).json()
+            id_ = next(row['id'] for row in rows if row['game_id'] == game_id)
+
+            body, statements = await get(kind, id_)
+            results.append((f'{kind}: miss reads the database and sets the key',
+                            statements > 0 and body[field] == values[0] and await redis.exists(key(id_))))
+            ttl = await redis.ttl(key(id_))
+            results.append((f'{kind}: key is set with TTL {ENTITY_CHECK_TTL} s', 0 < ttl <= ENTITY_CHECK_TTL))
+            body, statements = await get(kind, id_)
+            results.append((f'{kind}: hit is served without SQL', statements == 0 and body[field] == values[0]))
+
+            await client.post(f'/{kind}_finish', data={field: values[1], 'game_id': game_id})
+            body, _ = await get(kind, id_)
+            results.append((f'{kind}: /{kind}_finish invalidates', body[field] == values[1]))
+            await client.put(f'/{kind}/update', params={f'{kind}_id': id_}, json={field: values[2]})
+            body, _ = await get(kind, id_)
+            results.append((f'{kind}: /{kind}/update invalidates', body[field] == values[2]))
+            upload = json.dumps({'user_id': user.id, 'game_id': game_id, field: values[3]}) + '\n'
+            await client.post(f'/{kind}/bulk', files={'file': ('check.ndjson', upload)})
+            body, _ = await get(kind, id_)
+            results.append((f'{kind}: /{kind}/bulk clears the namespace', body[field] == values[3]))
+            await client.delete(f'/{kind}/delete', params={f'{kind}_id': id_})
+            body, _ = await get(kind, id_)
+            results.append((f'{kind}: /{kind}/delete invalidates', body is None and not await redis.exists(key(id_))))
+
+        await get('game', game_id)
+        await asyncio.sleep(ENTITY_CHECK_TTL + 0.5)
+        results.append(('game: key expires after TTL', not await redis.exists(f'{backend.prefix}:games:{game_id}')))
+
+        # недоступный Redis: запросы идут в базу (предупреждения кэша здесь ожидаемы и не выводятся)
+        server = fakeredis.FakeServer()
+        server.connected = False
+        entity_cache.backend = RedisBackend(client=fakeredis.FakeAsyncRedis(server=server))
+        logger = logging.getLogger('app.backend.entity_cache')
+        level = logger.level
+        logger.setLevel(logging.ERROR)
+        try:
+            response = await client.get('/game/game_id', params={'game_id': game_id})
+        finally:
+            logger.setLevel(level)
+        results.append(('unavailable Redis: request is served from the database',
+                        response.status_code == 200 and response.json()['id'] == game_id))
+    return results
+
+
+def cmd_check_entity_cache(args):
+    # RedisBackend проверяется на fakeredis (без сервера)
+    with check_database() as path:
+        bind = make_engine(path)
+        try:
+            user, (game_id, _) = _check_user(bind)
+        finally:
+            bind.dispose()
+        results = asyncio.run(_check_redis_entity_cache(path, user, game_id))
+    for name, ok in results:
+        print(f"{'ok' if ok else 'FAIL':<6} {name}")
+    if not all(ok for _, ok in results):
+        sys.exit(1)
+
+
+# Маршруты, которые отдают строки без response_model (потоки NDJSON и выгрузки): (URL, модель)
+STREAM_CHECKS = [
+    ('/user/all_users?stream=true', User),
+    ('/game/all_games?stream=true', Game),
+    ('/rating/all_rating?stream=true', UserGameRating),
+    ('/feedback/all_feedback?stream=true', UserGameFeedback),
+    ('/rating/export?format=ndjson', UserGameRating),
+    ('/rating/export?format=csv', UserGameRating),
+    ('/feedback/export?format=ndjson', UserGameFeedback),
+    ('/feedback/export?format=csv', UserGameFeedback),
+]
+
+
+def cmd_check_stream_columns(args):
+    # строки потоков должны содержать ровно поля схемы ответа: хэш пароля users туда не попадает
+    import csv
+    from fastapi.testclient import TestClient
+    from app.backend.columns import READ_SCHEMAS
+    import main as web
+
+    failed = False
+    with check_database() as path:
+        bind = make_async_engine(path)
+        AsyncSessionLocal.configure(bind=bind)
+        client = TestClient(web.app)
+        for url, model in STREAM_CHECKS:
+            response = client.get(url)
+            lines = response.text.splitlines()
+            if 'format=csv' in url:
+                header = next(csv.reader(lines[:1]), [])
+                keys = [header] if len(lines) > 1 else []
+            else:
+                keys = [list(json.loads(line)) for line in lines]
+            expected = list(READ_SCHEMAS[model].model_fields)
+            ok = response.status_code == 200 and bool(keys) and all(row == expected for row in keys)
+            failed = failed or not ok
+            print(f"{'ok' if ok else 'FAIL':<6} GET {url:<38} {len(lines):>3} lines  "
+                  f"{'password leaked' if any('password' in row for row in keys) else ', '.join(keys[0] if keys else [])}")
+        asyncio.run(bind.dispose())
+    if failed:
+        sys.exit(1)
+
+
+def cmd_import(args):
+    fmt = args.format or ('csv' if args.file.lower().endswith('.csv') else 'ndjson')
+    with open(args.file, 'rb') as stream:
+        report = import_rows(args.kind, stream, fmt, args.chunk_size)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if report['error_count']:
+        sys.exit(1)
+
+
+def cmd_build_images(args):
+    manifest = build_variants()
+    for source, entry in manifest.items():
+        smallest = min(variant['bytes'] for variant in entry['variants'])
+        largest = max(variant['bytes'] for variant in entry['variants'] if variant['format'] != 'jpeg')
+        print(f"{source:<24} {entry['bytes']:>9} B -> {smallest:>7}..{largest:>7} B "
+              f"({len(entry['variants'])} variants)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Служебные команды приложения')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('rebuild-rating-stats', help='пересчитать агрегаты оценок игр с нуля')
+    command.set_defaults(handler=cmd_rebuild_rating_stats)
+
+    command = commands.add_parser('rebuild-search-index', help='заново построить полнотекстовый индекс поиска')
+    command.set_defaults(handler=cmd_rebuild_search_index)
+
+    command = commands.add_parser('build-similar-games', help='пересчитать похожие игры по матрице оценок')
+    command.add_argument('--top-k', type=int, default=SIMILAR_TOP_K)
+    command.set_defaults(handler=cmd_build_similar_games)
+
+    command = commands.add_parser('rebuild-leaderboard', help='пересчитать рейтинг игр (байесовское среднее) с нуля')
+    command.set_defaults(handler=cmd_rebuild_leaderboard)
+
+    command = commands.add_parser('check-query-plans',
+                                  help='проверить, что горячие запросы не делают полный проход таблиц')
+    command.set_defaults(handler=cmd_check_query_plans)
+
+    command = commands.add_parser('check-statement-budgets',
+                                  help='проверить, что обработчики укладываются в бюджет SQL-выражений')
+    command.set_defaults(handler=cmd_check_statement_budgets)
+
+    command = commands.add_parser('check-import',
+                                  help='проверить импорт оценок и отзывов в несколько пачек (с шардами и без)')
+    command.add_argument('--chunk-size', type=int, default=2)
+    command.set_defaults(handler=cmd_check_import)
+
+    command = commands.add_parser('check-upserts',
+                                  help='проверить, что одновременные повторные оценки и отзывы оставляют одну строку')
+    command.add_argument('--requests', type=int, default=20)
+    command.set_defaults(handler=cmd_check_upserts)
+
+    command = commands.add_parser('check-entity-cache',
+                                  help='проверить Redis-бэкенд кэша записей на fakeredis: TTL и инвалидацию при записи')
+    command.set_defaults(handler=cmd_check_entity_cache)
+
+    command = commands.add_parser('check-stream-columns',
+                                  help='проверить, что потоки и выгрузки отдают только поля схем ответа (без пароля)')
+    command.set_defaults(handler=cmd_check_stream_columns)
+
+    command = commands.add_parser('purge', help='удалить игру или пользователя, снимая оценки и отзывы порциями')
+    command.add_argument('kind', choices=['game', 'user'])
+    command.add_argument('id', type=int)
+    command.add_argument('--chunk', type=int, default=PURGE_CHUNK)
+    command.add_argument('--pause', type=float, default=PURGE_PAUSE)
+    command.set_defaults(handler=cmd_purge)
+
+    command = commands.add_parser('reshard', help='перераспределить оценки и отзывы по N файлам-шардам '
+                                                  '(приложение должно быть остановлено)')
+    command.add_argument('--to', type=int, required=True, help='новое число шардов, 0 - всё в основной базе')
+    command.add_argument('--from', dest='source', type=int, default=SHARDS, help='текущее число шардов, по умолчанию SHARDS')
+    command.set_defaults(handler=cmd_reshard)
+
+    command = commands.add_parser('import', help='массовая загрузка игр, оценок или отзывов из NDJSON/CSV')
+    command.add_argument('kind', choices=list(IMPORTERS))
+    command.add_argument('file')
+    command.add_argument('--format', choices=FORMATS, help='по умолчанию определяется по расширению файла')
+    command.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    command.set_defaults(handler=cmd_import)
+
+    command = commands.add_parser('build-images',
+                                  help='построить уменьшенные WebP/AVIF/JPEG варианты картинок из photo/')
+    command.set_defaults(handler=cmd_build_images)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()